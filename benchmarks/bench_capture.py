@@ -0,0 +1,238 @@
+'''
+Offline benchmark of complete capture cycles (capture_all) against a local stand-in for the camera web server.
+
+Usage (from the repository root):
+    python benchmarks/bench_capture.py [--cameras 10 100 1000] [--modes sequential concurrent async]
+                                       [--latency 0.05] [--jitter 0.02] [--image-size 150]
+                                       [--output results.json] [--compare baseline.json]
+
+The server serves the sample pages in benchmarks/pages (with the image and Google Earth links pointing
+back to the server) and a JPEG of a fixed size for every camera, after a delay of latency plus a random
+jitter. The random generator is seeded, so every run sees the same delays.
+
+Every scenario (number of cameras and mode) runs in a fresh Python process with its own image folder,
+so the peak memory use is that of the scenario only. For every scenario it reports:
+    wall        wall time of the capture cycle in seconds
+    cpu/camera  CPU time (user and system) per camera in milliseconds
+    peak rss    peak resident memory of the capture process in MB
+    written     bytes written to the image folder in MB
+With --output the results are saved as JSON, with the commit they were measured on; --compare prints
+the results next to those of a saved run, so parser and fetch changes can be judged on numbers.
+'''
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SRC_FOLDER = Path(__file__).parent.parent / 'src'
+PAGES_FOLDER = Path(__file__).parent / 'pages'
+MODES = ('sequential', 'concurrent', 'async')
+CONCURRENT_WORKERS = 8
+COORDINATES = '@-1.3192,36.8147,1650a,35y,0h,0t,0r'
+
+
+class CameraServer(ThreadingHTTPServer):
+    """Local stand-in for the camera web server, with a configurable latency and jitter per request."""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, image_size: int = 150 * 1024, seed: int = 1):
+        super().__init__(('127.0.0.1', 0), CameraRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.pages = [page.read_text(encoding='utf-8') for page in sorted(PAGES_FOLDER.glob('*.html'))]
+        self.image_size = image_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def delay(self) -> float:
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def page(self, camera: int) -> bytes:
+        """The sample page of the camera, with the links pointing to this server."""
+        html = self.pages[camera % len(self.pages)]
+        # the image is recognized by 'stream' or 'upload' in its URL
+        for folder in ('stream', 'upload'):
+            html = html.replace(f'https://webcams.aeroclubea.com/{folder}/', f'{self.base_url}/{folder}/{camera}/')
+        for link in ('https://earth.app.goo.gl/', 'https://earth.google.com/'):
+            html = html.replace(link, f'{self.base_url}/earth/{camera}/')
+        return html.encode('utf-8')
+
+    def image(self, camera: int) -> bytes:
+        """A JPEG sized image that differs for every camera."""
+        body = random.Random(camera).randbytes(self.image_size - 4)
+        return b'\xff\xd8' + body + b'\xff\xd9'
+
+
+class CameraRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, content_type: str, body: bytes, head: bool = False) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def _respond(self, head: bool) -> None:
+        time.sleep(self.server.delay())
+        parts = self.path.strip('/').split('/')
+        if len(parts) >= 2 and parts[1].isdigit():
+            kind, camera = parts[0], int(parts[1])
+            if kind == 'camera':
+                return self._send('text/html; charset=utf-8', self.server.page(camera), head)
+            if kind in ('stream', 'upload'):
+                return self._send('image/jpeg', self.server.image(camera), head)
+            if kind == 'earth':
+                # the expanded Google Earth link holds the coordinates
+                self.send_response(302)
+                self.send_header('Location', f'/maps/{camera}/{COORDINATES}')
+                self.send_header('Content-Length', '0')
+                return self.end_headers()
+            if kind == 'maps':
+                return self._send('text/html', b'', head)
+        self.send_error(404)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+
+def folder_size(folder: Path) -> int:
+    """Bytes of the files in the folder; hard links to the same file are counted once."""
+    seen = set()
+    total = 0
+    for path in folder.rglob('*'):
+        if path.is_file():
+            stat = path.stat()
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:     # Windows
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scenario(base_url: str, cameras: int, mode: str, folder: Path) -> dict:
+    """Capture the cameras once in this process and return the measurements."""
+    sys.path.insert(0, str(SRC_FOLDER))
+    from camera import config as config_module
+
+    config_module.CONFIG_FILE = folder / 'camera.config'   # leave the configuration of the user alone
+    from camera import http_client
+    from camera.camera_locations import CameraLocation
+    from camera.capture import capture_all
+
+    config = config_module.CameraConfig()
+    config.image_save_path = folder / 'images'
+    config.workers = 1 if mode == 'sequential' else CONCURRENT_WORKERS
+    config.per_host_limit = config.workers
+    config.metrics_file = ''
+    http_client.configure(config)
+    locations = [CameraLocation(f'{base_url}/camera/{n}', f'camera{n:04d}') for n in range(cameras)]
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    capture_all(locations, config, use_async=mode == 'async')
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    return {'cameras': cameras, 'mode': mode, 'wall': wall, 'cpu_per_camera': cpu / cameras * 1000,
+            'peak_rss': peak_rss_mb(), 'written': folder_size(config.image_save_path) / (1024 * 1024)}
+
+
+def run_in_subprocess(base_url: str, cameras: int, mode: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix='bench_capture_') as folder:
+        command = [sys.executable, __file__, '--scenario', base_url, str(cameras), mode, folder]
+        # the log file of the app is written in the working folder
+        process = subprocess.run(command, cwd=folder, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f'Scenario {cameras} {mode} failed:\n{process.stderr}')
+        return json.loads(process.stdout.splitlines()[-1])
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results: list[dict], baseline: list[dict] | None = None) -> None:
+    previous = {(r['cameras'], r['mode']): r for r in baseline or []}
+    header = (f"{'cameras':>7} {'mode':<11} {'wall (s)':>9} {'cpu/camera (ms)':>16} {'peak rss (MB)':>14} "
+              f"{'written (MB)':>13}")
+    print(header + ('  wall vs baseline' if baseline else ''))
+    for result in results:
+        line = (f"{result['cameras']:>7} {result['mode']:<11} {result['wall']:>9.2f} {result['cpu_per_camera']:>16.2f} "
+                f"{result['peak_rss']:>14.1f} {result['written']:>13.1f}")
+        old = previous.get((result['cameras'], result['mode']))
+        if old:
+            line += f"  {old['wall'] / result['wall']:>6.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark capture cycles against a local camera server")
+    parser.add_argument('--cameras', type=int, nargs='+', default=[10, 100, 1000], help='Numbers of cameras')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Capture modes')
+    parser.add_argument('--latency', type=float, default=0.05, help='Server delay per request in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Maximum random extra delay in seconds')
+    parser.add_argument('--image-size', type=int, default=150, help='Size of the camera images in kB')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random delays')
+    parser.add_argument('--output', type=Path, help='Save the results as JSON')
+    parser.add_argument('--compare', type=Path, help='Compare with the results saved by an earlier run')
+    parser.add_argument('--scenario', nargs=4, metavar=('URL', 'CAMERAS', 'MODE', 'FOLDER'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        base_url, cameras, mode, folder = args.scenario
+        print(json.dumps(run_scenario(base_url, int(cameras), mode, Path(folder))))
+        return
+
+    server = CameraServer(args.latency, args.jitter, args.image_size * 1024, args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        results = [run_in_subprocess(server.base_url, cameras, mode)
+                   for cameras in args.cameras for mode in args.modes]
+    finally:
+        server.shutdown()
+
+    baseline = json.loads(args.compare.read_text())['results'] if args.compare else None
+    print_results(results, baseline)
+    if args.output:
+        settings = {key: getattr(args, key) for key in ('latency', 'jitter', 'image_size', 'seed')}
+        args.output.write_text(json.dumps({'commit': current_commit(), 'python': platform.python_version(),
+                                           'platform': platform.platform(), 'cpus': os.cpu_count(),
+                                           'settings': settings, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Benchmark of the page encoding determination on the saved sample pages in benchmarks/pages.
+
+Usage (from the repository root):
+    python benchmarks/bench_encoding.py [--repeat N]
+
+Compares the CPU time per page of character set detection (response.apparent_encoding,
+which was used for every page) with resolve_encoding, which uses the headers, the <meta> declaration
+or the encoding cached for the host. Pages are served with and without a charset in the Content-Type header.
+'''
+
+import argparse
+from pathlib import Path
+import sys
+from time import process_time
+import timeit
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from camera.page_encoding import resolve_encoding  # noqa: E402
+
+PAGES_FOLDER = Path(__file__).parent / 'pages'
+
+
+def make_response(content: bytes, content_type: str) -> Response:
+    response = Response()
+    response._content = content
+    response.status_code = 200
+    response.url = 'https://webcams.aeroclubea.com/Nairobi/page.html'
+    response.headers = CaseInsensitiveDict({'Content-Type': content_type})
+    return response
+
+
+def time_per_call(func, repeat: int) -> float:
+    """Return the best CPU time per call in microseconds."""
+    timer = timeit.Timer(func, timer=process_time)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the page encoding determination")
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    print(f"{'page':<22} {'header':<26} {'detect (us)':>12} {'resolve (us)':>13} {'saved (us)':>11}")
+    for page in sorted(PAGES_FOLDER.glob('*.html')):
+        content = page.read_bytes()
+        for content_type in ('text/html', 'text/html; charset=utf-8'):
+            response = make_response(content, content_type)
+            detect = time_per_call(lambda: response.apparent_encoding, args.repeat)
+            resolve = time_per_call(lambda: resolve_encoding(response), args.repeat)
+            print(f"{page.stem:<22} {content_type:<26} {detect:>12.1f} {resolve:>13.1f} {detect - resolve:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
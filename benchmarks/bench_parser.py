@@ -0,0 +1,53 @@
+'''
+Microbenchmark of the page extraction backends on the saved sample pages in benchmarks/pages.
+
+Usage (from the repository root):
+    python benchmarks/bench_parser.py [--repeat N]
+
+For every page and backend it reports the time per page, once extracting all information
+(first capture of a camera) and once extracting only the image URL (metadata is cached).
+The results of all backends are checked against the BeautifulSoup backend.
+'''
+
+import argparse
+from pathlib import Path
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from camera import kenya_capture  # noqa: E402, F401 registers the bs4 backend
+from camera.kenya_page_parser import extract_page_info, lxml_available  # noqa: E402
+
+PAGES_FOLDER = Path(__file__).parent / 'pages'
+
+
+def bench_page(html: str, backend: str, metadata: bool, repeat: int) -> float:
+    """Return the best time per extraction in microseconds."""
+    timer = timeit.Timer(lambda: extract_page_info(html, backend, metadata))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the page extraction backends")
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    backends = ['bs4', 'stream'] + (['lxml'] if lxml_available() else [])
+    print(f"{'page':<22} {'backend':<8} {'all (us)':>10} {'image (us)':>11} {'speedup':>8}")
+    for page in sorted(PAGES_FOLDER.glob('*.html')):
+        html = page.read_text(encoding='utf-8')
+        reference = extract_page_info(html, 'bs4')
+        baseline = None
+        for backend in backends:
+            if extract_page_info(html, backend) != reference:
+                print(f"{page.name}: backend '{backend}' differs from bs4")
+            full = bench_page(html, backend, True, args.repeat)
+            image_only = bench_page(html, backend, False, args.repeat)
+            baseline = baseline or full
+            print(f"{page.stem:<22} {backend:<8} {full:>10.1f} {image_only:>11.1f} {baseline / full:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+'''
+Benchmark of the start up cost of the app: the time and memory to import the capture module.
+
+Usage (from the repository root):
+    python benchmarks/bench_startup.py [--repeat N] [--module camera.capture] [--top 10]
+
+Every import runs in a fresh Python process; the best and median wall time of the import are reported,
+with the peak resident memory of the process. For comparison the same is measured for an empty
+interpreter and for pandas, which the camera locations loader used to depend on.
+Next the best and median wall time of complete commands that do not capture are reported
+('python -m camera --help' and 'python -m camera config list'), with a temporary home folder.
+With --top the modules with the largest cumulative import time (from python -X importtime) are listed.
+'''
+
+import argparse
+import json
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_FOLDER = Path(__file__).parent.parent / 'src'
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+except ImportError:
+    peak = 0.0
+print(json.dumps({{'elapsed': elapsed, 'peak_rss': peak}}))
+'''
+
+
+COMMANDS = (['--help'], ['config', 'list'])
+
+
+def run_python(*arguments: str) -> subprocess.CompletedProcess:
+    # the app writes its log file in the working folder and its configuration in the home folder
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as folder:
+        env = {**os.environ, 'PYTHONPATH': str(SRC_FOLDER), 'HOME': folder, 'USERPROFILE': folder}
+        return subprocess.run([sys.executable, *arguments], cwd=folder, capture_output=True, text=True, env=env)
+
+
+def measure_import(module: str, repeat: int) -> tuple[list[float], float] | None:
+    """Import times in seconds and the peak memory in MB, or None when the module is not available."""
+    statement = f'import {module}' if module else 'pass'
+    times, peaks = [], []
+    for _ in range(repeat):
+        process = run_python('-c', MEASURE.format(statement=statement))
+        if process.returncode != 0:
+            return None
+        result = json.loads(process.stdout.splitlines()[-1])
+        times.append(result['elapsed'])
+        peaks.append(result['peak_rss'])
+    return times, max(peaks)
+
+
+def slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+    """The modules with the largest cumulative import time in microseconds."""
+    process = run_python('-X', 'importtime', '-c', f'import {module}')
+    imports = []
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def measure_command(arguments: list[str], repeat: int) -> list[float]:
+    """Wall times in seconds of the command, including the start of the interpreter."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_python('-m', 'camera', *arguments)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the app")
+    parser.add_argument('--repeat', type=int, default=10, help='Number of fresh processes per module')
+    parser.add_argument('--module', default='camera.capture', help='Module to import')
+    parser.add_argument('--top', type=int, default=0, help='List the modules that take the longest to import')
+    args = parser.parse_args()
+
+    print(f"{'import':<20} {'best (ms)':>10} {'median (ms)':>12} {'peak rss (MB)':>14}")
+    for label, module in (('(interpreter)', ''), (args.module, args.module), ('pandas', 'pandas')):
+        measured = measure_import(module, args.repeat)
+        if measured is None:
+            print(f"{label:<20} {'not available':>10}")
+            continue
+        times, peak = measured
+        print(f"{label:<20} {min(times) * 1000:>10.1f} {statistics.median(times) * 1000:>12.1f} {peak:>14.1f}")
+
+    print(f"\n{'command':<20} {'best (ms)':>10} {'median (ms)':>12}")
+    for arguments in COMMANDS:
+        times = measure_command(arguments, args.repeat)
+        print(f"{' '.join(arguments):<20} {min(times) * 1000:>10.1f} {statistics.median(times) * 1000:>12.1f}")
+
+    if args.top:
+        print(f"\n{'cumulative (ms)':>15}  module")
+        for cumulative, name in slowest_imports(args.module, args.top):
+            print(f"{cumulative / 1000:>15.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+Benchmark of the image validation on save.
+
+Usage (from the repository root):
+    python benchmarks/bench_validation.py [--size KB] [--repeat N]
+
+Compares the CPU time per image of inspect_image, which only reads the headers and the last bytes,
+with the content hash that is computed for every saved image anyway and, when Pillow is installed,
+with a full decode of the image. Without Pillow a generated JPEG header is used.
+'''
+
+import argparse
+import io
+from pathlib import Path
+import random
+import struct
+import sys
+from time import process_time
+import timeit
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from camera.dedup import image_digest  # noqa: E402
+from camera.image_validation import inspect_image  # noqa: E402
+
+
+def make_jpeg(size: int) -> bytes:
+    """A JPEG of about size bytes: a real image when Pillow is installed, otherwise only a valid header."""
+    try:
+        from PIL import Image
+    except ImportError:
+        sof = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, 1080, 1920, 1) + b'\x01\x11\x00'
+        body = random.Random(0).randbytes(size)
+        return b'\xff\xd8' + sof + b'\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00' + body + b'\xff\xd9'
+    side = 64
+    while True:
+        image = Image.frombytes('RGB', (side, side), random.Random(0).randbytes(side * side * 3))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=90)
+        if output.tell() >= size:
+            return output.getvalue()
+        side *= 2
+
+
+def time_per_call(func, repeat: int) -> float:
+    """Return the best CPU time per call in microseconds."""
+    timer = timeit.Timer(func, timer=process_time)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image validation")
+    parser.add_argument('--size', type=int, default=500, help='Size of the image in kB')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    data = make_jpeg(args.size * 1024)
+    info = inspect_image(data)
+    print(f"image: {len(data) // 1024} kB, {info.width}x{info.height}")
+    print(f"{'inspect_image':<16} {time_per_call(lambda: inspect_image(data), args.repeat):>10.1f} us")
+    print(f"{'content hash':<16} {time_per_call(lambda: image_digest(data), args.repeat):>10.1f} us")
+    try:
+        from PIL import Image
+    except ImportError:
+        print(f"{'full decode':<16} {'-':>10}    (Pillow is not installed)")
+        return
+
+    def decode():
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+    print(f"{'full decode':<16} {time_per_call(decode, args.repeat):>10.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,23 @@
 import logging
 
-logging.basicConfig(
-    filename='camera_capture.log',
-    filemode='a',
-    format='%(asctime)s %(levelname)-8s %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S')
-log = logging.getLogger(__name__)
-logFormatter = logging.Formatter(
-    "[%(levelname)s]  %(message)s")
-logFormatter.datefmt = "%Y-%m-%d %H:%M:%S"
-ch = logging.StreamHandler()
-ch.setFormatter(logFormatter)
-ch.setLevel(logging.INFO)
-log.addHandler(ch)
+LOG_FILE = 'camera_capture.log'
+
+
+def setup_logging(log_file: str = LOG_FILE) -> None:
+    """Log to the log file (in the current directory) and to the console.
+       Called by the entry point, so importing the package does not create the log file.
+    """
+    logging.basicConfig(
+        filename=log_file,
+        filemode='a',
+        format='%(asctime)s %(levelname)-8s %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S')
+    log = logging.getLogger(__name__)
+    logFormatter = logging.Formatter(
+        "[%(levelname)s]  %(message)s")
+    logFormatter.datefmt = "%Y-%m-%d %H:%M:%S"
+    ch = logging.StreamHandler()
+    ch.setFormatter(logFormatter)
+    ch.setLevel(logging.INFO)
+    log.addHandler(ch)
@@ -0,0 +1,248 @@
+'''
+archive.py
+This module packs the frames of completed days into one archive per station and day, as the many small
+files of the station/year/month/day folders make backups and rsync slow. The archive is an uncompressed
+tar file, <station>_<YYYYmmdd>.tar, in the folder of the day, with an index <station>_<YYYYmmdd>.json next
+to it: for every frame the position and size of its data in the archive and its content hash. With the
+index a single frame is read from the archive without unpacking it (see read_frame). Hard linked
+duplicate frames are stored once.
+The archive is first written to a temporary file and every frame in it is verified against the original
+file; only then the archive gets its final name and the original files are removed. Days that have an
+archive are skipped, so the packing can be run again at any time; original files that are left in the folder
+of an archived day (for instance after an interruption) are removed when they are in the archive.
+When ffmpeg is installed, a time-lapse video of the day can be made as well (an MP4 file next to the archive).
+The stations are packed in parallel; the days of a station one after the other.
+Classes:
+    ArchiveResult
+        The outcome of packing the frames of a station of a day.
+Functions:
+    archive_day(images_root, station, day, catalog, keep, timelapse) -> ArchiveResult
+    archive_station(images_root, station, before, catalog, keep, timelapse) -> list[ArchiveResult]
+    archive_all(images_root, stations, before, workers, catalog, keep, timelapse) -> list[ArchiveResult]
+    read_index(archive) -> dict[str, list]
+    read_frame(archive, name) -> bytes
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from camera.catalog import Catalog, file_digest
+from camera.dedup import new_image_hash
+from camera.image_writer import fsync_path
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.tar'
+INDEX_SUFFIX = '.json'
+TIMELAPSE_SUFFIX = '.mp4'
+TIMELAPSE_RATE = 10     # frames per second of the time-lapse video
+VIDEO_FRAME_SUFFIXES = ('.jpg', '.jpeg', '.png')
+
+
+@dataclass
+class ArchiveResult:
+    station: str
+    day: date
+    archive: Path | None = None
+    frames: int = 0             # frames in the archive
+    removed: int = 0            # original files removed
+    error: str | None = None
+
+
+def archive_path(images_root: Path, station: str, day: date) -> Path:
+    """The archive of the station of the day, in the folder of the day."""
+    folder = images_root / station / str(day.year) / str(day.month) / str(day.day)
+    return folder / f"{station}_{day:%Y%m%d}{ARCHIVE_SUFFIX}"
+
+
+def index_path(archive: Path) -> Path:
+    return archive.with_suffix(INDEX_SUFFIX)
+
+
+def read_index(archive: Path) -> dict[str, list]:
+    """The frames in the archive: name: [offset, size, content hash]."""
+    with open(index_path(archive), 'r', encoding='utf-8') as f:
+        return json.load(f)['frames']
+
+
+def read_frame(archive: Path, name: str) -> bytes:
+    """Read a single frame from the archive, using the index."""
+    offset, size, _ = read_index(archive)[name]
+    with open(archive, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _digest(f, size: int) -> str:
+    image_hash = new_image_hash()
+    while size > 0:
+        chunk = f.read(min(size, 64 * 1024))
+        if not chunk:
+            break
+        image_hash.update(chunk)
+        size -= len(chunk)
+    return image_hash.hexdigest()
+
+
+def _frame_names(folder: Path, archive: Path) -> list[str]:
+    """The files of the day folder to archive: not the hidden (temporary) files, the archive and its companions."""
+    own = {archive.name, index_path(archive).name, archive.with_suffix(TIMELAPSE_SUFFIX).name}
+    with os.scandir(folder) as entries:
+        return sorted(entry.name for entry in entries
+                      if not entry.name.startswith('.') and entry.name not in own
+                      and entry.is_file(follow_symlinks=False))
+
+
+def _pack(folder: Path, names: list[str], archive: Path) -> dict[str, list]:
+    """Write the files of the folder to the archive; return its index."""
+    with tarfile.open(archive, 'w', format=tarfile.PAX_FORMAT) as tar:
+        for name in names:
+            tar.add(folder / name, arcname=name, recursive=False)
+    with tarfile.open(archive, 'r') as tar:     # the positions of the data are known when reading
+        members = tar.getmembers()
+    index = {}
+    for member in members:
+        if member.islnk():      # a hard linked duplicate frame, the data is stored with the first name
+            index[member.name] = index[member.linkname][:2]
+        else:
+            index[member.name] = [member.offset_data, member.size]
+    with open(archive, 'rb') as f:
+        for name, entry in index.items():
+            f.seek(entry[0])
+            entry.append(_digest(f, entry[1]))
+    return index
+
+
+def make_timelapse(folder: Path, names: list[str], output: Path) -> bool:
+    """Make a time-lapse video of the frames with ffmpeg; return whether it succeeded."""
+    ffmpeg = shutil.which('ffmpeg')
+    frames = [name for name in names if name.lower().endswith(VIDEO_FRAME_SUFFIXES)]
+    if ffmpeg is None or not frames:
+        return False
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+        for name in frames:
+            f.write(f"file '{(folder / name).as_posix()}'\nduration {1 / TIMELAPSE_RATE}\n")
+        list_file = f.name
+    try:
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_file,
+                        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2', '-r', str(TIMELAPSE_RATE),
+                        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', str(output)],
+                       check=True, capture_output=True, timeout=600)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Unable to make the time-lapse {output}: {e}")
+        return False
+    finally:
+        os.remove(list_file)
+    return True
+
+
+def _remove_archived(folder: Path, names: list[str], index: dict[str, list], result: ArchiveResult,
+                     verify: bool = True) -> None:
+    """Remove the original files that are in the archive (with the same content, when verified)."""
+    for name in names:
+        entry = index.get(name)
+        if entry is None or verify and file_digest(folder / name) != entry[2]:
+            logger.warning(f"{folder / name} is not in the archive {result.archive}, it is kept")
+            continue
+        os.remove(folder / name)
+        result.removed += 1
+
+
+def archive_day(images_root: Path, station: str, day: date, catalog: Catalog | None = None, keep: bool = False,
+                timelapse: bool = False) -> ArchiveResult:
+    """Pack the frames of the station of the day into an archive and remove the original files."""
+    archive = archive_path(images_root, station, day)
+    folder = archive.parent
+    result = ArchiveResult(station, day, archive)
+    names = _frame_names(folder, archive)
+    if archive.exists():
+        if names and not keep:
+            _remove_archived(folder, names, read_index(archive), result)
+        return result
+    if not names:
+        result.archive = None
+        return result
+
+    temporary = folder / f".{archive.name}.part"
+    try:
+        index = _pack(folder, names, temporary)
+        for name in names:
+            if file_digest(folder / name) != index[name][2]:
+                raise OSError(f"{name} differs from the original file")
+        fsync_path(temporary)
+        if timelapse:
+            make_timelapse(folder, names, archive.with_suffix(TIMELAPSE_SUFFIX))
+        with open(index_path(archive), 'w', encoding='utf-8') as f:
+            json.dump({'station': station, 'day': day.isoformat(), 'frames': index}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, archive)
+        fsync_path(folder)
+    except (OSError, tarfile.TarError) as e:
+        logger.error(f"Unable to archive {folder}: {e}")
+        if temporary.exists():
+            os.remove(temporary)
+        return ArchiveResult(station, day, error=str(e))
+
+    result.frames = len(index)
+    logger.info(f"Archived {len(index)} frames of {station} of {day} in {archive}")
+    if catalog is not None:
+        relative = catalog.relative_path(archive)
+        catalog.move({catalog.relative_path(folder / name): f"{relative}#{name}" for name in names})
+    if not keep:
+        _remove_archived(folder, names, index, result, verify=False)     # verified above
+    return result
+
+
+def numbered_folders(folder: Path) -> list[int]:
+    """The numbers of the year, month or day folders in the folder, in order."""
+    try:
+        return sorted(int(name) for name in os.listdir(folder) if name.isdigit())
+    except OSError:
+        return []
+
+
+def station_days(images_root: Path, station: str) -> list[date]:
+    """The days with a folder of the station."""
+    station_folder = images_root / station
+    days = []
+    for year in numbered_folders(station_folder):
+        for month in numbered_folders(station_folder / str(year)):
+            for day in numbered_folders(station_folder / str(year) / str(month)):
+                days.append(date(year, month, day))
+    return days
+
+
+def archive_station(images_root: Path, station: str, before: date, catalog: Catalog | None = None,
+                    keep: bool = False, timelapse: bool = False) -> list[ArchiveResult]:
+    """Archive the days of the station before the given day, one after the other."""
+    return [archive_day(images_root, station, day, catalog, keep, timelapse)
+            for day in station_days(images_root, station) if day < before]
+
+
+def stations(images_root: Path) -> list[str]:
+    """The stations with a folder in the image folder; none when the image folder does not exist."""
+    try:
+        with os.scandir(images_root) as entries:
+            return sorted(entry.name for entry in entries
+                          if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'))
+    except FileNotFoundError:
+        logger.error(f"Image folder does not exist: {images_root}")
+        return []
+
+
+def archive_all(images_root: Path, station_names: list[str], before: date, workers: int = 1,
+                catalog: Catalog | None = None, keep: bool = False, timelapse: bool = False) -> list[ArchiveResult]:
+    """Archive the days before the given day of the stations, with a number of stations in parallel."""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='archive') as pool:
+        futures = [pool.submit(archive_station, images_root, station, before, catalog, keep, timelapse)
+                   for station in station_names]
+        return [result for future in futures for result in future.result()]
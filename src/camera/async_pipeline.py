@@ -0,0 +1,224 @@
+'''
+async_pipeline.py
+This module captures the cameras with an asyncio pipeline of stages connected by bounded queues:
+    pages   retrieve the camera pages (network)
+    parse   extract the image URL and metadata from the pages, in a separate executor (CPU)
+    images  download the camera images into temporary files in their folders (network)
+    save    save the images under their final names (disk)
+Every stage works on the next camera as soon as it handed the previous one to the next stage, so
+the network requests overlap with parsing and saving; a full capture cycle takes about as long as
+the slowest camera instead of the sum of all cameras. Because the queues are bounded, a slow stage
+holds back the stages before it, which limits the number of pages kept in memory and of images waiting
+in temporary files. As with the thread pool of capture_engine, the images are streamed to disk in chunks.
+
+The blocking requests of the shared HTTP session (see http_client) run in a thread pool of the pipeline,
+with a thread for every download of the page and image stages; the number of simultaneous requests is
+limited by the configured workers and per host limit. With the default of one worker (which captures
+sequentially without the pipeline) the download stages get the per host limit for every host of the cameras,
+up to MAX_FETCH_WORKERS, so the pipeline overlaps the downloads without further configuration.
+Functions:
+    fetch_workers(cameras, config) -> int
+        The number of simultaneous downloads of the pipeline.
+    run_pipeline(cameras, config, metadata_cache, validators, dedup, catalog, writer, changes) -> list[CaptureResult]
+        Capture the cameras with the pipeline and save their images.
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging
+from pathlib import Path
+from time import perf_counter
+from typing import Awaitable, Callable, Iterable
+from urllib.parse import urlsplit
+from camera.capture_engine import CaptureResult
+from camera.catalog import Catalog
+from camera.change_detection import ChangeDetector
+from camera.capture_functions import DownloadedImage, download_image, store_image, update_folder_tree
+from camera.config import CameraConfig
+from camera.dedup import DedupIndex
+from camera.http_client import NotModified, ValidatorCache
+from camera.image_writer import ImageWriter
+from camera.kenya_capture import CameraPage, fetch_camera_page, find_camera_image
+from camera.metadata_cache import MetadataCache
+from camera.metrics import CaptureTiming, run_with_timing, timed
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 8      # cameras waiting between two stages
+PARSE_WORKERS = 2
+MAX_FETCH_WORKERS = 64
+SAVE_WORKERS = 1
+
+_DONE = object()    # end of the input of a stage
+
+
+@dataclass
+class _Job:
+    url: str
+    location: str
+    page: CameraPage | None = None
+    img_url: str | None = None
+    image: DownloadedImage | None = None
+    timing: CaptureTiming = field(init=False)
+    started: float = 0.0    # perf_counter at the start of the capture
+
+    def __post_init__(self):
+        self.timing = CaptureTiming(self.location, self.url)
+
+    def captured(self) -> None:
+        """The image is retrieved (or the capture ended)."""
+        self.timing.elapsed = perf_counter() - self.started
+
+
+def fetch_workers(cameras: Iterable[tuple[str, str]], config: CameraConfig) -> int:
+    """The number of simultaneous downloads of the (url, location) cameras: the configured workers, or with
+       the default of one worker the per host limit for every host, up to MAX_FETCH_WORKERS.
+    """
+    if config.workers > 1:
+        return config.workers
+    hosts = {urlsplit(url).netloc.lower() for url, _ in cameras}
+    return max(1, min(MAX_FETCH_WORKERS, config.per_host_limit * len(hosts)))
+
+
+class CapturePipeline:
+    """Pipeline of the page, parse, image and save stages; see the module description."""
+
+    def __init__(self, config: CameraConfig, metadata_cache: MetadataCache | None = None,
+                 validators: ValidatorCache | None = None, dedup: DedupIndex | None = None,
+                 catalog: Catalog | None = None, writer: ImageWriter | None = None,
+                 changes: ChangeDetector | None = None, queue_size: int = QUEUE_SIZE):
+        self.config = config
+        self.metadata_cache = metadata_cache
+        self.validators = validators
+        self.dedup = dedup
+        self.catalog = catalog
+        self.writer = writer
+        self.changes = changes
+        self.queue_size = queue_size
+        self.results: list[CaptureResult] = []
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+        self._parse_executor: ThreadPoolExecutor | None = None
+        self._download_executor: ThreadPoolExecutor | None = None
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.config.per_host_limit)
+        return self._hosts[host]
+
+    def _fail(self, job: _Job, error: str) -> None:
+        logger.error(f"Capture failed for {job.location} at {job.url}: {error}")
+        job.captured()
+        self.results.append(CaptureResult(job.location, job.url, img_url=job.img_url, error=error,
+                                          timing=job.timing))
+
+    async def _fetch_page(self, job: _Job) -> _Job | None:
+        logger.info(f"Capturing image for {job.location} at {job.url}")
+        job.started = perf_counter()
+        loop = asyncio.get_running_loop()
+        async with self._host_limit(job.url):
+            job.page = await loop.run_in_executor(self._download_executor, run_with_timing, job.timing,
+                                                  fetch_camera_page, job.url, self.metadata_cache, self.validators)
+        if job.page is None:
+            self._fail(job, "Page not accessible")
+            return None
+        return job
+
+    async def _parse_page(self, job: _Job) -> _Job | None:
+        loop = asyncio.get_running_loop()
+        job.img_url = await loop.run_in_executor(
+            self._parse_executor, run_with_timing, job.timing, find_camera_image,
+            job.page, self.metadata_cache, self.validators, self.config.parser_backend)
+        job.page = None     # the page is not needed anymore
+        if not job.img_url:
+            self._fail(job, "No valid image data")
+            return None
+        return job
+
+    def _download(self, job: _Job) -> DownloadedImage | None:
+        """Download the image into the folder of the station (found by the writer when given)."""
+        root = self.config.image_save_path
+        folder = self.writer.folder(root, job.location) if self.writer is not None \
+            else update_folder_tree(root, job.location)
+        return download_image(job.img_url, folder, self.validators, self.config.max_image_size * 1024)
+
+    async def _fetch_image(self, job: _Job) -> _Job | None:
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._host_limit(job.img_url):
+                job.image = await loop.run_in_executor(self._download_executor, run_with_timing, job.timing,
+                                                       self._download, job)
+        except NotModified:
+            job.captured()
+            self.results.append(CaptureResult(job.location, job.url, img_url=job.img_url, unchanged=True,
+                                              timing=job.timing))
+            return None
+        if job.image is None:
+            self._fail(job, "No valid image data")
+            return None
+        job.captured()
+        return job
+
+    def _save(self, job: _Job) -> None:
+        with timed('save', job.timing):
+            store_image(job.image, job.location, Path(job.img_url).suffix, self.dedup, self.catalog,
+                        job.img_url, self.writer, self.changes)
+
+    async def _save_image(self, job: _Job) -> None:
+        await asyncio.to_thread(self._save, job)
+        self.results.append(CaptureResult(job.location, job.url, img_url=job.img_url, image=job.image,
+                                          timing=job.timing))
+
+    async def _stage(self, handler: Callable[[_Job], Awaitable[_Job | None]], workers: int,
+                     inbox: asyncio.Queue, outbox: asyncio.Queue | None, consumers: int) -> None:
+        """Run the handler on the jobs from the inbox with a number of workers, and pass the
+           jobs on to the outbox. When the input ends, the consumers of the outbox are told so.
+        """
+        async def worker():
+            while (job := await inbox.get()) is not _DONE:
+                try:
+                    job = await handler(job)
+                except Exception as e:
+                    self._fail(job, str(e))
+                    continue
+                if job is not None and outbox is not None:
+                    await outbox.put(job)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        if outbox is not None:
+            for _ in range(consumers):
+                await outbox.put(_DONE)
+
+    async def run(self, cameras: Iterable[tuple[str, str]]) -> list[CaptureResult]:
+        """Capture the (url, location) cameras and return the results in order of completion."""
+        cameras = list(cameras)
+        downloads = fetch_workers(cameras, self.config)
+        pages: asyncio.Queue = asyncio.Queue()
+        parse_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        image_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        save_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        for url, location in cameras:
+            pages.put_nowait(_Job(url, location))
+        for _ in range(downloads):
+            pages.put_nowait(_DONE)
+
+        self.results = []
+        # not the default executor of asyncio, which has fewer threads than MAX_FETCH_WORKERS downloads
+        with ThreadPoolExecutor(PARSE_WORKERS, thread_name_prefix='parse') as self._parse_executor, \
+                ThreadPoolExecutor(2 * downloads, thread_name_prefix='download') as self._download_executor:
+            await asyncio.gather(
+                self._stage(self._fetch_page, downloads, pages, parse_queue, PARSE_WORKERS),
+                self._stage(self._parse_page, PARSE_WORKERS, parse_queue, image_queue, downloads),
+                self._stage(self._fetch_image, downloads, image_queue, save_queue, SAVE_WORKERS),
+                self._stage(self._save_image, SAVE_WORKERS, save_queue, None, 0))
+        return self.results
+
+
+def run_pipeline(cameras: Iterable[tuple[str, str]], config: CameraConfig,
+                 metadata_cache: MetadataCache | None = None, validators: ValidatorCache | None = None,
+                 dedup: DedupIndex | None = None, catalog: Catalog | None = None,
+                 writer: ImageWriter | None = None, changes: ChangeDetector | None = None) -> list[CaptureResult]:
+    """Capture the (url, location) cameras with the asyncio pipeline and save their images."""
+    pipeline = CapturePipeline(config, metadata_cache, validators, dedup, catalog, writer, changes)
+    return asyncio.run(pipeline.run(cameras))
@@ -0,0 +1,112 @@
+'''
+camera_health.py
+This module keeps track of the health of every camera with a circuit breaker, so cameras that are
+down do not take time and workers from the healthy cameras in every capture slot.
+A camera starts 'closed' and is captured in every slot. After a number of consecutive failures the
+circuit 'opens': the camera is skipped until its next probe time. At the probe time the camera is
+captured once ('half-open'); when that succeeds the circuit closes again, otherwise it opens with
+twice the previous wait, up to a maximum. The first wait is the capture interval of the camera (its own
+interval from the camera locations file, or the configured interval), counted from the start of the
+capture cycle, so the probe falls in the next slot of the camera even when the slots start a little late.
+The health state is kept in the state folder, so it carries over between runs.
+'''
+
+from dataclasses import dataclass, asdict
+import logging
+from pathlib import Path
+from time import time
+from camera.config import CameraConfig
+from camera.state_store import JsonStateStore
+
+logger = logging.getLogger(__name__)
+
+HEALTH_FILE = 'camera_health.json'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+PROBE_MARGIN = 60   # seconds a capture slot may start before the probe time and still probe the camera
+
+
+@dataclass
+class CameraHealth:
+    state: str = CLOSED
+    failures: int = 0           # consecutive failures
+    last_error: str = ''
+    last_success: float = 0.0   # seconds since the epoch
+    last_failure: float = 0.0
+    next_probe: float = 0.0     # when an open circuit is tried again
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CameraHealth':
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+
+class HealthRegistry:
+    """Persistent circuit breakers of the cameras, keyed by camera page URL."""
+
+    def __init__(self, path: Path, failure_threshold: int = 3, base_delay: float = 1800,
+                 max_delay: float = 24 * 3600):
+        self._store = JsonStateStore(path)
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_delay = base_delay
+        self.max_delay = max(base_delay, max_delay)
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'HealthRegistry':
+        return cls(config.state_folder / HEALTH_FILE, config.failure_threshold,
+                   config.interval * 60, config.max_probe_interval * 3600)
+
+    def get(self, url: str) -> CameraHealth:
+        return CameraHealth.from_dict(self._store.get(url, {}))
+
+    def _set(self, url: str, health: CameraHealth) -> None:
+        self._store.set(url, asdict(health))
+
+    def allow(self, url: str, now: float | None = None) -> bool:
+        """Whether the camera should be captured now; an open circuit past its probe time becomes half-open."""
+        health = self.get(url)
+        if health.state != OPEN:
+            return True
+        now = time() if now is None else now
+        if now + PROBE_MARGIN < health.next_probe:
+            return False
+        health.state = HALF_OPEN
+        self._set(url, health)
+        return True
+
+    def delay(self, failures: int, base_delay: float | None = None) -> float:
+        """Wait before the next probe after the given number of consecutive failures; the first wait is
+           base_delay (the capture interval of the camera in seconds), by default that of the registry.
+        """
+        base_delay = base_delay or self.base_delay
+        doublings = min(failures - self.failure_threshold, 32)
+        return min(base_delay * 2 ** max(doublings, 0), max(base_delay, self.max_delay))
+
+    def record_success(self, url: str, now: float | None = None) -> None:
+        health = self.get(url)
+        if health.state != CLOSED:
+            logger.info(f"Camera {url} is back after {health.failures} failures")
+        self._set(url, CameraHealth(last_success=time() if now is None else now))
+
+    def record_failure(self, url: str, error: str, now: float | None = None,
+                       base_delay: float | None = None) -> None:
+        now = time() if now is None else now
+        health = self.get(url)
+        health.failures += 1
+        health.last_error = error or ''
+        health.last_failure = now
+        if health.state == HALF_OPEN or health.failures >= self.failure_threshold:
+            delay = self.delay(health.failures, base_delay)
+            if health.state != OPEN:
+                logger.warning(f"Camera {url} failed {health.failures} times, next try in {delay / 60:.0f} minutes")
+            health.state = OPEN
+            health.next_probe = now + delay
+        self._set(url, health)
+
+    def items(self) -> list[tuple[str, CameraHealth]]:
+        return [(url, CameraHealth.from_dict(data)) for url, data in self._store.items()]
+
+    def save(self) -> None:
+        self._store.save()
@@ -1,5 +1,8 @@
+import csv
+from dataclasses import dataclass
+from datetime import time
+import json
 import logging
-import pandas as pd
 from pathlib import Path
 from camera.config import CameraConfig
 
@@ -8,34 +11,132 @@ logger = logging.getLogger(__name__)
 CAMERA_LOCATIONS_FILE = Path(__file__).parent / 'camera_locations.txt'
 
 
-def load_urls_from_file(config: CameraConfig) -> pd.DataFrame:
+@dataclass(frozen=True, slots=True)
+class CameraLocation:
+    """A camera from the camera locations file, with its optional schedule (None is the configured value)."""
+    url: str
+    location: str
+    start: str | None = None        # HH:MM[:SS]
+    end: str | None = None
+    interval: int | None = None     # in minutes
+    timezone: str | None = None     # IANA name such as 'Africa/Nairobi'
+
+
+def load_urls_from_file(config: CameraConfig) -> tuple[CameraLocation, ...]:
     """Load camera URLs from the camera locations file."""
     camera_locations_file = Path(config.location_file)
     if not camera_locations_file.exists():
         logger.error(f"Camera locations file does not exist: {camera_locations_file}")
-        return pd.DataFrame(columns=["url", "location"])
+        return ()
 
-    ds = load_camera_locations(camera_locations_file)
-    if ds.empty:
+    cameras = load_camera_locations(camera_locations_file)
+    if not cameras:
         logger.error("No camera locations found.")
 
-    return ds
+    return cameras
+
+
+def _value(text: str | None) -> str | None:
+    """The stripped text, None when it is missing or empty."""
+    text = (text or '').strip()
+    return text or None
 
 
-def load_camera_locations(file_path: str) -> pd.DataFrame:
+def _validated(camera: CameraLocation) -> CameraLocation:
+    """The camera; raise ValueError when its start time, end time or interval can not be used."""
+    for name in ('start', 'end'):
+        value = getattr(camera, name)
+        if value is not None:
+            try:
+                time.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"invalid {name} time '{value}', expected HH:MM") from None
+    if camera.interval is not None and camera.interval < 1:
+        raise ValueError(f"invalid interval '{camera.interval}'")
+    return camera
+
+
+def load_camera_locations(file_path: str) -> tuple[CameraLocation, ...]:
     """
-    Load camera locations from a CSV file.
+    Load camera locations from a CSV file, or from a JSON file (see load_camera_locations_json).
+    The CSV file must have a 'url' and a 'location' column, and can have the schedule columns
+    'start', 'end', 'interval' (in minutes) and 'timezone'. Rows without url or location are skipped,
+    and so are rows with an invalid start time, end time or interval, with a warning.
 
     :param file_path: Path to the CSV file containing camera locations.
-    :return: DataFrame containing camera locations.
+    :return: tuple of the camera locations.
+    """
+    if Path(file_path).suffix.lower() == '.json':
+        return load_camera_locations_json(file_path)
+    try:
+        with open(file_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f, skipinitialspace=True)
+            columns = [column.strip() for column in reader.fieldnames or []]
+            if 'url' not in columns or 'location' not in columns:
+                raise ValueError("Data file must contain 'url' and 'location' columns.")
+            reader.fieldnames = columns
+            cameras = []
+            for row in reader:
+                url, location = _value(row.get('url')), _value(row.get('location'))
+                if not url or not location:
+                    continue
+                interval = _value(row.get('interval'))
+                try:
+                    cameras.append(_validated(CameraLocation(
+                        url, location, _value(row.get('start')), _value(row.get('end')),
+                        int(float(interval)) if interval else None, _value(row.get('timezone')))))
+                except ValueError as e:
+                    logger.warning(f"Camera {url} skipped: {e}")
+        return tuple(cameras)
+    except Exception as e:
+        logger.error(f"Error loading camera locations: {e}")
+        return ()  # no cameras on error
+
+
+def _json_schedule(camera: dict) -> dict:
+    interval = camera.get('interval')
+    if interval is not None and str(camera.get('interval_unit', 'minutes')).lower().startswith('hour'):
+        interval = float(interval) * 60
+    return {
+        'start': camera.get('start_time'),
+        'end': camera.get('end_time'),
+        'interval': int(interval) if interval is not None else None,
+        'timezone': camera.get('timezone_title'),
+    }
+
+
+def load_camera_locations_json(file_path: str) -> tuple[CameraLocation, ...]:
+    """
+    Load camera locations from a JSON file with a 'camera_locations' list.
+    Every camera has a 'url' and a 'title' (the location name). A camera can have its own schedule:
+    'start_time', 'end_time' (HH:MM[:SS]), 'interval' (with 'interval_unit' minutes or hours) and
+    'timezone_title' (IANA name such as 'Africa/Nairobi'); missing values are None.
+    When a URL is listed more than once, the first entry is used. A camera with an invalid start time,
+    end time or interval is skipped, with a warning.
+
+    :param file_path: Path to the JSON file containing camera locations.
+    :return: tuple of the camera locations.
     """
     try:
-        df = pd.read_csv(file_path)
-        if 'url' not in df.columns or 'location' not in df.columns:
-            raise ValueError("Data file must contain 'url' and 'location' columns.")
-        df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-        df = df.dropna()
-        return df
+        with open(file_path, encoding='utf-8') as f:
+            data = json.load(f)
+        cameras = []
+        seen = set()
+        for camera in data.get('camera_locations', []):
+            url = str(camera.get('url') or '').strip()
+            location = str(camera.get('title') or '').strip()
+            if not url or not location:
+                continue
+            if url in seen:
+                logger.warning(f"Camera {url} is listed more than once, using the first entry")
+                continue
+            try:
+                cameras.append(_validated(CameraLocation(url, location, **_json_schedule(camera))))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Camera {url} skipped: {e}")
+                continue
+            seen.add(url)
+        return tuple(cameras)
     except Exception as e:
         logger.error(f"Error loading camera locations: {e}")
-        return pd.DataFrame()  # Return an empty DataFrame on error
+        return ()  # no cameras on error
@@ -0,0 +1,151 @@
+'''
+camera_schedule.py
+This module schedules every camera on its own capture grid. A camera can have its own start time,
+end time, interval and timezone (from the JSON camera locations file); missing values are taken from
+the configuration. All cameras are multiplexed on a single timer: a priority queue (heap) ordered by
+the next capture time of each camera, so a camera is only captured when it is due.
+Classes:
+    CameraSchedule
+        Start, end, interval and timezone of the captures of a camera.
+    CaptureTimer
+        Priority queue of the cameras by their next capture time.
+'''
+
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, tzinfo
+import heapq
+import logging
+from typing import Hashable, Iterable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from camera.camera_locations import CameraLocation
+from camera.config import CameraConfig
+from camera.timing_functions import next_capture_time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CameraSchedule:
+    start: time
+    end: time
+    interval: int  # in minutes
+    timezone: tzinfo | None = None  # None is the local time of the computer
+
+    def now(self) -> datetime:
+        return datetime.now(self.timezone)
+
+    def local_time(self, now: datetime | None = None) -> datetime:
+        """The time (default the current time) in the timezone of the camera."""
+        if now is None:
+            return self.now()
+        return now.astimezone(self.timezone) if self.timezone is not None else now
+
+    def is_active(self, now: datetime | None = None) -> bool:
+        """Whether the time is within the capture hours of the camera."""
+        return self.start <= self.local_time(now).time() <= self.end
+
+    def next_capture_time(self, now: datetime | None = None) -> datetime:
+        """The next capture time after now, in the timezone of the camera."""
+        # strictly after now, also when now is exactly the end time
+        return next_capture_time(self, self.local_time(now) + timedelta(microseconds=1))
+
+    def end_of_day(self, now: datetime | None = None) -> datetime:
+        end = self.end
+        return self.local_time(now).replace(hour=end.hour, minute=end.minute, second=0, microsecond=0)
+
+
+def parse_timezone(name: str | None) -> tzinfo | None:
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone '{name}', using local time")
+        return None
+
+
+def camera_schedule(camera: CameraLocation, config: CameraConfig) -> CameraSchedule:
+    """Schedule of a camera from its (optional) start, end, interval and timezone values;
+       missing values are taken from the configuration.
+    """
+    return CameraSchedule(
+        time.fromisoformat(camera.start) if camera.start else config.start,
+        time.fromisoformat(camera.end) if camera.end else config.end,
+        camera.interval or config.interval,
+        parse_timezone(camera.timezone))
+
+
+class CaptureTimer:
+    """Priority queue of cameras ordered by their next capture time.
+       The cameras that are due at the same moment are returned together, so they are captured in one batch.
+       Cameras can be removed or rescheduled at any time: their old entry stays in the heap, but is
+       skipped because it is no longer the current entry of the camera.
+    """
+
+    def __init__(self, single_day: bool = False):
+        self.single_day = single_day
+        self._heap: list[tuple[float, int, Hashable, datetime]] = []
+        self._schedules: dict[Hashable, CameraSchedule] = {}
+        self._day_ends: dict[Hashable, datetime] = {}
+        self._entries: dict[Hashable, int] = {}    # camera -> counter of its current heap entry
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, camera: Hashable, schedule: CameraSchedule, now: datetime | None = None) -> None:
+        """Schedule the camera at its first capture time after now.
+           A camera that is already scheduled is rescheduled with the new schedule.
+        """
+        self._entries.pop(camera, None)
+        self._schedules[camera] = schedule
+        if self.single_day:
+            self._day_ends[camera] = schedule.end_of_day(now)
+        self._push(camera, now)
+
+    def _push(self, camera: Hashable, now: datetime | None) -> None:
+        capture_time = self._schedules[camera].next_capture_time(now)
+        if self.single_day and capture_time > self._day_ends[camera]:
+            logger.debug(f"Capture of {camera} finished for today")
+            return
+        self._counter += 1
+        self._entries[camera] = self._counter
+        heapq.heappush(self._heap, (capture_time.timestamp(), self._counter, camera, capture_time))
+
+    def remove(self, camera: Hashable) -> None:
+        """Stop capturing the camera."""
+        self._entries.pop(camera, None)
+        self._schedules.pop(camera, None)
+        self._day_ends.pop(camera, None)
+
+    def _discard_stale(self) -> None:
+        while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def next_capture_time(self) -> datetime | None:
+        self._discard_stale()
+        return self._heap[0][3] if self._heap else None
+
+    def pop_due(self) -> tuple[datetime, list[Hashable]]:
+        """Remove the cameras with the earliest capture time from the queue,
+           and return that capture time and the cameras.
+        """
+        self._discard_stale()
+        timestamp, _, camera, capture_time = heapq.heappop(self._heap)
+        del self._entries[camera]
+        cameras = [camera]
+        self._discard_stale()
+        while self._heap and self._heap[0][0] == timestamp:
+            camera = heapq.heappop(self._heap)[2]
+            del self._entries[camera]
+            cameras.append(camera)
+            self._discard_stale()
+        return capture_time, cameras
+
+    def reschedule(self, cameras: Iterable[Hashable], now: datetime | None = None) -> None:
+        """Schedule the cameras at their next capture time after now (after a capture).
+           Cameras that were removed in the meantime are skipped.
+        """
+        for camera in cameras:
+            if camera in self._schedules:
+                self._push(camera, now)
@@ -1,15 +1,30 @@
-from datetime import datetime
+from dataclasses import dataclass
 import logging
 from pathlib import Path
+import sqlite3
 import sys
-import pandas as pd
+from typing import TYPE_CHECKING, Sequence
+from camera import setup_logging
 from camera.config import CameraConfig
-from camera.camera_locations import load_urls_from_file
-from camera.kenya_capture import capture
-from camera.capture_functions import save_camera_image
-from camera.timing_functions import determine_delay_to_next_capture_time, wait_until_next_capture
-from camera.timing_functions import wait_until_first_capture_time, EndCaptureException
+from camera.camera_locations import CameraLocation, load_urls_from_file
+from camera.camera_schedule import CameraSchedule, CaptureTimer, camera_schedule
+from camera.metadata_cache import MetadataCache
+from camera.dedup import DedupIndex
+from camera.change_detection import ChangeDetector
+from camera.catalog import Catalog
+from camera.image_writer import ImageWriter
+from camera.camera_health import HealthRegistry
+from camera.metrics import CaptureTiming, CycleMetrics, timed, SAVED, UNCHANGED, FAILED, SKIPPED
+from camera.timing_functions import CaptureScheduler, wait_until_first_capture_time, EndCaptureException
 from camera.cli_parser import cli_parser
+from camera.watcher import SettingsWatcher
+
+# requests, BeautifulSoup and asyncio are only imported by the run commands (see capture_all),
+# so the other commands start quickly
+if TYPE_CHECKING:
+    from camera.capture_engine import CaptureResult
+    from camera.http_client import ValidatorCache
+    from camera.supervisor import Shard
 
 CAPTURE_TODAY = 1
 NONSTOP_CAPTURE = 2
@@ -18,43 +33,194 @@ NONSTOP_CAPTURE = 2
 logger = logging.getLogger(__name__)
 
 
-def capture_all(all_urls: pd.DataFrame, config: CameraConfig) -> None:
-    """Capture images from all cameras in the camera locations file."""
+def save_result(result: 'CaptureResult', images_root: Path, dedup: DedupIndex, catalog: Catalog | None = None,
+                writer: ImageWriter | None = None, changes: ChangeDetector | None = None) -> None:
+    from camera.capture_functions import save_camera_image, store_image
+
+    suffix = Path(result.img_url).suffix
+    if result.image is not None:
+        store_image(result.image, result.location, suffix=suffix, dedup=dedup, catalog=catalog,
+                    source_url=result.img_url, writer=writer, changes=changes)
+    else:
+        save_camera_image(result.img_data, images_root, result.location, suffix=suffix, dedup=dedup,
+                          catalog=catalog, source_url=result.img_url, writer=writer, changes=changes)
+
+
+@dataclass
+class CaptureCaches:
+    """The caches of the captures, kept between the cycles of a repeated capture and saved after every cycle."""
+    metadata_cache: MetadataCache
+    validators: 'ValidatorCache | None'
+    dedup: DedupIndex
+    changes: ChangeDetector
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'CaptureCaches':
+        from camera.http_client import ValidatorCache
+
+        return cls(MetadataCache.from_config(config),
+                   ValidatorCache.from_config(config) if config.conditional_requests else None,
+                   DedupIndex.from_config(config), ChangeDetector.from_config(config))
+
+    def save(self) -> None:
+        self.metadata_cache.save()
+        if self.validators is not None:
+            self.validators.save()
+        if self.dedup.enabled:
+            self.dedup.save()
+            logger.info(self.dedup.summary())
+        if self.changes.enabled:
+            self.changes.save()
+            logger.info(self.changes.summary())
+
+
+def capture_all(cameras: Sequence[CameraLocation], config: CameraConfig, use_async: bool = False,
+                writer: ImageWriter | None = None, caches: CaptureCaches | None = None) -> None:
+    """Capture images from all cameras in the camera locations file.
+       The images are saved as soon as the capture of a camera finishes.
+       With use_async the cameras are captured with the asyncio pipeline (see async_pipeline).
+       The writer and the caches (kept between the cycles of a repeated capture) are flushed and saved
+       at the end of the cycle.
+    """
+    from camera.async_pipeline import run_pipeline
+    from camera.capture_engine import run_capture
+
     images_root = config.image_save_path
-    for _, row in all_urls.iterrows():
-        url = row['url']
-        location = row['location']
-        logger.info(f"Capturing image for {location} at {url}")
-        img_data, img_url = capture(url)
-        if img_data:
-            save_camera_image(img_data, images_root, location, suffix=Path(img_url).suffix)
+    writer = writer or ImageWriter.from_config(config)
+    caches = caches or CaptureCaches.from_config(config)
+    metadata_cache, validators, dedup, changes = caches.metadata_cache, caches.validators, caches.dedup, caches.changes
+    try:
+        catalog = Catalog.from_config(config)
+    except sqlite3.OperationalError as e:   # locked by another process for longer than LOCK_TIMEOUT
+        logger.error(f"Unable to open the catalog, the frames of this cycle are not added: {e}")
+        catalog = None
+    health = HealthRegistry.from_config(config)
+    # an open circuit is first probed again after the capture interval of the camera itself
+    intervals = {camera.url: camera_schedule(camera, config).interval * 60 for camera in cameras}
+    cycle = CycleMetrics.from_config(config)
+    started = cycle.started.timestamp()     # failures count from the slot, not from the end of a download
+    to_capture = []
+    for camera in cameras:
+        if health.allow(camera.url, now=started):
+            to_capture.append((camera.url, camera.location))
         else:
-            logger.error(f"No valid image data was captured for {location} at {url}")
-        logger.info(f"Finished capturing image for {location}")
+            logger.info(f"Skipping {camera.location}, camera is down (see 'capture status')")
+            cycle.add(CaptureTiming(camera.location, camera.url), SKIPPED)
+    if use_async:
+        results = run_pipeline(to_capture, config, metadata_cache, validators, dedup, catalog, writer, changes)
+    else:
+        results = run_capture(to_capture, workers=config.workers, per_host_limit=config.per_host_limit,
+                              images_root=images_root, writer=writer, metadata_cache=metadata_cache,
+                              validators=validators, parser_backend=config.parser_backend,
+                              max_image_size=config.max_image_size * 1024)
+    for result in results:
+        if result.succeeded:
+            if not use_async:   # the pipeline saves the images itself
+                with timed('save', result.timing):
+                    save_result(result, images_root, dedup, catalog, writer, changes)
+            health.record_success(result.page_url)
+            cycle.add(result.timing, SAVED)
+        elif result.unchanged:
+            logger.info(f"Image unchanged for {result.location}, nothing saved")
+            health.record_success(result.page_url)
+            cycle.add(result.timing, UNCHANGED)
+        else:
+            logger.error(f"No valid image data was captured for {result.location} at {result.page_url}")
+            health.record_failure(result.page_url, result.error, now=started,
+                                  base_delay=intervals.get(result.page_url))
+            cycle.add(result.timing, FAILED, result.error)
+            if catalog is not None:
+                catalog.add_failure(result.location, result.page_url)
+        logger.info(f"Finished capturing image for {result.location}")
+    writer.flush()
+    cycle.finish()
+    if catalog is not None:
+        catalog.close()
+    health.save()
+    caches.save()
+
+
+def cameras_by_url(cameras: Sequence[CameraLocation]) -> dict[str, CameraLocation]:
+    """The cameras by URL; when a URL is listed more than once the first camera is used."""
+    by_url = {}
+    for camera in cameras:
+        by_url.setdefault(camera.url, camera)
+    return by_url
+
+
+def update_timer(timer: CaptureTimer, cameras: dict[str, CameraLocation], config: CameraConfig,
+                 schedules: dict[str, CameraSchedule]) -> dict[str, CameraSchedule]:
+    """Bring the timer in line with the cameras (by URL): new cameras are added at their next capture time,
+       cameras that are gone are removed and cameras with a changed schedule are rescheduled.
+       Return the new schedules.
+    """
+    new_schedules = {url: camera_schedule(camera, config) for url, camera in cameras.items()}
+    removed = schedules.keys() - new_schedules.keys()
+    for url in removed:
+        timer.remove(url)
+    changed = [url for url, schedule in new_schedules.items() if schedules.get(url) != schedule]
+    for url in changed:
+        timer.add(url, new_schedules[url])
+    if schedules:
+        added = len(new_schedules.keys() - schedules.keys())
+        logger.info(f"Cameras updated: {added} added, {len(removed)} removed, {len(changed) - added} rescheduled")
+    return new_schedules
+
 
+def capture_all_repeat(cameras: Sequence[CameraLocation], config: CameraConfig, capture_mode: int = CAPTURE_TODAY,
+                       use_async: bool = False, shard: 'Shard | None' = None) -> bool:
+    """Capture every camera on its own schedule until the end of the day, or indefinitely.
+       The cameras within their capture hours are captured at once, after that each camera is
+       captured when it is due; cameras that are due at the same moment are captured together.
+       While waiting, changes of the configuration and camera locations files are applied (see watcher).
+       With a shard (a worker process of the supervisor) only the cameras of the shard are captured.
+    """
+    def select(all_cameras: Sequence[CameraLocation]) -> dict[str, CameraLocation]:
+        return cameras_by_url(shard.select(all_cameras) if shard is not None else all_cameras)
 
-def capture_all_repeat(all_urls: pd.DataFrame, config: CameraConfig, capture_mode: int = CAPTURE_TODAY) -> bool:
-    target = datetime.now()
+    def print_func(config: CameraConfig):
+        return print if config.verbose else (lambda *a, **k: None)
+
+    scheduler = CaptureScheduler(config, print_func=print_func(config))
     wait_period_length = 600    # 10 minutes, to allow for periodic updates
-    day_end = target.replace(hour=config.end.hour, minute=config.end.minute, second=0, microsecond=0)
+    timer = CaptureTimer(single_day=capture_mode == CAPTURE_TODAY)
+    watcher = SettingsWatcher(config, cameras)
+    writer = ImageWriter.from_config(config)
+    caches = CaptureCaches.from_config(config)
     success = False
     try:
-        while True:
-            capture_all(all_urls, config)
-            sleep_time, capture_time = determine_delay_to_next_capture_time(config, target)
-            if (capture_mode == CAPTURE_TODAY) and capture_time > day_end:
-                logger.info("Capture finished for today.")
-                success = True
-                break
+        by_url = select(cameras)
+        active = [camera for camera in by_url.values() if camera_schedule(camera, config).is_active()]
+        if active:
+            capture_all(active, config, use_async, writer, caches)
+        schedules = update_timer(timer, by_url, config, {})
+        while timer:
+            capture_time = timer.next_capture_time()
             logger.info(f'Next capture at {capture_time}; Press Ctrl+C to stop.')
-            wait_until_next_capture(sleep_time, wait_period_length,
-                                    print_func=print if config.verbose else (lambda *a, **k: None))
-            target = datetime.now()
+            if scheduler.wait_until(capture_time, wait_period_length, wake=watcher.poll) is None:
+                if watcher.config is not config:
+                    from camera import http_client
+
+                    config = watcher.config
+                    http_client.configure(config)
+                    scheduler.config, scheduler.print_func = config, print_func(config)    # keeps the lateness
+                    if config.durability != writer.durability:
+                        writer = ImageWriter.from_config(config)
+                    caches = CaptureCaches.from_config(config)     # saved at the end of every cycle
+                by_url = select(watcher.cameras)
+                schedules = update_timer(timer, by_url, config, schedules)
+                continue
+            capture_time, due = timer.pop_due()
+            capture_all([by_url[url] for url in due], config, use_async, writer, caches)
+            timer.reschedule(due)
+        logger.info("Capture finished for today.")
+        success = True
     except KeyboardInterrupt:
         logger.info("Stopping repeat capture.")
     except EndCaptureException:
         logger.info("Stopping repeat capture.")
 
+    logger.info(scheduler.summary())
     return success
 
 
@@ -65,27 +231,39 @@ def main():
         parser.print_help()
         sys.exit(1)
 
+    setup_logging()
     config = CameraConfig()  # Load the configuration
 
     if str(args.Command).startswith('run'):
-        all_urls = load_urls_from_file(config)
-        if all_urls.empty:
+        from camera import http_client
+
+        cameras = load_urls_from_file(config)
+        if not cameras:
             logger.error("No camera URLs found. Please check the camera locations file.")
             sys.exit(1)
+        http_client.configure(config)
+
+    if args.Command == 'run':
         wait_until_first_capture_time(config)
 
     if args.verbose:
-        config.verbose = True
+        config.verbose = config.verbose_option = True
 
     if args.Command == 'run':
         logger.info("Capturing once.")
-        capture_all(all_urls, config)
+        capture_all(cameras, config, args.use_async)
     elif args.Command == 'run-repeat':
         logger.info("Capturing in one day repeat mode. Press Ctrl+C to stop.")
-        capture_all_repeat(all_urls, config, CAPTURE_TODAY)
+        capture_all_repeat(cameras, config, CAPTURE_TODAY, args.use_async)
     elif args.Command == 'run-repeat-no-limit':
         logger.info("Capturing in continuous repeat mode. Press Ctrl+C to stop.")
-        capture_all_repeat(all_urls, config, NONSTOP_CAPTURE)
+        capture_all_repeat(cameras, config, NONSTOP_CAPTURE, args.use_async)
+    elif args.Command == 'supervise':
+        from camera.supervisor import supervise
+
+        logger.info(f"Capturing with {args.processes} worker processes. Press Ctrl+C to stop.")
+        supervise(args.processes, args.shard_by, NONSTOP_CAPTURE if args.no_limit else CAPTURE_TODAY,
+                  args.use_async, args.verbose)
     else:
         args.func(args)
 
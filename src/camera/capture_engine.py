@@ -0,0 +1,131 @@
+'''
+capture_engine.py
+This module runs the capture for a list of cameras. Cameras are either captured one after the other
+(the default, one worker) or concurrently using a pool of worker threads. Because all cameras of a site
+are usually served by the same web server, the number of simultaneous captures per host is capped as well.
+Functions:
+    run_capture(cameras, workers, per_host_limit, images_root, writer, **capture_options) -> Iterator[CaptureResult]
+        Capture all cameras, yielding the result of each camera as soon as it is available.
+Classes:
+    CaptureResult
+        The outcome of capturing a single camera: image data or downloaded image, image URL,
+        unchanged or an error message.
+    HostLimiter
+        Hands out a bounded semaphore per host to limit the number of parallel requests to that host.
+'''
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+import logging
+import threading
+from typing import Iterable, Iterator
+from pathlib import Path
+from urllib.parse import urlsplit
+from camera.capture_functions import DownloadedImage, update_folder_tree
+from camera.http_client import NotModified
+from camera.image_writer import ImageWriter
+from camera.metrics import CaptureTiming, measure_capture
+from camera.kenya_capture import capture
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CaptureResult:
+    location: str
+    page_url: str
+    img_data: bytes | None = None
+    img_url: str | None = None
+    error: str | None = None
+    unchanged: bool = False  # the image did not change since the previous capture
+    image: DownloadedImage | None = None  # the image streamed to a temporary file
+    timing: CaptureTiming | None = None
+
+    @property
+    def succeeded(self) -> bool:
+        return bool(self.img_data) or self.image is not None
+
+
+class HostLimiter:
+    """Limit the number of simultaneous captures per host."""
+
+    def __init__(self, per_host_limit: int):
+        self._limit = max(1, per_host_limit)
+        self._lock = threading.Lock()
+        self._semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+    def for_url(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self._limit)
+            return self._semaphores[host]
+
+
+def capture_camera(url: str, location: str, limiter: HostLimiter | None = None, images_root: Path | None = None,
+                   writer: ImageWriter | None = None, **capture_options) -> CaptureResult:
+    """Capture a single camera; any error is recorded in the result instead of being raised.
+       The capture options (such as the caches) are passed on to the capture function.
+       With an images root the image is streamed into a temporary file in the folder of the station,
+       which is found by the writer when given.
+       The timings of the capture are added to the result.
+    """
+    with measure_capture(location, url) as timing:
+        result = _capture_camera(url, location, limiter, images_root, writer, **capture_options)
+    result.timing = timing
+    return result
+
+
+def _capture_camera(url: str, location: str, limiter: HostLimiter | None, images_root: Path | None,
+                    writer: ImageWriter | None, **capture_options) -> CaptureResult:
+    logger.info(f"Capturing image for {location} at {url}")
+    try:
+        if writer is not None and images_root is not None:
+            capture_options['download_folder'] = writer.folder(images_root, location)
+        elif images_root is not None:
+            capture_options['download_folder'] = update_folder_tree(images_root, location)
+        if limiter is None:
+            img_data, img_url = capture(url, **capture_options)
+        else:
+            with limiter.for_url(url):
+                img_data, img_url = capture(url, **capture_options)
+    except NotModified as e:
+        return CaptureResult(location, url, img_url=e.url, unchanged=True)
+    except Exception as e:
+        logger.error(f"Capture failed for {location} at {url}: {e}")
+        return CaptureResult(location, url, error=str(e))
+
+    if not img_data:
+        return CaptureResult(location, url, img_url=img_url, error="No valid image data")
+    if isinstance(img_data, DownloadedImage):
+        return CaptureResult(location, url, img_url=img_url, image=img_data)
+    return CaptureResult(location, url, img_data=img_data, img_url=img_url)
+
+
+def run_capture(cameras: Iterable[tuple[str, str]], workers: int = 1, per_host_limit: int = 4,
+                images_root: Path | None = None, writer: ImageWriter | None = None,
+                **capture_options) -> Iterator[CaptureResult]:
+    """
+    Capture all cameras and yield the results as they arrive.
+    With a single worker the cameras are captured sequentially in the given order,
+    otherwise they are captured concurrently and yielded in order of completion.
+
+    :param cameras: (url, location) pairs of the cameras to capture.
+    :param workers: maximum number of cameras captured at the same time.
+    :param per_host_limit: maximum number of cameras captured at the same time from one host.
+    :param images_root: when given, images are streamed to disk below this folder instead of kept in memory.
+    :param writer: the writer that finds (and creates) the folders of the images below the images root.
+    :param capture_options: keyword arguments passed on to the capture of each camera,
+        such as the metadata cache and the HTTP validators shared by all captures.
+    """
+    if workers <= 1:
+        for url, location in cameras:
+            yield capture_camera(url, location, images_root=images_root, writer=writer, **capture_options)
+        return
+
+    limiter = HostLimiter(per_host_limit)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='capture') as pool:
+        futures = [pool.submit(capture_camera, url, location, limiter, images_root, writer, **capture_options)
+                   for url, location in cameras]
+        for future in as_completed(futures):
+            yield future.result()
@@ -1,28 +1,176 @@
+from dataclasses import dataclass
 from datetime import datetime, date
 import logging
+import os
 from pathlib import Path
+import tempfile
 import requests
+from camera.http_client import conditional_get, NotModified, ValidatorCache
+from camera.dedup import DedupIndex, new_image_hash
+from camera.catalog import Catalog, SAVED, DUPLICATE, SKIPPED, SIMILAR
+from camera.change_detection import ChangeDetector, REFERENCE_SUFFIX, thumbnail, write_reference
+from camera.config import DEDUP_HARDLINK
+from camera.image_writer import ImageWriter
+from camera.image_validation import HEAD_SIZE, TAIL_SIZE, ImageInfo, InvalidImage, inspect_image
+from camera import metrics
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 64 * 1024
+TEMPORARY_SUFFIX = '.part'
+CLAIM_SUFFIX = '.claim'
 
-def retrieve_image(img_url: str) -> bytes | None:
-    """Retrieve the image from the given URL."""
+
+@dataclass
+class DownloadedImage:
+    '''An image written to a temporary file in its final folder, waiting to be saved under its final name.'''
+    path: Path
+    size: int
+    digest: str
+    content_type: str = ''
+    info: ImageInfo | None = None   # None when the image was not valid
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ImageTooLarge(Exception):
+    """Exception to signal that an image exceeds the maximum allowed size."""
+    pass
+
+
+def retrieve_image(img_url: str, validators: ValidatorCache | None = None) -> bytes | None:
+    """Retrieve the image from the given URL.
+       When validators are given the image is only downloaded when it changed since the previous download;
+       otherwise NotModified is raised.
+    """
     if not img_url:
         return None
 
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(img_url, headers=headers)
+    try:
+        with metrics.timed('image'):
+            response = conditional_get(img_url, validators)
+    except requests.RequestException as e:
+        logger.error(f"Unable to retrieve image '{img_url}': {e}")
+        return None
+    if response.status_code == 304:
+        raise NotModified(img_url)
     if response.status_code == 200 and 'image' in response.headers.get('Content-Type', ''):
+        try:
+            inspect_image(response.content)
+        except InvalidImage as e:
+            logger.error(f"Invalid image '{img_url}': {e}")
+            return None
+        if validators is not None:
+            validators.update(img_url, response)
+        metrics.add_bytes(image=len(response.content))
         return response.content
     else:
         logger.info(f"Url does not link to an image: '{img_url}'")
         return None
 
 
+def write_temporary_image(chunks, folder: Path, max_size: int = 0, content_type: str = '',
+                          validate: bool = False) -> DownloadedImage:
+    """
+    Write the image data into a temporary file in the folder, while computing its size and content hash
+    and keeping its first and last bytes to check the image (see image_validation).
+    The temporary file is removed again if writing fails.
+
+    :param chunks: iterable of byte strings with the image data.
+    :param folder: the folder the image will finally be saved in.
+    :param max_size: maximum size in bytes; 0 means no limit. ImageTooLarge is raised when exceeded.
+    :param validate: raise InvalidImage when the data is not a complete image.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=folder, prefix='.', suffix=TEMPORARY_SUFFIX)
+    image_hash = new_image_hash()
+    size = 0
+    head = b''
+    tail = b''
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise ImageTooLarge(f"image larger than {max_size} bytes")
+                image_hash.update(chunk)
+                f.write(chunk)
+                if len(head) < HEAD_SIZE:
+                    head += chunk[:HEAD_SIZE - len(head)]
+                tail = chunk[-TAIL_SIZE:] if len(chunk) >= TAIL_SIZE else (tail + chunk)[-TAIL_SIZE:]
+        try:
+            info = inspect_image(head, tail, size)
+        except InvalidImage:
+            if validate:
+                raise
+            info = None
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+    return DownloadedImage(Path(tmp_name), size, image_hash.hexdigest(), content_type, info)
+
+
+def download_image(img_url: str, folder: Path, validators: ValidatorCache | None = None,
+                   max_size: int = 0) -> DownloadedImage | None:
+    """Download the image from the given URL in chunks, straight into a temporary file in the folder.
+       When validators are given the image is only downloaded when it changed since the previous download;
+       otherwise NotModified is raised.
+
+       :param max_size: maximum size of the image in bytes; 0 means no limit.
+    """
+    if not img_url:
+        return None
+
+    with metrics.timed('image'):
+        image = _download_image(img_url, folder, validators, max_size)
+    if image is not None:
+        metrics.add_bytes(image=image.size)
+    return image
+
+
+def _download_image(img_url: str, folder: Path, validators: ValidatorCache | None,
+                    max_size: int) -> DownloadedImage | None:
+    try:
+        response = conditional_get(img_url, validators, stream=True)
+    except requests.RequestException as e:
+        logger.error(f"Unable to retrieve image '{img_url}': {e}")
+        return None
+    with response:
+        if response.status_code == 304:
+            raise NotModified(img_url)
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code != 200 or 'image' not in content_type:
+            logger.info(f"Url does not link to an image: '{img_url}'")
+            return None
+        declared_size = int(response.headers.get('Content-Length') or 0)
+        if max_size and declared_size > max_size:
+            logger.error(f"Image '{img_url}' is too large: {declared_size} bytes")
+            return None
+        try:
+            image = write_temporary_image(response.iter_content(CHUNK_SIZE), folder, max_size, content_type,
+                                          validate=True)
+        except ImageTooLarge as e:
+            logger.error(f"Download of '{img_url}' aborted: {e}")
+            return None
+        except InvalidImage as e:
+            logger.error(f"Invalid image '{img_url}': {e}")
+            return None
+        except (requests.RequestException, OSError) as e:
+            logger.error(f"Unable to retrieve image '{img_url}': {e}")
+            return None
+
+    if validators is not None:
+        validators.update(img_url, response)
+    return image
+
+
 def update_folder_tree(images_root: Path, station_name: str) -> Path:
     ''' Images are saved using a hierarchy by station/year/month/day
-        This function ensures that the folder structure exists.
+        This function ensures that the folder structure exists. Another process may create the
+        same folders at the same time, so an existing folder is no error.
 
         :param station_name: name of the station location for the tree
     '''
@@ -35,12 +183,152 @@ def update_folder_tree(images_root: Path, station_name: str) -> Path:
     return tree_path
 
 
-def save_camera_image(img_data: bytes, images_root: Path, station: str, suffix: str) -> None:
-    """Save the camera image to a file."""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-    img_folder = update_folder_tree(images_root, station)
-    img_filename = img_folder / f"{station}_{timestamp}{suffix}"
+def claim_path(path: Path) -> Path:
+    """The hidden file that claims the name of a frame while the frame is moved into place."""
+    return path.with_name(f".{path.name}{CLAIM_SUFFIX}")
 
-    with open(img_filename, 'wb') as f:
-        f.write(img_data)
+
+def move_into_place(temporary: Path, img_filename: Path) -> Path:
+    """Rename the temporary file to the image name, so no other capture saves a frame under the same name,
+       not even in another process (see supervisor). When the name is taken, for instance by a camera with
+       the same location name or a second capture in the same minute, a number is added:
+       <station>_<timestamp>_2.jpg. The name is claimed with a hidden file that is removed once the frame is
+       in place, so a process that is killed meanwhile leaves no empty frame behind. Returns the final name.
+    """
+    candidate = img_filename
+    number = 1
+    while True:
+        claim = claim_path(candidate)
+        try:
+            os.close(os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            claim = None
+        if claim is not None:
+            try:
+                if not os.path.lexists(candidate):
+                    os.replace(temporary, candidate)
+                    return candidate
+            finally:
+                os.remove(claim)
+        number += 1
+        candidate = img_filename.with_name(f"{img_filename.stem}_{number}{img_filename.suffix}")
+
+
+def temporary_path(img_filename: Path) -> Path:
+    """A hidden temporary name in the folder of the image, unique between processes."""
+    return img_filename.with_name(f".{img_filename.stem}-{os.urandom(4).hex()}{TEMPORARY_SUFFIX}")
+
+
+def link_duplicate_image(earlier: Path, img_filename: Path) -> Path | None:
+    """Save a frame that is identical to an earlier frame as a hard link to it.
+       Returns the name of the link, or None when linking failed and the frame must be saved anyway.
+    """
+    link = temporary_path(img_filename)
+    try:
+        os.link(earlier, link)
+        linked = move_into_place(link, img_filename)
+    except OSError as e:
+        logger.warning(f"Unable to link {img_filename} to {earlier}: {e}")
+        if link.exists():
+            os.remove(link)
+        return None
+    logger.info(f"Duplicate image linked as {linked} to {earlier}")
+    return linked
+
+
+def image_thumbnail(image: DownloadedImage, changes: ChangeDetector | None):
+    """The thumbnail of the image for the change detection, or None when change detection is off."""
+    if changes is None or not changes.enabled or image.info is None:
+        return None
+    try:
+        return thumbnail(image.path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unable to compare {image.path} with the previous frame: {e}")
+        return None
+
+
+def store_image(image: DownloadedImage, station: str, suffix: str, dedup: DedupIndex | None = None,
+                catalog: Catalog | None = None, source_url: str | None = None,
+                writer: ImageWriter | None = None, changes: ChangeDetector | None = None) -> Path | None:
+    """Save a downloaded image under its final name, by renaming the temporary file.
+       With a dedup index, a frame identical to a recent frame of the station is skipped or hard linked.
+       With a change detector, a frame nearly identical to the previous frame of the station is saved
+       as a reference file (see change_detection).
+       With a catalog, the frame is added to the catalog.
+       With a writer, the image is flushed to disk according to its durability.
+       Returns the name of the saved file, or None when the frame was skipped.
+    """
+    now = datetime.now()
+    img_filename = image.path.parent / f"{station}_{now:%Y%m%d_%H%M}{suffix}"
+
+    if dedup is not None and dedup.enabled:
+        earlier = dedup.find(station, image.digest)
+        hardlink = dedup.mode == DEDUP_HARDLINK
+        saved = link_duplicate_image(earlier, img_filename) if earlier is not None and hardlink else None
+        if earlier is not None and (saved is not None or not hardlink):
+            if saved is None:
+                logger.info(f"Duplicate image not saved, identical to {earlier}")
+            image.discard()
+            dedup.record_duplicate(image.size)
+            if saved and writer is not None:
+                writer.saved(saved)
+            if catalog is not None:
+                catalog.add(station, saved, now, image.size, image.digest, source_url,
+                            DUPLICATE if saved else SKIPPED, image.info)
+            return saved
+
+    current = image_thumbnail(image, changes)
+    if current is not None:
+        earlier = changes.find(station, current, img_filename.parent)
+        if earlier is not None:
+            temporary = temporary_path(img_filename)
+            size = write_reference(temporary, earlier)
+            ref_filename = move_into_place(temporary, img_filename.with_suffix(REFERENCE_SUFFIX))
+            image.discard()
+            changes.record_similar(image.size - size)
+            if writer is not None:
+                writer.saved(ref_filename)
+            logger.info(f"Nearly identical image saved as reference {ref_filename} to {earlier}")
+            if catalog is not None:
+                catalog.add(station, ref_filename, now, size, image.digest, source_url, SIMILAR, image.info)
+            return ref_filename
+
+    if writer is not None:
+        writer.prepare(image.path)
+    img_filename = move_into_place(image.path, img_filename)
+    if writer is not None:
+        writer.saved(img_filename)
     logger.info(f"Image saved as {img_filename}")
+    if dedup is not None and dedup.enabled:
+        dedup.add(station, image.digest, img_filename)
+    if current is not None:
+        changes.add(station, current, img_filename)
+    if catalog is not None:
+        catalog.add(station, img_filename, now, image.size, image.digest, source_url, SAVED, image.info)
+    return img_filename
+
+
+def save_camera_image(img_data: bytes, images_root: Path, station: str, suffix: str,
+                      dedup: DedupIndex | None = None, catalog: Catalog | None = None,
+                      source_url: str | None = None, writer: ImageWriter | None = None,
+                      changes: ChangeDetector | None = None) -> Path | None:
+    """Save the camera image to a file.
+       The data is written to a temporary file first, which is then renamed, so an interrupted
+       write never leaves a truncated image behind. Data that is not a complete image is not written.
+       With a dedup index, a frame identical to a recent frame of the station is skipped or hard linked.
+       With a change detector, a nearly identical frame is saved as a reference file.
+       With a catalog, the frame is added to the catalog.
+       With a writer, its folders of the day are used and the image is flushed according to its durability.
+       Returns the name of the saved file, or None when the frame was skipped or is not a valid image.
+    """
+    try:
+        inspect_image(img_data)
+    except InvalidImage as e:
+        logger.error(f"Invalid image of {station} not saved: {e}")
+        return None
+    if writer is not None:
+        img_folder = writer.folder(images_root, station)
+    else:
+        img_folder = update_folder_tree(images_root, station)
+    image = write_temporary_image([img_data], img_folder)
+    return store_image(image, station, suffix, dedup, catalog, source_url, writer, changes)
@@ -0,0 +1,324 @@
+'''
+catalog.py
+This module keeps a catalog of all saved frames in a SQLite database in the state folder, so questions
+such as "what is the latest frame of every station" or "which cameras missed capture slots last week"
+are answered from an index instead of by walking the image folders.
+Every saved (or duplicate) frame and every failed capture is added as a row with the station, the capture
+minute (as in the file name), the capture time, the path relative to the image folder, the size, the
+content hash, the source URL, the status and, read from the image headers, the dimensions of the image
+and the time in the EXIF data of the camera. Images saved before the catalog existed are added with
+import_tree (see 'capture index').
+Classes:
+    Frame
+        A row of the catalog.
+    Catalog
+        The catalog database.
+Functions:
+    expected_slots(schedule, since, until) -> list[datetime]
+        The capture slots of a camera schedule in a period.
+    uncaptured_slots(slots, captured, interval) -> list[datetime]
+        The slots without a capture.
+'''
+
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import logging
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+from typing import Iterator
+from camera.camera_schedule import CameraSchedule
+from camera.config import CameraConfig
+from camera.change_detection import REFERENCE_SUFFIX
+from camera.dedup import new_image_hash
+from camera.image_validation import ImageInfo, read_image_info
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = 'catalog.sqlite'
+
+SAVED = 'saved'             # the frame is saved
+DUPLICATE = 'duplicate'     # identical to an earlier frame, saved as a hard link
+SKIPPED = 'skipped'         # identical to an earlier frame, not saved
+SIMILAR = 'similar'         # nearly identical to the previous frame, saved as a reference file
+FAILED = 'failed'           # the capture failed, there is no frame
+CAPTURED = (SAVED, DUPLICATE, SKIPPED, SIMILAR)
+
+SLOT_FORMAT = '%Y-%m-%d %H:%M'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BATCH_SIZE = 1000
+LOCK_TIMEOUT = 30     # seconds to wait for another process that writes to the catalog
+
+# file name of a frame: <station>_<YYYYmmdd>_<HHMM>[_<number>]<suffix> (see capture_functions.move_into_place)
+FRAME_NAME = re.compile(r'^(?P<station>.+)_(?P<stamp>\d{8}_\d{4})(_\d+)?\.\w+$')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    station TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    captured TEXT NOT NULL,
+    path TEXT UNIQUE,
+    size INTEGER NOT NULL DEFAULT 0,
+    hash TEXT,
+    source_url TEXT,
+    status TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    taken TEXT
+);
+CREATE INDEX IF NOT EXISTS frames_station_slot ON frames (station, slot);
+CREATE INDEX IF NOT EXISTS frames_slot ON frames (slot);
+'''
+
+COLUMNS = 'station, slot, captured, path, size, hash, source_url, status, width, height, taken'
+
+# columns added after the first version of the catalog, added to existing catalogs when opened
+ADDED_COLUMNS = {'width': 'INTEGER', 'height': 'INTEGER', 'taken': 'TEXT'}
+
+
+@dataclass
+class Frame:
+    station: str
+    slot: str           # capture minute, 'YYYY-mm-dd HH:MM' local time
+    captured: str       # capture time, 'YYYY-mm-dd HH:MM:SS' local time
+    path: str | None    # relative to the image folder; None when there is no frame
+    size: int = 0
+    hash: str | None = None
+    source_url: str | None = None
+    status: str = SAVED
+    width: int | None = None
+    height: int | None = None
+    taken: str | None = None    # time in the EXIF data of the image, 'YYYY-mm-dd HH:MM:SS' camera time
+
+    def add_info(self, info: ImageInfo | None) -> None:
+        """Add the information read from the image headers."""
+        if info is not None:
+            self.width, self.height = info.width, info.height
+            self.taken = info.taken.strftime(TIME_FORMAT) if info.taken else None
+
+
+def file_digest(path: Path) -> str:
+    image_hash = new_image_hash()
+    with open(path, 'rb') as f:
+        while chunk := f.read(64 * 1024):
+            image_hash.update(chunk)
+    return image_hash.hexdigest()
+
+
+class Catalog:
+    """SQLite catalog of the frames in the image folder. Rows are committed when added, so a write
+       transaction is short and the worker processes of the supervisor do not wait for each other long.
+    """
+
+    def __init__(self, path: Path, images_root: Path):
+        self.path = Path(path)
+        self.images_root = Path(images_root)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()   # frames are saved from worker threads by the asyncio pipeline
+        # the worker processes of the supervisor share the catalog, a writer waits for the others
+        self._connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+        # with write-ahead logging the queries do not wait for a writer (the mode is kept in the file)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+        existing = {row[1] for row in self._connection.execute('PRAGMA table_info(frames)')}
+        for column, kind in ADDED_COLUMNS.items():
+            if column not in existing:
+                try:
+                    self._connection.execute(f'ALTER TABLE frames ADD COLUMN {column} {kind}')
+                except sqlite3.OperationalError as e:
+                    if 'duplicate column' not in str(e):    # added by another process meanwhile
+                        raise
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'Catalog':
+        return cls(config.shared_state_folder / CATALOG_FILE, config.image_save_path)
+
+    def relative_path(self, path: Path) -> str:
+        try:
+            return Path(path).relative_to(self.images_root).as_posix()
+        except ValueError:
+            return str(path)
+
+    def add(self, station: str, path: Path | None, captured: datetime | None = None, size: int = 0,
+            digest: str | None = None, source_url: str | None = None, status: str = SAVED,
+            info: ImageInfo | None = None) -> None:
+        captured = captured or datetime.now()
+        frame = Frame(station, captured.strftime(SLOT_FORMAT), captured.strftime(TIME_FORMAT),
+                      self.relative_path(path) if path is not None else None, size, digest, source_url, status)
+        frame.add_info(info)
+        try:
+            self._insert([frame])
+        except sqlite3.OperationalError as e:     # locked by another process for longer than LOCK_TIMEOUT
+            logger.error(f"Unable to add {frame.path or 'the failed capture'} of {station} to the catalog: {e}")
+
+    def add_failure(self, station: str, source_url: str | None = None) -> None:
+        """Add a failed capture, so the missed slot can be told apart from a slot that was not scheduled."""
+        self.add(station, None, source_url=source_url, status=FAILED)
+
+    def _insert(self, frames: list[Frame]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                f'INSERT OR REPLACE INTO frames ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(f.station, f.slot, f.captured, f.path, f.size, f.hash, f.source_url, f.status,
+                  f.width, f.height, f.taken) for f in frames])
+            self._connection.commit()
+
+    def move(self, paths: dict[str, str]) -> None:
+        """Change the paths (relative to the image folder) of frames, for instance to their archive."""
+        with self._lock:
+            self._connection.executemany('UPDATE frames SET path = ? WHERE path = ?',
+                                         [(new, old) for old, new in paths.items()])
+            self._connection.commit()
+
+    def move_folder(self, old: str, new: str) -> None:
+        """Change the folder of all frames in the folder old (relative to the image folder) to new."""
+        old, new = old.rstrip('/') + '/', new.rstrip('/') + '/'
+        with self._lock:
+            self._connection.execute('UPDATE frames SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?',
+                                     (new, len(old) + 1, len(old), old))
+            self._connection.commit()
+
+    def remove(self, paths: list[str]) -> None:
+        """Remove the frames with the paths (relative to the image folder), for instance of deleted files."""
+        with self._lock:
+            self._connection.executemany('DELETE FROM frames WHERE path = ?', [(path,) for path in paths])
+            self._connection.commit()
+
+    def save(self) -> None:
+        with self._lock:
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list[Frame]:
+        with self._lock:
+            return [Frame(*row) for row in self._connection.execute(sql, parameters)]
+
+    def latest(self, station: str | None = None) -> list[Frame]:
+        """The latest frame of every station (or of the station)."""
+        where = ' AND station = ?' if station else ''
+        # SQLite takes the other columns from the row with the maximum slot
+        return self._query(f'SELECT station, MAX(slot), captured, path, size, hash, source_url, status, '
+                           f'width, height, taken '
+                           f'FROM frames WHERE status IN (?, ?){where} GROUP BY station ORDER BY station',
+                           (SAVED, DUPLICATE) + ((station,) if station else ()))
+
+    def frames(self, station: str, since: datetime, until: datetime | None = None) -> list[Frame]:
+        """The frames and failed captures of the station from since until until, in time order."""
+        until = until or datetime.now()
+        return self._query(f'SELECT {COLUMNS} FROM frames WHERE station = ? AND slot BETWEEN ? AND ? '
+                           f'ORDER BY slot, captured',
+                           (station, since.strftime(SLOT_FORMAT), until.strftime(SLOT_FORMAT)))
+
+    def stations(self) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._connection.execute('SELECT DISTINCT station FROM frames ORDER BY 1')]
+
+    def missed_slots(self, station: str, schedule: CameraSchedule, since: datetime,
+                     until: datetime | None = None) -> list[datetime]:
+        """The capture slots of the station from since until until without a captured frame.
+           A slot is captured when a frame was captured within one interval after the slot. Slots before
+           the first row of the station in the catalog, and slots that may still be captured, are not counted.
+        """
+        until = until or datetime.now()
+        with self._lock:
+            first = self._connection.execute('SELECT MIN(slot) FROM frames WHERE station = ?', (station,)).fetchone()[0]
+        if first is None:
+            return []
+        since = max(since, datetime.strptime(first, SLOT_FORMAT))
+        captured = sorted(datetime.strptime(frame.captured, TIME_FORMAT)
+                          for frame in self.frames(station, since, until) if frame.status in CAPTURED)
+        interval = timedelta(minutes=schedule.interval)
+        return uncaptured_slots(expected_slots(schedule, since, until - interval), captured, interval)
+
+    def _walk(self, folder: Path) -> Iterator[os.DirEntry]:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):   # the state folder and temporary files
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._walk(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+    def import_tree(self, compute_hash: bool = True) -> int:
+        """Add the frames in the image folder that are not in the catalog yet; return the number added.
+           Hard links to an earlier frame are added as duplicates, reference files (see change_detection)
+           as similar frames. With compute_hash the content hash is
+           computed and the dimensions and EXIF time are read from the image headers.
+        """
+        with self._lock:
+            known = {row[0] for row in self._connection.execute('SELECT path FROM frames WHERE path IS NOT NULL')}
+        inodes: dict[tuple[int, int], str | None] = {}
+        batch: list[Frame] = []
+        added = 0
+        for entry in self._walk(self.images_root):
+            match = FRAME_NAME.match(entry.name)
+            if not match:
+                continue
+            path = Path(entry.path)
+            relative = self.relative_path(path)
+            stat = entry.stat(follow_symlinks=False)
+            inode = (stat.st_dev, stat.st_ino)
+            status = DUPLICATE if inode in inodes else SAVED
+            if entry.name.endswith(REFERENCE_SUFFIX):
+                status = SIMILAR
+            digest = inodes.get(inode)
+            if relative not in known and digest is None and compute_hash and status != SIMILAR:
+                digest = file_digest(path)
+            inodes[inode] = digest
+            if relative in known:
+                continue
+            slot = datetime.strptime(match['stamp'], '%Y%m%d_%H%M')
+            # the modification time is the capture time, except for a hard link to an earlier frame
+            captured = datetime.fromtimestamp(stat.st_mtime)
+            if not slot <= captured < slot + timedelta(minutes=1):
+                captured = slot
+            frame = Frame(Path(relative).parts[0], slot.strftime(SLOT_FORMAT), captured.strftime(TIME_FORMAT),
+                          relative, stat.st_size, digest, None, status)
+            if compute_hash and status != SIMILAR:
+                frame.add_info(read_image_info(path))
+            batch.append(frame)
+            if len(batch) >= BATCH_SIZE:
+                self._insert(batch)
+                added += len(batch)
+                batch = []
+        self._insert(batch)
+        added += len(batch)
+        self.save()
+        return added
+
+
+def expected_slots(schedule: CameraSchedule, since: datetime, until: datetime) -> list[datetime]:
+    """The capture slots of the schedule from since until until, in the local time of the computer
+       (like the capture times in the catalog).
+    """
+    slots = []
+    day = since.date() - timedelta(days=1)     # the days in the timezone of the camera may differ
+    while day <= until.date() + timedelta(days=1):
+        slot = datetime.combine(day, schedule.start, schedule.timezone)
+        end = datetime.combine(day, schedule.end, schedule.timezone)
+        while slot <= end:
+            local = slot.astimezone().replace(tzinfo=None) if schedule.timezone is not None else slot
+            if since <= local <= until:
+                slots.append(local)
+            slot += timedelta(minutes=schedule.interval)
+        day += timedelta(days=1)
+    return slots
+
+
+def uncaptured_slots(slots: list[datetime], captured: list[datetime], interval: timedelta) -> list[datetime]:
+    """The slots without a capture time (sorted) within one interval after the slot."""
+    missed = []
+    for slot in slots:
+        index = bisect_left(captured, slot)
+        if index == len(captured) or captured[index] >= slot + interval:
+            missed.append(slot)
+    return missed
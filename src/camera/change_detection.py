@@ -0,0 +1,142 @@
+'''
+change_detection.py
+This module detects frames that are nearly identical to the previous saved frame of the same station,
+such as a dark night scene that the camera encodes again every slot: the content hash differs (see dedup),
+but the picture does not. Such a frame is not saved as an image but as a tiny reference file, with the
+name the frame would have had and the suffix '.ref', that contains the name of the saved frame it is
+nearly identical to.
+Every frame is reduced to a small grayscale thumbnail (THUMBNAIL_SIZE pixels square); the JPEG is only
+decoded at 1/8 scale for this, which takes a few milliseconds. The difference of two frames is the mean
+absolute difference of their thumbnails, as a percentage of full scale. A frame is nearly identical when the
+difference with the thumbnail of the last saved frame of the station is below the change threshold, and
+that frame was saved on the same day: a reference always points into its own day folder, so a day can be
+thinned, archived or moved on its own.
+The thumbnails of the last saved frames are kept per station in memory and in the state folder.
+Change detection needs Pillow and NumPy (pip install camera-capture[change]); it is off when the change
+threshold is 0 or when they are not installed.
+Classes:
+    ChangeDetector
+        The thumbnails of the last saved frame of every station.
+Functions:
+    thumbnail(path) -> numpy.ndarray
+    write_reference(path, frame) -> int
+    read_reference(path) -> Path
+'''
+
+from functools import lru_cache
+import logging
+import os
+from pathlib import Path
+from camera.config import CameraConfig
+from camera.dedup import format_bytes
+from camera.state_store import JsonStateStore
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FILE = 'frame_thumbnails.json'
+REFERENCE_SUFFIX = '.ref'
+THUMBNAIL_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def change_detection_available() -> bool:
+    try:
+        import numpy  # noqa: F401
+        import PIL.Image  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def thumbnail(path: Path):
+    """The grayscale thumbnail of the image file, as a THUMBNAIL_SIZE x THUMBNAIL_SIZE uint8 array."""
+    import numpy
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft('L', (THUMBNAIL_SIZE * 8, THUMBNAIL_SIZE * 8))     # decode a JPEG at a reduced scale
+        small = image.convert('L').resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.BOX)
+        return numpy.asarray(small, dtype=numpy.uint8)
+
+
+def write_reference(path: Path, frame: Path) -> int:
+    """Write the reference file, with the name of the frame relative to its folder; return its size."""
+    data = os.path.relpath(frame, path.parent).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+
+def read_reference(path: Path) -> Path:
+    """The frame the reference file refers to."""
+    return path.parent / Path(path).read_text(encoding='utf-8').strip()
+
+
+class ChangeDetector:
+    """The thumbnails of the last saved frame of every station, to detect nearly identical frames."""
+
+    def __init__(self, path: Path, threshold: float = 0.0):
+        self._store = JsonStateStore(path)
+        self.threshold = threshold
+        self._thumbnails = {}       # station: thumbnail of the last saved frame, decoded from the store
+        self.similar = 0
+        self.bytes_saved = 0
+        if threshold > 0 and not change_detection_available():
+            logger.warning("Change detection needs Pillow and NumPy (pip install camera-capture[change]); "
+                           "all frames are saved")
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'ChangeDetector':
+        return cls(config.state_folder / CHANGE_FILE, config.change_threshold)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0 and change_detection_available()
+
+    def _previous(self, station: str):
+        """The thumbnail and the file of the last saved frame of the station."""
+        entry = self._store.get(station)
+        if entry is None:
+            return None, None
+        filename, hex_pixels = entry
+        if station not in self._thumbnails:
+            import numpy
+
+            pixels = numpy.frombuffer(bytes.fromhex(hex_pixels), dtype=numpy.uint8)
+            self._thumbnails[station] = pixels.reshape(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        return self._thumbnails[station], Path(filename)
+
+    def difference(self, previous, current) -> float:
+        """Mean absolute difference of two thumbnails, in percent of full scale."""
+        import numpy
+
+        return float(numpy.abs(previous.astype(numpy.int16) - current).mean()) / 255 * 100
+
+    def find(self, station: str, current, folder: Path | None = None) -> Path | None:
+        """The last saved frame of the station when the thumbnail is nearly identical to it and it still exists.
+           With a folder (the day folder of the new frame), only a frame in that folder is returned: a reference
+           to another day would break when that day is thinned, archived or moved (see retention).
+        """
+        previous, filename = self._previous(station)
+        if previous is None or previous.shape != current.shape:
+            return None
+        if folder is not None and filename.parent != folder:
+            return None
+        if self.difference(previous, current) >= self.threshold or not filename.exists():
+            return None
+        return filename
+
+    def add(self, station: str, current, filename: Path) -> None:
+        """Remember the thumbnail of the saved frame of the station."""
+        self._thumbnails[station] = current
+        self._store.set(station, [str(filename), current.tobytes().hex()])
+
+    def record_similar(self, size: int) -> None:
+        self.similar += 1
+        self.bytes_saved += size
+
+    def summary(self) -> str:
+        return f"Nearly identical frames: {self.similar}, disk space saved: {format_bytes(self.bytes_saved)}"
+
+    def save(self) -> None:
+        self._store.save()
@@ -1,8 +1,18 @@
 import argparse
-from datetime import time
+from datetime import date, datetime, time, timedelta
 import logging
 from pathlib import Path
-from camera.config import CameraConfig, CONFIG_FILE
+from camera.config import (CameraConfig, CONFIG_FILE, BOOLEAN_KEYS, CHOICE_KEYS, NUMERIC_KEYS, SHARD_BY_URL,
+                           SHARD_MODES, STRING_KEYS, TIME_KEYS, parse_boolean)
+from camera.camera_locations import load_urls_from_file
+from camera.metadata_cache import MetadataCache
+from camera.camera_health import HealthRegistry, CLOSED, OPEN
+from camera.camera_schedule import camera_schedule
+from camera.catalog import Catalog
+from camera.gaps import backfill, find_all_gaps
+from camera.archive import archive_all, read_frame, read_index, stations
+from camera.dedup import format_bytes
+from camera.retention import apply_all
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +43,7 @@ def update_cli(args):
             logger.info(f"Configuration: Capture interval updated to: {config.capture_interval} minutes")
         except ValueError:
             logger.error("Invalid value for capture interval. Must be an integer.")
-    if args.key == 'start' or args.key == 'end':
+    if args.key in TIME_KEYS:
         try:
             hour, minute, *_ = map(int, args.value.split(':'))
             setattr(config, args.key, time(hour=hour, minute=minute))
@@ -46,6 +56,203 @@ def update_cli(args):
         except ValueError as e:
             msg = f"Invalid time for {args.key} time; {e}."
             logger.error(msg)
+    if args.key in NUMERIC_KEYS:
+        value_type, low, high = NUMERIC_KEYS[args.key]
+        try:
+            value = value_type(args.value)
+        except ValueError:
+            kind = 'an integer' if value_type is int else 'a number'
+            logger.error(f"Invalid value for {args.key}. Must be {kind}.")
+            return
+        if value < low or value > high:
+            logger.error(f"Allowed {args.key} range: {low} to {high}.")
+            return
+        setattr(config, args.key, value)
+        config.save()
+        logger.info(f"Configuration: {args.key} updated to: {value}")
+    if args.key in CHOICE_KEYS:
+        if args.value not in CHOICE_KEYS[args.key]:
+            logger.error(f"Invalid value for {args.key}. Must be one of: {', '.join(CHOICE_KEYS[args.key])}.")
+            return
+        setattr(config, args.key, args.value)
+        config.save()
+        logger.info(f"Configuration: {args.key} updated to: {args.value}")
+    if args.key in STRING_KEYS:
+        setattr(config, args.key, args.value.strip())
+        config.save()
+        logger.info(f"Configuration: {args.key} updated to: '{args.value.strip()}'")
+    if args.key in BOOLEAN_KEYS:
+        try:
+            value = parse_boolean(args.value)
+        except ValueError:
+            logger.error(f"Invalid value for {args.key}. Must be true or false.")
+            return
+        setattr(config, args.key, value)
+        config.save()
+        logger.info(f"Configuration: {args.key} updated to: {value}")
+
+
+def metadata_list_cli(args):
+    config = CameraConfig()
+    cache = MetadataCache.from_config(config)
+    for url, metadata in cache.items():
+        age_hours = (datetime.now().timestamp() - metadata.updated) / 3600
+        stale = ' (stale)' if cache.is_stale(metadata) else ''
+        print(f"{url}\n    title: {metadata.title}\n    coordinates: {metadata.coordinates}"
+              f"\n    age: {age_hours:.1f} hours{stale}")
+
+
+def metadata_refresh_cli(args):
+    from camera import http_client
+    from camera.kenya_capture import fetch_camera_metadata
+
+    config = CameraConfig()
+    http_client.configure(config)
+    cache = MetadataCache.from_config(config)
+    if args.url:
+        urls = [args.url]
+    else:
+        urls = [camera.url for camera in load_urls_from_file(config)]
+    for url in urls:
+        metadata = fetch_camera_metadata(url, config.parser_backend)
+        if metadata is None:
+            logger.error(f"Unable to refresh metadata for {url}")
+            continue
+        cache.put(url, metadata)
+        logger.info(f"Metadata refreshed for {url}: {metadata.title}")
+    cache.save()
+
+
+def status_cli(args):
+    config = CameraConfig()
+    health = HealthRegistry.from_config(config)
+    cameras = health.items()
+    if not cameras:
+        print("No camera status available yet.")
+        return
+    for url, status in sorted(cameras, key=lambda item: (item[1].state == CLOSED, item[0])):
+        print(f"{url}\n    status: {status.state}, consecutive failures: {status.failures}")
+        if status.last_success:
+            print(f"    last success: {datetime.fromtimestamp(status.last_success):%Y-%m-%d %H:%M}")
+        if status.failures:
+            print(f"    last error: {status.last_error}")
+        if status.state == OPEN:
+            print(f"    next try: {datetime.fromtimestamp(status.next_probe):%Y-%m-%d %H:%M}")
+
+
+def index_cli(args):
+    config = CameraConfig()
+    catalog = Catalog.from_config(config)
+    print(f"Indexing the images in {config.image_save_path} ...")
+    added = catalog.import_tree(compute_hash=not args.no_hash)
+    catalog.close()
+    print(f"{added} images added to the catalog")
+
+
+def query_latest_cli(args):
+    catalog = Catalog.from_config(CameraConfig())
+    frames = catalog.latest(args.station)
+    if not frames:
+        print("No frames in the catalog.")
+    for frame in frames:
+        print(f"{frame.station}: {frame.slot}  {frame.path}")
+
+
+def query_frames_cli(args):
+    catalog = Catalog.from_config(CameraConfig())
+    for frame in catalog.frames(args.station, datetime.now() - timedelta(days=args.days)):
+        size = f"{frame.width}x{frame.height}" if frame.width else ''
+        print(f"{frame.slot}  {frame.status:<9}  {size:>9}  {frame.path or frame.source_url or ''}")
+
+
+def query_missed_cli(args):
+    config = CameraConfig()
+    catalog = Catalog.from_config(config)
+    since = datetime.now() - timedelta(days=args.days)
+    cameras = [camera for camera in load_urls_from_file(config)
+               if args.station is None or camera.location == args.station]
+    for camera in cameras:
+        missed = catalog.missed_slots(camera.location, camera_schedule(camera, config), since)
+        if not missed:
+            continue
+        print(f"{camera.location}: {len(missed)} missed slots")
+        if args.station:
+            for slot in missed:
+                print(f"    {slot:%Y-%m-%d %H:%M}")
+
+
+def gaps_cli(args):
+    config = CameraConfig()
+    since = datetime.now() - timedelta(days=args.days)
+    cameras = [camera for camera in load_urls_from_file(config)
+               if args.station is None or camera.location == args.station]
+    catalog = Catalog.from_config(config) if args.catalog else None
+    all_gaps = find_all_gaps(config, cameras, since, catalog=catalog)
+    for gaps in all_gaps:
+        if not gaps.missed and gaps.current is None:
+            continue
+        current = f", current slot {gaps.current:%H:%M} not captured yet" if gaps.current else ''
+        print(f"{gaps.station}: {len(gaps.missed)} missed slots{current}")
+        if args.station:
+            for slot in gaps.missed:
+                print(f"    {slot:%Y-%m-%d %H:%M}")
+    if args.backfill:
+        from camera import http_client
+
+        http_client.configure(config)
+        captured = backfill(all_gaps, config, args.use_async)
+        print(f"{len(captured)} stations captured")
+
+
+def archive_pack_cli(args):
+    config = CameraConfig()
+    before = date.today() - timedelta(days=args.days - 1)
+    station_names = [args.station] if args.station else stations(config.image_save_path)
+    catalog = Catalog.from_config(config)
+    results = archive_all(config.image_save_path, station_names, before, args.workers or config.workers, catalog,
+                          args.keep, args.timelapse)
+    catalog.close()
+    archived = [result for result in results if result.frames]
+    failed = [result for result in results if result.error]
+    for result in failed:
+        print(f"{result.station} {result.day}: {result.error}")
+    print(f"{len(archived)} days archived with {sum(result.frames for result in archived)} frames, "
+          f"{sum(result.removed for result in results)} files removed, {len(failed)} days failed")
+
+
+def archive_extract_cli(args):
+    archive = Path(args.archive)
+    if not args.name:
+        for name, (_, size, _) in read_index(archive).items():
+            print(f"{name}  {size}")
+        return
+    output = Path(args.output or args.name)
+    output.write_bytes(read_frame(archive, args.name))
+    print(f"Extracted {args.name} to {output}")
+
+
+def retention_cli(args):
+    config = CameraConfig()
+    if not config.retention_full_days and not (config.retention_move_days and config.secondary_path):
+        print("No retention policy configured (see retention_full_days and retention_move_days).")
+        return
+    station_names = [args.station] if args.station else stations(config.image_save_path)
+    catalog = None if args.dry_run else Catalog.from_config(config)
+    reports = apply_all(config, station_names, catalog=catalog, dry_run=args.dry_run)
+    if catalog is not None:
+        catalog.close()
+    verb = 'would be' if args.dry_run else 'were'
+    for report in reports:
+        for error in report.errors:
+            print(f"{report.station}: {error}")
+        if report.days or report.moved:
+            print(f"{report.station}: {report.removed} frames of {report.days} days {verb} removed "
+                  f"({format_bytes(report.reclaimed)}), {report.moved} days {verb} moved "
+                  f"({format_bytes(report.moved_bytes)})")
+    print(f"Total: {sum(report.removed for report in reports)} frames {verb} removed, "
+          f"{format_bytes(sum(report.reclaimed for report in reports))} {verb} freed; "
+          f"{sum(report.moved for report in reports)} days {verb} moved, "
+          f"{format_bytes(sum(report.moved_bytes for report in reports))}")
 
 
 def cli_parser() -> argparse.ArgumentParser:
@@ -61,6 +268,91 @@ def cli_parser() -> argparse.ArgumentParser:
         'run-repeat-no-limit', help='Repeat capturing images from cameras at specified intervals indefinitely')
     repeat_day_parser = subparsers.add_parser(
         'run-repeat', help='Repeat capturing images from cameras at specified intervals for the current day')
+    supervise_parser = subparsers.add_parser(
+        'supervise', help='Capture repeatedly with the cameras spread over a number of worker processes')
+    supervise_parser.add_argument('--processes', type=int, default=2, help='Number of worker processes (default 2)')
+    supervise_parser.add_argument('--shard-by', choices=SHARD_MODES, default=SHARD_BY_URL,
+                                  help='Spread the cameras by their URL (default) or by the host of their page')
+    supervise_parser.add_argument('--no-limit', action='store_true',
+                                  help='Capture indefinitely instead of for the current day')
+    for run_parser in (runonce_parser, repeat_parser, repeat_day_parser, supervise_parser):
+        run_parser.add_argument('--async', dest='use_async', action='store_true',
+                                help='Capture with the asyncio pipeline, overlapping downloads, parsing and saving')
+
+    # Status subcommand
+    status_parser = subparsers.add_parser('status', help='Show the health of the cameras')
+    status_parser.set_defaults(func=status_cli)
+
+    # Index subcommand
+    index_parser = subparsers.add_parser('index', help='Add the images that are already saved to the catalog')
+    index_parser.add_argument('--no-hash', action='store_true',
+                              help='Do not compute the content hashes of the images, which is faster')
+    index_parser.set_defaults(func=index_cli)
+
+    # Query subcommand
+    query_parser = subparsers.add_parser('query', help='Answer questions from the catalog of saved frames')
+    query_subparsers = query_parser.add_subparsers(dest='Query', required=True)
+
+    # query latest
+    latest_parser = query_subparsers.add_parser('latest', help='Show the latest frame of every station')
+    latest_parser.add_argument('--station', type=str, default=None, help='Only show this station')
+    latest_parser.set_defaults(func=query_latest_cli)
+
+    # query frames
+    frames_parser = query_subparsers.add_parser('frames', help='List the frames of a station')
+    frames_parser.add_argument('station', type=str, help='Station (location name)')
+    frames_parser.add_argument('--days', type=float, default=1, help='Number of days to look back (default 1)')
+    frames_parser.set_defaults(func=query_frames_cli)
+
+    # query missed
+    missed_parser = query_subparsers.add_parser('missed', help='Show the cameras that missed capture slots')
+    missed_parser.add_argument('--days', type=float, default=7, help='Number of days to look back (default 7)')
+    missed_parser.add_argument('--station', type=str, default=None, help='Only this station, listing the slots')
+    missed_parser.set_defaults(func=query_missed_cli)
+
+    # Gaps subcommand
+    gaps_parser = subparsers.add_parser('gaps', help='Show the capture slots that were missed per station')
+    gaps_parser.add_argument('--days', type=float, default=7, help='Number of days to look back (default 7)')
+    gaps_parser.add_argument('--station', type=str, default=None, help='Only this station, listing the slots')
+    gaps_parser.add_argument('--catalog', action='store_true',
+                             help='Use the catalog instead of the image folders (needed with dedup_mode skip)')
+    gaps_parser.add_argument('--backfill', action='store_true',
+                             help='Capture the stations that are not captured in the current slot yet')
+    gaps_parser.add_argument('--async', dest='use_async', action='store_true',
+                             help='Backfill with the asyncio pipeline')
+    gaps_parser.set_defaults(func=gaps_cli)
+
+    # Archive subcommand
+    archive_parser = subparsers.add_parser('archive', help='Pack the frames of completed days into archives')
+    archive_subparsers = archive_parser.add_subparsers(dest='Archive', required=True)
+
+    # archive pack
+    pack_parser = archive_subparsers.add_parser('pack', help='Pack the frames of every station per day')
+    pack_parser.add_argument('--days', type=int, default=1,
+                             help='Number of days, including today, that are not packed (default 1)')
+    pack_parser.add_argument('--station', type=str, default=None, help='Only pack this station')
+    pack_parser.add_argument('--workers', type=int, default=0,
+                             help='Number of stations packed at the same time (default: the workers setting)')
+    pack_parser.add_argument('--keep', action='store_true', help='Keep the original files')
+    pack_parser.add_argument('--timelapse', action='store_true',
+                             help='Also make a time-lapse video of every day (needs ffmpeg)')
+    pack_parser.set_defaults(func=archive_pack_cli)
+
+    # archive extract
+    extract_parser = archive_subparsers.add_parser('extract', help='List the frames of an archive or extract one')
+    extract_parser.add_argument('archive', type=str, help='The archive (.tar) file')
+    extract_parser.add_argument('name', type=str, nargs='?', default=None, help='Name of the frame to extract')
+    extract_parser.add_argument('-o', '--output', type=str, default=None,
+                                help='File to extract the frame to (default: the name of the frame)')
+    extract_parser.set_defaults(func=archive_extract_cli)
+
+    # Retention subcommand
+    retention_parser = subparsers.add_parser(
+        'retention', help='Thin out the frames of older days and move old days, following the retention policy')
+    retention_parser.add_argument('--dry-run', action='store_true',
+                                  help='Only report the frames that would be removed and the bytes this frees')
+    retention_parser.add_argument('--station', type=str, default=None, help='Only this station')
+    retention_parser.set_defaults(func=retention_cli)
 
     # Config subcommand
     config_parser = subparsers.add_parser('config', help='Manage configuration settings')
@@ -76,4 +368,19 @@ def cli_parser() -> argparse.ArgumentParser:
     update_parser.add_argument('value', type=str, help='New value for the configuration key')
     update_parser.set_defaults(func=update_cli)
 
+    # Metadata subcommand
+    metadata_parser = subparsers.add_parser('metadata', help='Manage the cache of camera metadata')
+    metadata_subparsers = metadata_parser.add_subparsers(dest='Metadata', required=True)
+
+    # metadata list
+    metadata_list_parser = metadata_subparsers.add_parser('list', help='List the cached camera metadata')
+    metadata_list_parser.set_defaults(func=metadata_list_cli)
+
+    # metadata refresh
+    refresh_parser = metadata_subparsers.add_parser(
+        'refresh', help='Retrieve the camera metadata again, regardless of its age')
+    refresh_parser.add_argument('--url', type=str, default=None,
+                                help='Only refresh the camera with this page URL')
+    refresh_parser.set_defaults(func=metadata_refresh_cli)
+
     return parser
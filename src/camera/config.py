@@ -8,6 +8,78 @@ logger = logging.getLogger(__name__)
 
 CONFIG_FILE = Path.home() / 'camera.config'
 
+# How to handle a frame that is identical to a recent frame of the same station
+DEDUP_OFF = 'off'
+DEDUP_SKIP = 'skip'
+DEDUP_HARDLINK = 'hardlink'
+DEDUP_MODES = (DEDUP_OFF, DEDUP_SKIP, DEDUP_HARDLINK)
+
+# Backends to extract the camera information from a camera page
+PARSER_AUTO = 'auto'
+PARSER_STREAM = 'stream'
+PARSER_LXML = 'lxml'
+PARSER_BS4 = 'bs4'
+PARSER_BACKENDS = (PARSER_AUTO, PARSER_STREAM, PARSER_LXML, PARSER_BS4)
+
+# When saved images are flushed to disk (see image_writer)
+DURABILITY_NONE = 'none'
+DURABILITY_FILE = 'file'
+DURABILITY_CYCLE = 'cycle'
+DURABILITY_MODES = (DURABILITY_NONE, DURABILITY_FILE, DURABILITY_CYCLE)
+
+# How the supervisor spreads the cameras over its worker processes (see supervisor)
+SHARD_BY_HOST = 'host'
+SHARD_BY_URL = 'url'
+SHARD_MODES = (SHARD_BY_HOST, SHARD_BY_URL)
+
+# Numeric configuration keys with their type and allowed (inclusive) range
+NUMERIC_KEYS = {
+    'workers': (int, 1, 64),
+    'per_host_limit': (int, 1, 32),
+    'connect_timeout': (float, 1, 60),
+    'read_timeout': (float, 1, 300),
+    'retries': (int, 0, 10),
+    'backoff_factor': (float, 0, 10),
+    'metadata_ttl': (int, 1, 24 * 365),
+    'dedup_history': (int, 1, 100),
+    'max_image_size': (int, 0, 1024 * 1024),
+    'failure_threshold': (int, 1, 100),
+    'max_probe_interval': (int, 1, 24 * 30),
+    'change_threshold': (float, 0, 100),
+    'retention_full_days': (int, 0, 100 * 365),
+    'retention_thin_days': (int, 0, 100 * 365),
+    'retention_thin_interval': (int, 1, 24 * 60),
+    'retention_move_days': (int, 0, 100 * 365),
+}
+
+# Configuration keys with a fixed set of allowed values
+CHOICE_KEYS = {
+    'dedup_mode': DEDUP_MODES,
+    'parser_backend': PARSER_BACKENDS,
+    'durability': DURABILITY_MODES,
+}
+
+# Configuration keys with a free text value; an empty value is given as ""
+STRING_KEYS = ('metrics_file', 'prometheus_file', 'secondary_path')
+
+# Time of day configuration keys, given as HH:MM
+TIME_KEYS = ('start', 'end', 'retention_daily_time')
+
+# Boolean configuration keys, and the values accepted for them
+BOOLEAN_KEYS = ('conditional_requests',)
+TRUE_VALUES = ('true', 'yes', 'on', '1')
+FALSE_VALUES = ('false', 'no', 'off', '0')
+
+
+def parse_boolean(value) -> bool:
+    """The boolean of a configuration value: a JSON boolean or one of TRUE_VALUES or FALSE_VALUES."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text not in TRUE_VALUES + FALSE_VALUES:
+        raise ValueError(f"invalid boolean '{value}'")
+    return text in TRUE_VALUES
+
 
 @dataclass
 class CameraConfig:
@@ -17,6 +89,30 @@ class CameraConfig:
     interval: int = 30  # in minutes
     locations_file: str = field(default_factory=lambda: 'camera_locations.txt')
     verbose: bool = False  # Whether to print verbose output
+    workers: int = 1  # number of cameras captured at the same time; 1 captures sequentially
+    per_host_limit: int = 4  # maximum number of simultaneous captures from a single host
+    connect_timeout: float = 5.0  # in seconds
+    read_timeout: float = 20.0  # in seconds
+    retries: int = 3  # number of retries for failed web requests
+    backoff_factor: float = 0.5  # base of the exponential backoff between retries, in seconds
+    metadata_ttl: int = 168  # in hours; camera metadata older than this is retrieved again
+    conditional_requests: bool = True  # only download pages and images that changed (ETag / Last-Modified)
+    dedup_mode: str = DEDUP_HARDLINK  # one of DEDUP_MODES
+    dedup_history: int = 8  # number of frame hashes remembered per station
+    parser_backend: str = PARSER_AUTO  # one of PARSER_BACKENDS
+    max_image_size: int = 10240  # in kB; larger images are not downloaded, 0 means no limit
+    failure_threshold: int = 3  # consecutive failures before a camera is no longer captured every slot
+    max_probe_interval: int = 24  # in hours; longest time between probes of a failing camera
+    metrics_file: str = 'capture_metrics.jsonl'  # JSON Lines file with the metrics of every capture cycle
+    prometheus_file: str = ''  # Prometheus textfile with the metrics of the last capture cycle
+    durability: str = DURABILITY_NONE  # one of DURABILITY_MODES
+    change_threshold: float = 0.0  # in percent; nearly identical frames are saved as a reference, 0 is off
+    retention_full_days: int = 0  # in days; all frames are kept this long, 0 keeps all frames forever
+    retention_thin_days: int = 0  # in days; after the full days, one frame per thin interval is kept this long
+    retention_thin_interval: int = 60  # in minutes
+    retention_daily_time: time = time(hour=12, minute=0)  # the frame kept of older days
+    retention_move_days: int = 0  # in days; older days are moved to the secondary path, 0 is never
+    secondary_path: str = ''  # folder for old days, such as a larger, slower disk
 
     # Add a mapping for user-friendly descriptions
     FIELD_DESCRIPTIONS = {
@@ -25,12 +121,55 @@ class CameraConfig:
         "end": "End time for capturing images (HH:MM)",
         "interval": "Interval in minutes between captures (15 to 360 minutes)",
         "locations_file": "Name of the file containing the names of camera locations and their URLs",
-        "verbose": "Enable verbose output for debugging and information"
+        "verbose": "Enable verbose output for debugging and information",
+        "workers": "Number of cameras captured at the same time (1 = one after the other)",
+        "per_host_limit": "Maximum number of simultaneous captures from a single host",
+        "connect_timeout": "Timeout in seconds for connecting to a camera web server",
+        "read_timeout": "Timeout in seconds for waiting on data from a camera web server",
+        "retries": "Number of retries for failed web requests (connection errors and server errors)",
+        "backoff_factor": "Base delay in seconds of the exponential backoff between retries",
+        "metadata_ttl": "Time in hours before cached camera metadata (title, coordinates) is retrieved again",
+        "conditional_requests": "Only download camera pages and images that changed since the previous capture",
+        "dedup_mode": "Handling of frames identical to a recent frame: off, skip (not saved) or hardlink",
+        "dedup_history": "Number of recent frames per station checked for duplicates",
+        "parser_backend": "Backend to extract information from the camera pages: auto, stream, lxml or bs4",
+        "max_image_size": "Maximum size in kB of a camera image; the download of larger images is aborted "
+                          "(0 = no limit)",
+        "failure_threshold": "Number of consecutive failures before a camera is only probed now and then",
+        "max_probe_interval": "Longest time in hours between probes of a failing camera",
+        "metrics_file": "File (JSON Lines) to append the timings of every capture cycle to; empty to disable",
+        "prometheus_file": "Prometheus textfile to write the metrics of the last capture cycle to; empty to disable",
+        "durability": "Flushing of saved images to disk: none, file (every image) or cycle (once per capture cycle)",
+        "change_threshold": "Difference in percent below which a frame is saved as a reference to the previous frame "
+                            "(0 = off)",
+        "retention_full_days": "Number of days all frames are kept; older days are thinned (0 = keep all frames)",
+        "retention_thin_days": "Number of days after retention_full_days that one frame per "
+                               "retention_thin_interval is kept",
+        "retention_thin_interval": "Minutes between the frames kept of thinned days",
+        "retention_daily_time": "Time (HH:MM) of the one frame kept per day after the thinned days",
+        "retention_move_days": "Age in days of the day folders moved to secondary_path (0 = never)",
+        "secondary_path": "Folder that old days are moved to (see retention_move_days); empty for none"
     }
 
     def __post_init__(self):
+        self.shard = ''     # name of the shard of a worker process of the supervisor, not saved
+        self.verbose_option = False     # --verbose on the command line: verbose also when the file is reloaded
         self.load()
 
+    @property
+    def shared_state_folder(self) -> Path:
+        '''Folder for the state shared by all capture processes, such as the catalog.'''
+        return self.image_save_path / '.capture'
+
+    @property
+    def state_folder(self) -> Path:
+        '''Folder for the state kept between capture runs, such as caches.
+           Every worker process of the supervisor has its own, so they do not overwrite each other's state.
+        '''
+        if self.shard:
+            return self.shared_state_folder / self.shard
+        return self.shared_state_folder
+
     def _create_default_config(self):
         '''Create a default configuration file; assumes it does not exist.'''
         save_folder = Path.home() / 'camera_images'
@@ -41,13 +180,40 @@ class CameraConfig:
             'start': self.start.strftime('%H:%M'),
             'end': self.end.strftime('%H:%M'),
             'interval': self.interval,
-            'verbose': self.verbose
+            'verbose': self.verbose,
+            'workers': self.workers,
+            'per_host_limit': self.per_host_limit,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'retries': self.retries,
+            'backoff_factor': self.backoff_factor,
+            'metadata_ttl': self.metadata_ttl,
+            'conditional_requests': self.conditional_requests,
+            'dedup_mode': self.dedup_mode,
+            'dedup_history': self.dedup_history,
+            'parser_backend': self.parser_backend,
+            'max_image_size': self.max_image_size,
+            'failure_threshold': self.failure_threshold,
+            'max_probe_interval': self.max_probe_interval,
+            'metrics_file': self.metrics_file,
+            'prometheus_file': self.prometheus_file,
+            'durability': self.durability,
+            'change_threshold': self.change_threshold,
+            'retention_full_days': self.retention_full_days,
+            'retention_thin_days': self.retention_thin_days,
+            'retention_thin_interval': self.retention_thin_interval,
+            'retention_daily_time': self.retention_daily_time.strftime('%H:%M'),
+            'retention_move_days': self.retention_move_days,
+            'secondary_path': self.secondary_path
         }
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(default_config, f, indent=4)
         logger.info(f"Captured images will be stored in '{save_folder}'.")
 
-    def load(self):
+    def load(self, strict: bool = False):
+        """Load the configuration file. An invalid value is logged and the remaining values keep
+           their current value, unless strict: then the ValueError or TypeError is raised.
+        """
         if not CONFIG_FILE.exists():
             logger.warning(f"Config file '{CONFIG_FILE}' does not exist. Creating default config.")
             self._create_default_config()
@@ -60,8 +226,46 @@ class CameraConfig:
                 self.start = time.fromisoformat(config_data.get('start', '06:30'))
                 self.end = time.fromisoformat(config_data.get('end', '18:30'))
                 self.interval = config_data.get('interval', 30)
-                self.verbose = config_data.get('verbose', False)
+                self.verbose = config_data.get('verbose', False) or self.verbose_option
+                self.workers = int(config_data.get('workers', 1))
+                self.per_host_limit = int(config_data.get('per_host_limit', 4))
+                self.connect_timeout = float(config_data.get('connect_timeout', 5.0))
+                self.read_timeout = float(config_data.get('read_timeout', 20.0))
+                self.retries = int(config_data.get('retries', 3))
+                self.backoff_factor = float(config_data.get('backoff_factor', 0.5))
+                self.metadata_ttl = int(config_data.get('metadata_ttl', 168))
+                self.conditional_requests = parse_boolean(config_data.get('conditional_requests', True))
+                dedup_mode = config_data.get('dedup_mode', DEDUP_HARDLINK)
+                if dedup_mode not in DEDUP_MODES:
+                    raise ValueError(f"invalid dedup mode '{dedup_mode}'")
+                self.dedup_mode = dedup_mode
+                self.dedup_history = int(config_data.get('dedup_history', 8))
+                parser_backend = config_data.get('parser_backend', PARSER_AUTO)
+                if parser_backend not in PARSER_BACKENDS:
+                    raise ValueError(f"invalid parser backend '{parser_backend}'")
+                self.parser_backend = parser_backend
+                self.max_image_size = int(config_data.get('max_image_size', 10240))
+                self.failure_threshold = int(config_data.get('failure_threshold', 3))
+                self.max_probe_interval = int(config_data.get('max_probe_interval', 24))
+                self.metrics_file = config_data.get('metrics_file', 'capture_metrics.jsonl')
+                self.prometheus_file = config_data.get('prometheus_file', '')
+                durability = config_data.get('durability', DURABILITY_NONE)
+                if durability not in DURABILITY_MODES:
+                    raise ValueError(f"invalid durability '{durability}'")
+                self.durability = durability
+                self.change_threshold = float(config_data.get('change_threshold', 0.0))
+                self.retention_full_days = int(config_data.get('retention_full_days', 0))
+                self.retention_thin_days = int(config_data.get('retention_thin_days', 0))
+                retention_thin_interval = int(config_data.get('retention_thin_interval', 60))
+                if retention_thin_interval < 1:
+                    raise ValueError(f"invalid retention thin interval {retention_thin_interval}")
+                self.retention_thin_interval = retention_thin_interval
+                self.retention_daily_time = time.fromisoformat(config_data.get('retention_daily_time', '12:00'))
+                self.retention_move_days = int(config_data.get('retention_move_days', 0))
+                self.secondary_path = config_data.get('secondary_path', '')
             except (ValueError, TypeError) as e:
+                if strict:
+                    raise
                 logger.error(f"Error loading configuration: {e}. Using default values.")
 
     def save(self):
@@ -71,7 +275,31 @@ class CameraConfig:
             'end': self.end.strftime('%H:%M'),
             'interval': self.interval,
             'locations_file': self.location_file,
-            'verbose': self.verbose
+            'verbose': self.verbose,
+            'workers': self.workers,
+            'per_host_limit': self.per_host_limit,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'retries': self.retries,
+            'backoff_factor': self.backoff_factor,
+            'metadata_ttl': self.metadata_ttl,
+            'conditional_requests': self.conditional_requests,
+            'dedup_mode': self.dedup_mode,
+            'dedup_history': self.dedup_history,
+            'parser_backend': self.parser_backend,
+            'max_image_size': self.max_image_size,
+            'failure_threshold': self.failure_threshold,
+            'max_probe_interval': self.max_probe_interval,
+            'metrics_file': self.metrics_file,
+            'prometheus_file': self.prometheus_file,
+            'durability': self.durability,
+            'change_threshold': self.change_threshold,
+            'retention_full_days': self.retention_full_days,
+            'retention_thin_days': self.retention_thin_days,
+            'retention_thin_interval': self.retention_thin_interval,
+            'retention_daily_time': self.retention_daily_time.strftime('%H:%M'),
+            'retention_move_days': self.retention_move_days,
+            'secondary_path': self.secondary_path
         }
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, indent=4)
@@ -0,0 +1,78 @@
+'''
+dedup.py
+This module detects frames that are exact duplicates of a recently saved frame of the same station,
+for instance from a camera that is stuck or offline and keeps serving the same image.
+For each station the content hashes (BLAKE2b) of the last saved frames are kept in an index
+in the state folder. Depending on the dedup mode a duplicate frame is either not saved at all ('skip')
+or saved as a hard link to the earlier file ('hardlink'), so it does not take any extra disk space.
+'''
+
+import hashlib
+import logging
+from pathlib import Path
+from camera.config import CameraConfig, DEDUP_OFF
+from camera.state_store import JsonStateStore
+
+logger = logging.getLogger(__name__)
+
+DEDUP_FILE = 'frame_hashes.json'
+
+
+def new_image_hash():
+    """Hash object for the content hash of a frame, for hashing the data incrementally."""
+    return hashlib.blake2b(digest_size=16)
+
+
+def image_digest(img_data: bytes) -> str:
+    image_hash = new_image_hash()
+    image_hash.update(img_data)
+    return image_hash.hexdigest()
+
+
+def format_bytes(size: int) -> str:
+    for unit in ('bytes', 'kB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == 'bytes' else f"{size:.1f} {unit}"
+
+
+class DedupIndex:
+    """Per station index of the hashes of the last saved frames."""
+
+    def __init__(self, path: Path, mode: str, history: int = 8):
+        self._store = JsonStateStore(path)
+        self.mode = mode
+        self.history = max(1, history)
+        self.duplicates = 0
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'DedupIndex':
+        return cls(config.state_folder / DEDUP_FILE, config.dedup_mode, config.dedup_history)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != DEDUP_OFF
+
+    def find(self, station: str, digest: str) -> Path | None:
+        """Return the earlier file of the station with the same content hash, if it still exists."""
+        for known_digest, filename in self._store.get(station, []):
+            if known_digest == digest and Path(filename).exists():
+                return Path(filename)
+        return None
+
+    def add(self, station: str, digest: str, filename: Path) -> None:
+        entries = [entry for entry in self._store.get(station, []) if entry[0] != digest]
+        entries.append([digest, str(filename)])
+        self._store.set(station, entries[-self.history:])
+
+    def record_duplicate(self, size: int) -> None:
+        self.duplicates += 1
+        self.bytes_saved += size
+
+    def summary(self) -> str:
+        return f"Duplicate frames: {self.duplicates}, disk space saved: {format_bytes(self.bytes_saved)}"
+
+    def save(self) -> None:
+        self._store.save()
@@ -0,0 +1,141 @@
+'''
+gaps.py
+This module finds the capture slots that were missed, for instance because a camera failed or the
+computer was off, by comparing the slots of the schedule of every camera with the frames on disk.
+The frames are found by listing the folder of every day once (station/year/month/day), the capture
+minute is taken from the file name, so no file is opened or inspected; for an archived day the names
+are read from the index of the archive (see archive). A slot counts as captured
+when a frame was captured within one interval after the slot.
+Stations that have not been captured in the current slot yet can be captured at once (backfill),
+as the camera sites only serve the latest image.
+Classes:
+    StationGaps
+        The missed slots of a station.
+Functions:
+    find_gaps(images_root, camera, schedule, since, until) -> StationGaps
+    find_all_gaps(config, cameras, since, until, catalog) -> list[StationGaps]
+    backfill(gaps, config, use_async) -> list[CameraLocation]
+'''
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+import logging
+import os
+from pathlib import Path
+from typing import Sequence
+from camera.archive import ARCHIVE_SUFFIX, numbered_folders, read_index
+from camera.camera_locations import CameraLocation
+from camera.camera_schedule import CameraSchedule, camera_schedule
+from camera.catalog import Catalog, CAPTURED, FRAME_NAME, expected_slots, uncaptured_slots
+from camera.config import CameraConfig
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StationGaps:
+    camera: CameraLocation
+    missed: list[datetime] = field(default_factory=list)   # slots without a frame, local time
+    current: datetime | None = None     # start of the current slot when it has no frame yet
+
+    @property
+    def station(self) -> str:
+        return self.camera.location
+
+
+def day_folder(images_root: Path, station: str, day: date) -> Path:
+    """Folder of the frames of the station of the day (see capture_functions.update_folder_tree)."""
+    return images_root / station / str(day.year) / str(day.month) / str(day.day)
+
+
+def frame_times(images_root: Path, station: str, day: date) -> list[datetime]:
+    """The capture minutes of the frames of the station of the day, from the names in the day folder."""
+    folder = day_folder(images_root, station, day)
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    for archive in [name for name in names if name.endswith(ARCHIVE_SUFFIX) and not name.startswith('.')]:
+        try:
+            names += read_index(folder / archive)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Unable to read the index of archive {folder / archive}: {e}")
+    times = []
+    for name in names:
+        match = None if name.startswith('.') else FRAME_NAME.match(name)
+        if match:
+            times.append(datetime.strptime(match['stamp'], '%Y%m%d_%H%M'))
+    return sorted(times)
+
+
+def first_day(images_root: Path, station: str) -> date | None:
+    """The first day with a folder of the station."""
+    station_folder = images_root / station
+    for year in numbered_folders(station_folder):
+        for month in numbered_folders(station_folder / str(year)):
+            days = numbered_folders(station_folder / str(year) / str(month))
+            if days:
+                return date(year, month, days[0])
+    return None
+
+
+def current_slot(schedule: CameraSchedule, now: datetime) -> datetime | None:
+    """The slot that may still be captured now, as one interval after the slot has not passed."""
+    interval = timedelta(minutes=schedule.interval)
+    slots = expected_slots(schedule, now - interval, now)
+    return slots[-1] if slots and slots[-1] + interval > now else None
+
+
+def find_gaps(images_root: Path, camera: CameraLocation, schedule: CameraSchedule, since: datetime,
+              until: datetime | None = None) -> StationGaps:
+    """The slots of the camera from since until until without a frame on disk.
+       Days before the first folder of the station are not counted.
+    """
+    until = until or datetime.now()
+    gaps = StationGaps(camera)
+    first = first_day(images_root, camera.location)
+    if first is None:
+        return gaps
+    since = max(since, datetime.combine(first, datetime.min.time()))
+    interval = timedelta(minutes=schedule.interval)
+    captured = []
+    day = since.date()
+    while day <= until.date() + timedelta(days=1):     # a frame of the last slot can be on the next day
+        captured += frame_times(images_root, camera.location, day)
+        day += timedelta(days=1)
+    current = current_slot(schedule, until)
+    slots = [slot for slot in expected_slots(schedule, since, until) if slot != current]
+    gaps.missed = uncaptured_slots(slots, captured, interval)
+    if current is not None and uncaptured_slots([current], captured, interval):
+        gaps.current = current
+    return gaps
+
+
+def find_all_gaps(config: CameraConfig, cameras: Sequence[CameraLocation], since: datetime,
+                  until: datetime | None = None, catalog: Catalog | None = None) -> list[StationGaps]:
+    """The gaps of the cameras, from the frames on disk or, when given, from the catalog."""
+    until = until or datetime.now()
+    all_gaps = []
+    for camera in cameras:
+        schedule = camera_schedule(camera, config)
+        if catalog is None:
+            gaps = find_gaps(config.image_save_path, camera, schedule, since, until)
+        else:
+            gaps = StationGaps(camera, catalog.missed_slots(camera.location, schedule, since, until))
+            current = current_slot(schedule, until)
+            if current is not None and not any(frame.status in CAPTURED
+                                               for frame in catalog.frames(camera.location, current, until)):
+                gaps.current = current
+        all_gaps.append(gaps)
+    return all_gaps
+
+
+def backfill(all_gaps: Sequence[StationGaps], config: CameraConfig, use_async: bool = False) -> list[CameraLocation]:
+    """Capture the stations without a frame in their current slot; return the captured cameras."""
+    from camera.capture import capture_all
+
+    cameras = [gaps.camera for gaps in all_gaps if gaps.current is not None]
+    if cameras:
+        logger.info(f"Capturing {len(cameras)} stations that missed the current slot")
+        capture_all(cameras, config, use_async)
+    return cameras
@@ -0,0 +1,176 @@
+'''
+http_client.py
+This module provides the HTTP client layer shared by all web requests of the capture app.
+All requests go through a single requests.Session, so connections to a web server are pooled
+and kept alive between cameras. Every request has a connect and read timeout, and failed requests
+(connection errors and 5xx responses) are retried with exponential backoff plus random jitter.
+Functions:
+    configure(config: CameraConfig) -> requests.Session
+        (Re)create the shared session using the HTTP settings from the configuration.
+    get_session() -> requests.Session
+        Return the shared session, creating one with default settings if needed.
+    http_get(url: str, **kwargs) -> requests.Response
+        GET request using the shared session and the configured timeouts.
+    http_head(url: str, **kwargs) -> requests.Response
+        HEAD request using the shared session and the configured timeouts.
+    conditional_get(url: str, validators: ValidatorCache | None, **kwargs) -> requests.Response
+        GET request that sends the stored ETag / Last-Modified validators of the URL, if any.
+Classes:
+    ValidatorCache
+        Persistent store of the ETag / Last-Modified response headers per URL.
+    NotModified
+        Exception signalling that a resource did not change since the previous request (HTTP 304).
+'''
+
+import logging
+from pathlib import Path
+import random
+import threading
+from typing import Any
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from camera.config import CameraConfig
+from camera.state_store import JsonStateStore
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0"
+VALIDATORS_FILE = 'http_validators.json'
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+DEFAULT_CONNECT_TIMEOUT = 5.0   # seconds
+DEFAULT_READ_TIMEOUT = 20.0     # seconds
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_SIZE = 10
+
+_session: requests.Session | None = None
+_timeout: tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_lock = threading.Lock()
+
+
+class JitterRetry(Retry):
+    """Retry policy that adds a random jitter to the exponential backoff,
+       so cameras that failed at the same moment do not retry in lockstep.
+    """
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return backoff + random.uniform(0, backoff / 2)
+
+
+def create_session(retries: int = DEFAULT_RETRIES, backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                   pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    """Create a session with connection pooling, retries and the common User-Agent."""
+    retry = JitterRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+
+def configure(config: CameraConfig) -> requests.Session:
+    """Replace the shared session with one that uses the HTTP settings in the configuration."""
+    global _session, _timeout
+    # the asyncio pipeline downloads up to per_host_limit images of a host at the same time (see async_pipeline)
+    pool_size = max(DEFAULT_POOL_SIZE, config.workers, config.per_host_limit)
+    session = create_session(config.retries, config.backoff_factor, pool_size)
+    with _lock:
+        old_session = _session
+        _session = session
+        _timeout = (config.connect_timeout, config.read_timeout)
+    if old_session is not None:
+        old_session.close()
+    logger.debug(f"HTTP client: timeout={_timeout}, retries={config.retries}, pool size={pool_size}")
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', _timeout)
+    return get_session().get(url, **kwargs)
+
+
+def http_head(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', _timeout)
+    return get_session().head(url, **kwargs)
+
+
+class NotModified(Exception):
+    """Exception to signal that a resource is unchanged since the previous request."""
+
+    def __init__(self, url: str):
+        super().__init__(f"Not modified: {url}")
+        self.url = url
+
+
+class ValidatorCache:
+    """Persistent store of the ETag and Last-Modified headers per URL, used for conditional requests.
+       Extra information can be stored with the validators of a URL, for instance the image URL
+       found on a page, so it is still known when the page is not downloaded again.
+    """
+
+    def __init__(self, path: Path):
+        self._store = JsonStateStore(path)
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'ValidatorCache':
+        return cls(config.state_folder / VALIDATORS_FILE)
+
+    def get(self, url: str) -> dict[str, Any]:
+        return self._store.get(url, {})
+
+    def request_headers(self, url: str) -> dict[str, str]:
+        entry = self.get(url)
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url: str, response: requests.Response, **extra) -> None:
+        """Remember the validators of a (200) response; without validators the entry is removed."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            self._store.pop(url)
+            return
+        self._store.set(url, {'etag': etag, 'last_modified': last_modified, **extra})
+
+    def forget(self, url: str) -> None:
+        self._store.pop(url)
+
+    def save(self) -> None:
+        self._store.save()
+
+
+def conditional_get(url: str, validators: ValidatorCache | None, **kwargs) -> requests.Response:
+    """GET request with If-None-Match / If-Modified-Since headers when validators of the URL are known.
+       The caller must handle a 304 (Not Modified) response.
+    """
+    if validators is not None:
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(validators.request_headers(url))
+        kwargs['headers'] = headers
+    return http_get(url, **kwargs)
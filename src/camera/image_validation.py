@@ -0,0 +1,181 @@
+'''
+image_validation.py
+This module checks that a downloaded image is a complete image before it is saved, and reads its
+dimensions and the time the camera took it from the image headers, without decoding the image.
+Cameras and their web servers do not always serve what they claim: an HTML error page or an empty
+response may be sent as image/jpeg, and an image may be cut off when the connection drops.
+An image is valid when it starts with the signature of a JPEG, PNG, GIF or WebP image and is complete:
+a JPEG ends with the EOI marker, a PNG with the IEND chunk, a GIF with its trailer and a WebP has the
+size in its RIFF header. Only the first HEAD_SIZE and the last TAIL_SIZE bytes are needed, so an image
+that is streamed to disk can be checked on the fly.
+Classes:
+    ImageInfo
+        The format, dimensions and time taken of a valid image.
+    InvalidImage
+        Exception raised for data that is not a complete image.
+Functions:
+    inspect_image(head, tail, size) -> ImageInfo
+    read_image_info(path) -> ImageInfo | None
+'''
+
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+import struct
+
+HEAD_SIZE = 64 * 1024   # the EXIF data (APP1 segment) of a JPEG is at most 64 kB
+TAIL_SIZE = 64
+
+JPEG = 'jpeg'
+PNG = 'png'
+GIF = 'gif'
+WEBP = 'webp'
+
+# JPEG start of frame markers, with the dimensions of the image (not DHT, JPG and DAC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+TIFF_DATETIME = 0x0132
+EXIF_TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    format: str
+    width: int | None = None
+    height: int | None = None
+    taken: datetime | None = None   # the time in the EXIF data, in the time of the camera
+
+
+class InvalidImage(Exception):
+    """Exception to signal that the data is not a complete image."""
+    pass
+
+
+def _ifd(tiff: bytes, offset: int, order: str) -> dict[int, tuple[int, int, bytes]]:
+    """The entries (tag: type, count, value or offset) of the TIFF image file directory at offset."""
+    count, = struct.unpack_from(order + 'H', tiff, offset)
+    entries = {}
+    for index in range(count):
+        tag, kind, number = struct.unpack_from(order + 'HHI', tiff, offset + 2 + index * 12)
+        start = offset + 2 + index * 12 + 8
+        entries[tag] = (kind, number, tiff[start:start + 4])
+    return entries
+
+
+def _exif_time(tiff: bytes) -> datetime | None:
+    """The time the image was taken, from the EXIF (TIFF) data of a JPEG APP1 segment."""
+    order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if order is None:
+        return None
+    try:
+        ifd0 = _ifd(tiff, struct.unpack_from(order + 'I', tiff, 4)[0], order)
+        entries = []
+        if EXIF_IFD in ifd0:
+            exif = _ifd(tiff, struct.unpack(order + 'I', ifd0[EXIF_IFD][2])[0], order)
+            entries.append(exif.get(EXIF_DATETIME_ORIGINAL))
+        entries.append(ifd0.get(TIFF_DATETIME))
+        for entry in entries:
+            if entry is None:
+                continue
+            _, count, value = entry
+            if count > 4:
+                offset = struct.unpack(order + 'I', value)[0]
+                value = tiff[offset:offset + count]
+            text = value.split(b'\0', 1)[0].decode('ascii').strip()
+            if text:
+                return datetime.strptime(text, EXIF_TIME_FORMAT)
+    except (struct.error, UnicodeDecodeError, ValueError):
+        pass
+    return None
+
+
+def _jpeg_info(head: bytes) -> ImageInfo:
+    """Walk the segments of the JPEG header up to the frame header (SOF) or the image data (SOS)."""
+    width = height = taken = None
+    pos = 2
+    while pos + 4 <= len(head) and head[pos] == 0xFF:
+        marker = head[pos + 1]
+        if marker == 0xFF:      # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:    # markers without a segment
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+        length, = struct.unpack_from('>H', head, pos + 2)
+        segment = head[pos + 4:pos + 2 + length]
+        if marker == 0xE1 and taken is None and segment.startswith(b'Exif\0\0'):
+            taken = _exif_time(segment[6:])
+        elif marker in SOF_MARKERS and len(segment) >= 5:
+            height, width = struct.unpack_from('>HH', segment, 1)
+            break
+        pos += 2 + length
+    return ImageInfo(JPEG, width, height, taken)
+
+
+def _webp_info(head: bytes) -> ImageInfo:
+    chunk = head[12:16]
+    if chunk == b'VP8X' and len(head) >= 30:
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+    elif chunk == b'VP8 ' and len(head) >= 30:
+        width, height = (value & 0x3FFF for value in struct.unpack_from('<HH', head, 26))
+    elif chunk == b'VP8L' and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], 'little')
+        width, height = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    else:
+        width = height = None
+    return ImageInfo(WEBP, width, height)
+
+
+def inspect_image(head: bytes, tail: bytes | None = None, size: int | None = None) -> ImageInfo:
+    """
+    Check that the data is a complete image and read the information in its headers.
+    InvalidImage is raised when it is not.
+
+    :param head: the first HEAD_SIZE bytes of the image (or all of it).
+    :param tail: the last bytes of the image; by default the head is the complete image.
+    :param size: the size of the image in bytes; by default the size of the head.
+    """
+    tail = head[-TAIL_SIZE:] if tail is None else tail
+    size = len(head) if size is None else size
+    if size == 0:
+        raise InvalidImage("empty image")
+    if head.startswith(b'\xff\xd8'):
+        # a JPEG may be followed by some padding
+        if not tail.rstrip(b'\0\r\n').endswith(b'\xff\xd9'):
+            raise InvalidImage("truncated JPEG image, the end of image marker is missing")
+        return _jpeg_info(head)
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        if not tail.endswith(b'IEND\xaeB`\x82'):
+            raise InvalidImage("truncated PNG image, the IEND chunk is missing")
+        width, height = struct.unpack_from('>II', head, 16) if head[12:16] == b'IHDR' else (None, None)
+        return ImageInfo(PNG, width, height)
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        if not tail.endswith(b';'):
+            raise InvalidImage("truncated GIF image, the trailer is missing")
+        width, height = struct.unpack_from('<HH', head, 6) if len(head) >= 10 else (None, None)
+        return ImageInfo(GIF, width, height)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        if struct.unpack_from('<I', head, 4)[0] + 8 > size:
+            raise InvalidImage("truncated WebP image")
+        return _webp_info(head)
+    if head.lstrip()[:1] == b'<':
+        raise InvalidImage("not an image but an HTML or XML document")
+    raise InvalidImage("unknown image format")
+
+
+def read_image_info(path: Path) -> ImageInfo | None:
+    """The information of the image file, or None when it is not a valid image."""
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_SIZE)
+        size = f.seek(0, 2)
+        f.seek(max(0, size - TAIL_SIZE))
+        tail = f.read()
+    try:
+        return inspect_image(head, tail, size)
+    except InvalidImage:
+        return None
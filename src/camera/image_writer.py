@@ -0,0 +1,127 @@
+'''
+image_writer.py
+This module decides where and how durably the captured images are written to disk.
+Images are saved in a folder per station and day (station/year/month/day). The folders that exist are
+remembered for the current day, so the folder is only checked (and created) for the first image of a
+station per day instead of for every image.
+The durability decides when the saved images are flushed to disk, as the computers in the field may
+lose power at any moment:
+    none    the operating system writes the images when it sees fit (fastest; the images of the last
+            minute(s) may be lost or truncated on power loss)
+    file    every image is flushed (fsync) before it gets its final name, and its folder after; an image
+            with its final name is always complete, but every image waits for the disk
+    cycle   the images and their folders are flushed once at the end of each capture cycle; the images
+            of the last cycle may be lost on power loss, with a fraction of the flushes of 'file'
+Classes:
+    ImageWriter
+        The folders and the flushing of the saved images.
+'''
+
+from datetime import date
+import logging
+import os
+from pathlib import Path
+import threading
+from camera.config import CameraConfig, DURABILITY_NONE, DURABILITY_FILE, DURABILITY_CYCLE, DURABILITY_MODES
+
+logger = logging.getLogger(__name__)
+
+
+def fsync_path(path: Path) -> None:
+    """Flush the file or folder to disk. Folders can not be flushed on Windows, they are skipped."""
+    if os.name == 'nt' and os.path.isdir(path):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ImageWriter:
+    """The folders of the saved images and the flushing of the images to disk.
+       Images are saved from worker threads, so the writer is thread safe.
+    """
+
+    def __init__(self, durability: str = DURABILITY_NONE):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"invalid durability '{durability}'")
+        self.durability = durability
+        self._lock = threading.Lock()
+        self._day: date | None = None
+        self._folders: set[Path] = set()            # folders of the day that exist
+        self._pending_files: dict[Path, None] = {}  # saved since the last flush, in order
+        self._pending_folders: set[Path] = set()
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'ImageWriter':
+        return cls(config.durability)
+
+    @property
+    def pending(self) -> int:
+        """Number of saved images that are not flushed yet (durability cycle)."""
+        return len(self._pending_files)
+
+    def folder(self, images_root: Path, station: str) -> Path:
+        """The folder of the images of the station of today, created if needed."""
+        today = date.today()
+        tree_path = images_root / station / str(today.year) / str(today.month) / str(today.day)
+        with self._lock:
+            if self._day != today:
+                self._day = today
+                self._folders.clear()
+            if tree_path in self._folders:
+                return tree_path
+        created = []
+        path = tree_path
+        while not path.exists():
+            created.append(path)
+            path = path.parent
+        if created:
+            tree_path.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Created image folder: {tree_path}")
+            # the new folders are entries of their parent folders
+            self._saved_entries(created[::-1])
+        with self._lock:
+            self._folders.add(tree_path)
+        return tree_path
+
+    def _saved_entries(self, paths: list[Path]) -> None:
+        if self.durability == DURABILITY_NONE:
+            return
+        for path in paths:
+            if self.durability == DURABILITY_FILE:
+                fsync_path(path.parent)
+            else:
+                with self._lock:
+                    self._pending_folders.add(path.parent)
+
+    def prepare(self, path: Path) -> None:
+        """Called with the temporary file of an image before it gets its final name."""
+        if self.durability == DURABILITY_FILE:
+            fsync_path(path)
+
+    def saved(self, path: Path) -> None:
+        """Called with the final name of an image after it was renamed or linked."""
+        if self.durability == DURABILITY_CYCLE:
+            with self._lock:
+                self._pending_files[path] = None
+        self._saved_entries([path])
+
+    def flush(self) -> int:
+        """Flush the images saved since the previous flush and their folders to disk (durability cycle).
+           Returns the number of images flushed.
+        """
+        with self._lock:
+            files, self._pending_files = list(self._pending_files), {}
+            folders, self._pending_folders = sorted(self._pending_folders), set()
+        for path in files:
+            try:
+                fsync_path(path)
+            except FileNotFoundError:   # removed in the meantime
+                pass
+        for folder in folders:
+            fsync_path(folder)
+        if files or folders:
+            logger.debug(f"Flushed {len(files)} images and {len(folders)} folders to disk")
+        return len(files)
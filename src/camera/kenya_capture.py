@@ -5,8 +5,20 @@ specifically for Kenya camera feeds. It includes utilities to find camera names,
 descriptions, Google Earth links, coordinates, and the latest image URLs from HTML content.
 It also provides a main capture function to retrieve the latest image and its URL.
 Functions:
-    capture(page_url: str) -> tuple[bytes, str] | tuple[None, None]
+    capture(page_url: str, metadata_cache: MetadataCache | None, validators: ValidatorCache | None,
+            parser_backend: str, download_folder: Path | None, max_image_size: int)
+            -> tuple[bytes | DownloadedImage, str] | tuple[None, None]
         Main function to capture the latest image and its URL from a given camera page URL.
+    fetch_camera_page(page_url: str, metadata_cache: MetadataCache | None, validators: ValidatorCache | None)
+            -> CameraPage | None
+        Retrieve the camera page, the first step of capture.
+    find_camera_image(page: CameraPage, metadata_cache: MetadataCache | None, validators: ValidatorCache | None,
+                      parser_backend: str) -> str | None
+        Extract the image URL and the metadata from the camera page, the second step of capture.
+    fetch_camera_metadata(page_url: str, parser_backend: str) -> CameraMetadata | None
+        Retrieve the camera page and collect the camera metadata from it.
+    extract_with_soup(html: str, metadata: bool) -> PageInfo
+        The BeautifulSoup extraction backend ('bs4'), see kenya_page_parser for the other backends.
 Internal functions:
     find_camera_name(soup: BeautifulSoup) -> str
         Extracts the camera name from the HTML soup by locating the appropriate comment and its following <h5> tag.
@@ -18,14 +30,32 @@ Internal functions:
         Finds and returns the Google Earth link from the HTML soup, if present.
     get_camera_coordinates(soup: BeautifulSoup) -> tuple[float, float] | None
         Retrieves the camera's latitude and longitude by expanding the Google Earth short link found in the HTML.
+    expand_google_earth_link(link: str) -> tuple[float, float] | None
+        Retrieves the camera's latitude and longitude by expanding a Google Earth short link.
     get_latest_image_url(soup: BeautifulSoup) -> str
         Finds and returns the URL of the latest camera image from the HTML soup.
+    get_page(page_url: str, validators: ValidatorCache | None) -> requests.Response | None
+        Retrieves the camera page, conditionally when validators are given; None when the page is not accessible.
+    extract_page(response: requests.Response, backend: str, metadata: bool) -> PageInfo
+        Extracts the camera information from the camera page with the selected backend.
+    collect_camera_metadata(soup: BeautifulSoup) -> CameraMetadata
+        Collects the title, name, description and coordinates of the camera from the HTML soup.
+    collect_page_metadata(info: PageInfo) -> CameraMetadata
+        Collects the title, name, description and coordinates of the camera from the extracted page information.
 '''
 
+from dataclasses import dataclass
 import logging
 import requests
 from bs4 import BeautifulSoup
-from camera.capture_functions import retrieve_image
+from pathlib import Path
+from camera.capture_functions import retrieve_image, download_image, DownloadedImage
+from camera.http_client import conditional_get, http_head, NotModified, ValidatorCache
+from camera.metadata_cache import CameraMetadata, MetadataCache
+from camera.kenya_page_parser import PageInfo, extract_page_info, is_latest_image, register_extractor
+from camera.config import PARSER_AUTO, PARSER_BS4
+from camera.page_encoding import resolve_encoding
+from camera import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -90,14 +120,21 @@ def get_camera_coordinates(soup: BeautifulSoup) -> tuple[float, float] | None:
     """
 
     # first look for the google earth link
-    link = find_google_earth_link(soup)
+    return expand_google_earth_link(find_google_earth_link(soup))
+
+
+def expand_google_earth_link(link: str) -> tuple[float, float] | None:
+    """Expand the Google Earth short link to get the full URL, which contains the coordinates."""
     if not link:
         logger.warning("No Google Earth link found.")
         return None
 
     # expand the shortened URL to get the full URL
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.head(link, allow_redirects=True, headers=headers)
+    try:
+        response = http_head(link, allow_redirects=True)
+    except requests.RequestException as e:
+        logger.warning(f"Unable to expand Google Earth link '{link}': {e}")
+        return None
 
     # find the coordinates in the expanded URL
     params = response.url.split('@')
@@ -120,36 +157,172 @@ def get_latest_image_url(soup: BeautifulSoup) -> str:
     for img_tag in img_tags:
         if 'src' in img_tag.attrs:
             img_url = img_tag['src']
-            if ('upload' in img_url) or ('stream' in img_url):
-                logger.info(f"Found image: {img_url}")
+            if is_latest_image(img_url):
                 break
 
-    if img_url is None:
-        logger.info(f"No image found")
-
     return img_url
 
 
-def capture(page_url: str) -> tuple[bytes, str] | tuple[None, None]:
-    response = requests.get(page_url)
+def extract_with_soup(html: str, metadata: bool = True) -> PageInfo:
+    """Extraction backend using a full BeautifulSoup parse of the page."""
+    soup = BeautifulSoup(html, 'html.parser')
+    info = PageInfo(image_url=get_latest_image_url(soup))
+    if metadata:
+        info.title = find_camera_title(soup)
+        info.name = find_camera_name(soup)
+        info.description = find_camera_description(soup)
+        info.google_earth_link = find_google_earth_link(soup)
+    return info
+
+
+register_extractor(PARSER_BS4, extract_with_soup)
+
+
+def collect_page_metadata(info: PageInfo) -> CameraMetadata:
+    with metrics.timed('metadata'):
+        coordinates = expand_google_earth_link(info.google_earth_link)
+    if coordinates:
+        try:
+            coordinates = (float(coordinates[0]), float(coordinates[1]))
+        except ValueError:
+            logger.warning(f"Invalid coordinates: {coordinates}")
+            coordinates = None
+    return CameraMetadata(title=info.title,
+                          name=info.name,
+                          description=info.description,
+                          coordinates=coordinates)
+
+
+def collect_camera_metadata(soup: BeautifulSoup) -> CameraMetadata:
+    info = PageInfo(title=find_camera_title(soup),
+                    name=find_camera_name(soup),
+                    description=find_camera_description(soup),
+                    google_earth_link=find_google_earth_link(soup))
+    return collect_page_metadata(info)
+
+
+def get_page(page_url: str, validators: ValidatorCache | None = None) -> requests.Response | None:
+    """Retrieve the camera page; returns None when the page is not accessible.
+       With validators the request is conditional, and NotModified is raised when the page did not change.
+    """
+    try:
+        with metrics.timed('page'):
+            response = conditional_get(page_url, validators)
+    except requests.RequestException as e:
+        logger.error(f'Unable to access "{page_url}": {e}')
+        return None
+    metrics.record('page_wait', response.elapsed.total_seconds())
+    metrics.add_bytes(page=len(response.content))
+    if response.status_code == 304:
+        raise NotModified(page_url)
     if response.status_code != 200:
         logger.error(f'Unable to access "{page_url}"')
-        return (None, None)
+        return None
+    return response
 
-    # make sure to use the correct encoding
-    response.encoding = response.apparent_encoding
-    soup = BeautifulSoup(response.text, 'html.parser')
 
-    collect = {}
-    station_name = find_camera_title(soup)
-    logger.info(f"Camera Name:, {station_name}")
-    collect['name'] = station_name
-    collect['url'] = page_url
+def extract_page(response: requests.Response, backend: str = PARSER_AUTO, metadata: bool = True) -> PageInfo:
+    with metrics.timed('parse'):
+        # make sure to use the correct encoding
+        response.encoding = resolve_encoding(response)
+        return extract_page_info(response.text, backend, metadata)
 
-    lat_lon = get_camera_coordinates(soup)
 
-    img_url = get_latest_image_url(soup)
+def fetch_camera_metadata(page_url: str, parser_backend: str = PARSER_AUTO) -> CameraMetadata | None:
+    response = get_page(page_url)
+    if response is None:
+        return None
+    return collect_page_metadata(extract_page(response, parser_backend))
+
+
+@dataclass
+class CameraPage:
+    """A retrieved camera page; the response is None when the page did not change,
+       the image URL found on the page before is used then.
+    """
+    page_url: str
+    response: requests.Response | None = None
+    metadata: CameraMetadata | None = None
+    img_url: str | None = None
+
+
+def fetch_camera_page(page_url: str, metadata_cache: MetadataCache | None = None,
+                      validators: ValidatorCache | None = None) -> CameraPage | None:
+    """Retrieve the camera page, conditionally when validators are given; None when the page is not accessible.
+       When the server reports the page unchanged but no image URL of the page is known, the page is
+       retrieved again unconditionally.
+    """
+    # the metadata is only collected from the page when it is not in the cache (or stale)
+    metadata = metadata_cache.get(page_url) if metadata_cache else None
+
+    # an unchanged page is not downloaded again, unless the metadata must be collected from it
+    page_validators = validators if (metadata is not None or metadata_cache is None) else None
+    try:
+        response = get_page(page_url, page_validators)
+    except NotModified:
+        img_url = validators.get(page_url).get('img_url')
+        if img_url:
+            logger.info(f'Page unchanged: "{page_url}"')
+            return CameraPage(page_url, metadata=metadata, img_url=img_url)
+        # the image URL of the page is not known (any more), so the page must be parsed after all
+        logger.info(f'Page unchanged but its image is unknown, retrieving it again: "{page_url}"')
+        response = get_page(page_url)
+    if response is None:
+        return None
+    return CameraPage(page_url, response, metadata)
+
+
+def find_camera_image(page: CameraPage, metadata_cache: MetadataCache | None = None,
+                      validators: ValidatorCache | None = None, parser_backend: str = PARSER_AUTO) -> str | None:
+    """Extract the image URL (and the metadata, when not cached) from the camera page."""
+    img_url = page.img_url
+    metadata = page.metadata
+    if page.response is not None:
+        info = extract_page(page.response, parser_backend, metadata=metadata is None)
+        if metadata is None:
+            metadata = collect_page_metadata(info)
+            if metadata_cache:
+                metadata_cache.put(page.page_url, metadata)
+        img_url = info.image_url
+        if validators is not None:
+            if img_url:
+                validators.update(page.page_url, page.response, img_url=img_url)
+            else:
+                validators.forget(page.page_url)
+    if not img_url:
+        logger.info("No image found")
+        return None
+    if metadata:
+        logger.info(f"Camera Name:, {metadata.title}")
+    logger.info(f"Found image: {img_url}")
+    return img_url
+
+
+def capture(page_url: str, metadata_cache: MetadataCache | None = None, validators: ValidatorCache | None = None,
+            parser_backend: str = PARSER_AUTO, download_folder: Path | None = None,
+            max_image_size: int = 0) -> tuple[bytes | DownloadedImage, str] | tuple[None, None]:
+    """
+    Capture the latest image of the camera page.
+    With validators, the page and the image are requested conditionally: an unchanged page is not parsed
+    (the image URL found previously is used), and NotModified is raised when the image did not change.
+
+    :param page_url: URL of the camera page.
+    :param metadata_cache: cache of the camera metadata, the metadata is only collected when not in the cache.
+    :param validators: ETag / Last-Modified validators of previous requests.
+    :param parser_backend: backend to extract the information from the page, see kenya_page_parser.
+    :param download_folder: when given, the image is streamed into a temporary file in this folder
+        and returned as DownloadedImage instead of bytes.
+    :param max_image_size: maximum size of the image in bytes when streaming; 0 means no limit.
+    :return: the image data (or downloaded image) and the image URL, or (None, None) on failure.
+    """
+    page = fetch_camera_page(page_url, metadata_cache, validators)
+    img_url = find_camera_image(page, metadata_cache, validators, parser_backend) if page else None
+    if not img_url:
+        return (None, None)
 
-    img_data = retrieve_image(img_url)
+    if download_folder is not None:
+        img_data = download_image(img_url, download_folder, validators, max_image_size)
+    else:
+        img_data = retrieve_image(img_url, validators)
 
     return img_data, img_url
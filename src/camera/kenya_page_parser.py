@@ -0,0 +1,231 @@
+'''
+kenya_page_parser.py
+This module extracts the camera information from the HTML of a Kenya camera page in a single pass.
+The pages are made from a Dreamweaver template: the title, name and description of the camera follow the
+'InstanceBeginEditable' comment markers of the template, the latest image is the first <img> with 'upload'
+or 'stream' in its URL, and the coordinates are behind a link with the text 'Google Earth'.
+
+The extraction backend is pluggable:
+    auto    lxml when it is installed, otherwise stream (the default)
+    stream  a streaming parser based on html.parser.HTMLParser (standard library); it stops as soon as
+            all requested information is found
+    lxml    uses the lxml HTML parser, when lxml is installed
+    bs4     builds a full BeautifulSoup tree; registered by kenya_capture, it serves as the reference
+All backends produce the same PageInfo as the BeautifulSoup based functions in kenya_capture.
+Functions:
+    extract_page_info(html: str, backend: str, metadata: bool) -> PageInfo
+        Extract the camera information from the page HTML.
+    register_extractor(name: str, extractor: Callable[[str, bool], PageInfo]) -> None
+        Register an extraction backend.
+'''
+
+from dataclasses import dataclass
+from functools import lru_cache
+from html.parser import HTMLParser
+import logging
+from typing import Callable
+from camera.config import PARSER_AUTO, PARSER_STREAM, PARSER_LXML
+
+logger = logging.getLogger(__name__)
+
+# the comment markers of the template, the field they identify, and the tag containing the field
+MARKERS = (
+    ('InstanceBeginEditable name="webcamtitle"', 'title', 'h3'),
+    ('InstanceBeginEditable name="locationinfo"', 'name', 'h5'),
+    ('InstanceBeginEditable name="notes"', 'description', 'p'),
+)
+GOOGLE_EARTH_TEXT = "Google Earth"
+
+
+@dataclass
+class PageInfo:
+    title: str = ''
+    name: str = ''
+    description: str = ''
+    google_earth_link: str = ''
+    image_url: str | None = None
+
+
+def is_latest_image(src: str) -> bool:
+    return ('upload' in src) or ('stream' in src)
+
+
+class _StopParsing(Exception):
+    pass
+
+
+class CameraPageParser(HTMLParser):
+    """Streaming extractor of the camera information.
+       Texts are collected like BeautifulSoup's get_text(strip=True): every text piece is stripped
+       and the pieces are joined without separator.
+    """
+
+    def __init__(self, metadata: bool = True):
+        super().__init__(convert_charrefs=True)
+        self.info = PageInfo()
+        self.metadata = metadata
+        self._image_found = False
+        self._link_found = False
+        self._markers = list(MARKERS) if metadata else []
+        self._waiting: dict[str, str] = {}          # tag -> field, marker seen but tag not yet
+        self._collecting: list[list] = []           # [field, tag, depth, pieces]
+        self._links: list[list] = []                # [href, pieces] of the open <a> tags
+        self._done_fields: set[str] = set()
+
+    def _check_markers(self, text: str) -> None:
+        for marker in list(self._markers):
+            if marker[0] in text:
+                self._markers.remove(marker)
+                _, field, tag = marker
+                self._waiting.setdefault(tag, field)
+
+    def _check_done(self) -> None:
+        if not self._image_found:
+            return
+        if self.metadata and (len(self._done_fields) < len(MARKERS) or not self._link_found):
+            return
+        raise _StopParsing()
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'img' and not self._image_found:
+            for name, value in attrs:
+                if name == 'src':
+                    self.info.image_url = value or ''
+                    self._image_found = is_latest_image(self.info.image_url)
+                    break
+        if not self.metadata:
+            self._check_done()
+            return
+        for entry in self._collecting:
+            if entry[1] == tag:
+                entry[2] += 1
+        if tag in self._waiting:
+            self._collecting.append([self._waiting.pop(tag), tag, 1, []])
+        if tag == 'a' and not self._link_found:
+            href = next((value or '' for name, value in attrs if name == 'href'), None)
+            self._links.append([href, []])
+        self._check_done()
+
+    def handle_endtag(self, tag):
+        if not self.metadata:
+            return
+        for entry in list(self._collecting):
+            if entry[1] == tag:
+                entry[2] -= 1
+                if entry[2] == 0:
+                    self._finish_field(entry)
+        if tag == 'a' and self._links:
+            href, pieces = self._links.pop()
+            if not self._link_found and href is not None and ''.join(pieces) == GOOGLE_EARTH_TEXT:
+                self.info.google_earth_link = href
+                self._link_found = True
+                self._links.clear()
+        self._check_done()
+
+    def _finish_field(self, entry: list) -> None:
+        field, _, _, pieces = entry
+        self._collecting.remove(entry)
+        setattr(self.info, field, ''.join(pieces))
+        self._done_fields.add(field)
+
+    def handle_data(self, data):
+        if self._markers:
+            self._check_markers(data)
+        text = data.strip()
+        if not text:
+            return
+        for entry in self._collecting:
+            entry[3].append(text)
+        for link in self._links:
+            link[1].append(text)
+
+    def handle_comment(self, data):
+        if self._markers:
+            self._check_markers(data)
+
+    def close(self):
+        super().close()
+        # unclosed elements end with the document
+        for entry in list(self._collecting):
+            self._finish_field(entry)
+
+
+def extract_stream(html: str, metadata: bool = True) -> PageInfo:
+    parser = CameraPageParser(metadata)
+    try:
+        parser.feed(html)
+        parser.close()
+    except _StopParsing:
+        pass
+    return parser.info
+
+
+def extract_lxml(html: str, metadata: bool = True) -> PageInfo:
+    import lxml.html
+    from lxml.etree import Comment
+
+    info = PageInfo()
+    markers = list(MARKERS) if metadata else []
+    waiting: dict[str, str] = {}
+    image_found = False
+    link_found = not metadata
+    for node in lxml.html.fromstring(html).iter():
+        if node.tag is Comment:
+            for marker in list(markers):
+                if marker[0] in (node.text or ''):
+                    markers.remove(marker)
+                    waiting.setdefault(marker[2], marker[1])
+            continue
+        if node.tag == 'img' and not image_found and 'src' in node.attrib:
+            info.image_url = node.get('src')
+            image_found = is_latest_image(info.image_url)
+        elif node.tag in waiting:
+            setattr(info, waiting.pop(node.tag), ''.join(text.strip() for text in node.itertext()))
+        elif node.tag == 'a' and not link_found and 'href' in node.attrib:
+            if ''.join(text.strip() for text in node.itertext()) == GOOGLE_EARTH_TEXT:
+                info.google_earth_link = node.get('href')
+                link_found = True
+        if image_found and link_found and not markers and not waiting:
+            break
+    return info
+
+
+EXTRACTORS: dict[str, Callable[[str, bool], PageInfo]] = {
+    PARSER_STREAM: extract_stream,
+    PARSER_LXML: extract_lxml,
+}
+
+
+def register_extractor(name: str, extractor: Callable[[str, bool], PageInfo]) -> None:
+    EXTRACTORS[name] = extractor
+
+
+@lru_cache(maxsize=None)
+def lxml_available() -> bool:
+    try:
+        import lxml.html  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def _warn_lxml_missing() -> None:
+    logger.warning("lxml is not installed, using the stream parser")
+
+
+def extract_page_info(html: str, backend: str = PARSER_AUTO, metadata: bool = True) -> PageInfo:
+    """
+    Extract the camera information from the HTML of a camera page.
+
+    :param html: the page HTML.
+    :param backend: name of the extraction backend; falls back to 'stream' when not available.
+    :param metadata: extract title, name, description and Google Earth link as well as the image URL.
+    """
+    if backend == PARSER_AUTO:
+        backend = PARSER_LXML if lxml_available() else PARSER_STREAM
+    elif backend == PARSER_LXML and not lxml_available():
+        _warn_lxml_missing()
+        backend = PARSER_STREAM
+    extractor = EXTRACTORS.get(backend, extract_stream)
+    return extractor(html, metadata)
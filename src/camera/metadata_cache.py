@@ -0,0 +1,80 @@
+'''
+metadata_cache.py
+This module caches the descriptive information of the cameras (title, name, description and coordinates).
+This information hardly ever changes, while resolving the coordinates requires following the redirects
+of a Google Earth short link. The cache is stored in the state folder below the image root, keyed by
+the URL of the camera page. Entries older than the configured time to live are resolved again.
+'''
+
+from dataclasses import dataclass, asdict
+import logging
+from pathlib import Path
+from time import time
+from camera.config import CameraConfig
+from camera.state_store import JsonStateStore
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = 'camera_metadata.json'
+
+
+@dataclass
+class CameraMetadata:
+    title: str = ''
+    name: str = ''
+    description: str = ''
+    coordinates: tuple[float, float] | None = None
+    updated: float = 0.0  # time of retrieval, seconds since the epoch
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'CameraMetadata':
+        coordinates = data.get('coordinates')
+        return cls(title=data.get('title', ''),
+                   name=data.get('name', ''),
+                   description=data.get('description', ''),
+                   coordinates=tuple(coordinates) if coordinates else None,
+                   updated=data.get('updated', 0.0))
+
+
+class MetadataCache:
+    """Persistent cache of camera metadata, keyed by camera page URL."""
+
+    def __init__(self, path: Path, ttl_hours: float):
+        self._store = JsonStateStore(path)
+        self.ttl = ttl_hours * 3600
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'MetadataCache':
+        return cls(config.state_folder / METADATA_FILE, config.metadata_ttl)
+
+    def is_stale(self, metadata: CameraMetadata, now: float | None = None) -> bool:
+        now = time() if now is None else now
+        return now - metadata.updated > self.ttl
+
+    def get(self, page_url: str) -> CameraMetadata | None:
+        """Return the cached metadata, or None when it is missing or stale."""
+        data = self._store.get(page_url)
+        if data is None:
+            return None
+        metadata = CameraMetadata.from_dict(data)
+        if self.is_stale(metadata):
+            logger.info(f"Metadata for '{page_url}' is stale")
+            return None
+        return metadata
+
+    def put(self, page_url: str, metadata: CameraMetadata) -> None:
+        if not metadata.updated:
+            metadata.updated = time()
+        self._store.set(page_url, asdict(metadata))
+
+    def invalidate(self, page_url: str | None = None) -> None:
+        """Remove one entry, or all entries when no page URL is given."""
+        urls = [page_url] if page_url else list(self._store)
+        for url in urls:
+            self._store.pop(url)
+
+    def items(self) -> list[tuple[str, CameraMetadata]]:
+        return [(url, CameraMetadata.from_dict(data)) for url, data in self._store.items()]
+
+    def save(self) -> None:
+        self._store.save()
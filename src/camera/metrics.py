@@ -0,0 +1,250 @@
+'''
+metrics.py
+This module records how long every step of a camera capture takes, and writes the metrics of every
+capture cycle as JSON Lines (one line per camera and one line with the totals of the cycle).
+Optionally the totals are also written as a Prometheus textfile, for the node exporter textfile collector.
+
+The steps of a capture are timed where they happen (see kenya_capture and capture_functions), and
+added to the timing of the camera that is being captured by the current thread:
+    page_wait   time until the response headers of the page arrived (name lookup, connect, server)
+    page        retrieving the page, including page_wait
+    parse       extracting the image URL and information from the page
+    metadata    collecting the camera metadata (only when not cached)
+    image       retrieving the image
+    save        saving the image
+Functions:
+    timed(stage: str, timing: CaptureTiming | None) -> ContextManager
+        Time a step, for the given timing or the timing of the current capture.
+    measure_capture(location: str, page_url: str) -> ContextManager[CaptureTiming]
+        Create the timing of a capture, the timing of the current capture inside the block.
+    run_with_timing(timing: CaptureTiming | None, func, *args, **kwargs)
+        Call the function with the timing as the timing of the current capture.
+    set_reporter(reporter: Callable[[CycleMetrics], None] | None)
+        Hand the finished cycles to the reporter instead of writing them (the worker processes of the supervisor).
+Classes:
+    CaptureTiming
+        Durations, byte counts and outcome of the capture of one camera.
+    CycleMetrics
+        The timings of all cameras in one capture cycle, with the totals written at the end of the cycle.
+'''
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import tempfile
+from time import perf_counter
+from typing import Callable
+from camera.config import CameraConfig
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('page_wait', 'page', 'parse', 'metadata', 'image', 'save')
+SLOWEST_COUNT = 5
+
+SAVED = 'saved'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+_current: ContextVar['CaptureTiming | None'] = ContextVar('capture_timing', default=None)
+_reporter: 'Callable[[CycleMetrics], None] | None' = None
+
+
+@dataclass
+class CaptureTiming:
+    location: str
+    page_url: str
+    stages: dict[str, float] = field(default_factory=dict)   # seconds per stage
+    page_bytes: int = 0
+    image_bytes: int = 0
+    elapsed: float = 0.0    # seconds from the start of the capture until the image was retrieved
+    outcome: str = ''
+    error: str | None = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @property
+    def total(self) -> float:
+        """Duration of the capture including saving the image, which happens after the capture."""
+        return self.elapsed + self.stages.get('save', 0.0)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Add a duration measured elsewhere to the stage of the current capture."""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str, timing: CaptureTiming | None = None):
+    """Add the duration of the block to the stage, of the given timing or the timing of the current capture."""
+    timing = timing or _current.get()
+    start = perf_counter()
+    try:
+        yield timing
+    finally:
+        if timing is not None:
+            timing.add(stage, perf_counter() - start)
+
+
+@contextmanager
+def measure_capture(location: str, page_url: str):
+    """Create the timing of a capture and make it the timing of the current capture inside the block."""
+    timing = CaptureTiming(location, page_url)
+    token = _current.set(timing)
+    start = perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.elapsed += perf_counter() - start
+        _current.reset(token)
+
+
+def run_with_timing(timing: CaptureTiming | None, func, *args, **kwargs):
+    """Call the function with the timing as the timing of the current capture, for instance in an executor."""
+    token = _current.set(timing)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current.reset(token)
+
+
+def add_bytes(page: int = 0, image: int = 0) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.page_bytes += page
+        timing.image_bytes += image
+
+
+def set_reporter(reporter: 'Callable[[CycleMetrics], None] | None') -> None:
+    """Hand every finished cycle to the reporter instead of writing its metrics; None writes them again."""
+    global _reporter
+    _reporter = reporter
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest rank percentile of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class CycleMetrics:
+    """The timings of the cameras of one capture cycle."""
+
+    def __init__(self, metrics_file: Path | None = None, prometheus_file: Path | None = None):
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        self.timings: list[CaptureTiming] = []
+        self.started = datetime.now()
+        self._start = perf_counter()
+        self.wall_time = 0.0
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'CycleMetrics':
+        return cls(Path(config.metrics_file) if config.metrics_file else None,
+                   Path(config.prometheus_file) if config.prometheus_file else None)
+
+    def add(self, timing: CaptureTiming | None, outcome: str, error: str | None = None) -> None:
+        if timing is None:
+            return
+        timing.outcome = outcome
+        timing.error = error
+        self.timings.append(timing)
+
+    def summary(self) -> dict:
+        outcomes: dict[str, int] = {}
+        for timing in self.timings:
+            outcomes[timing.outcome] = outcomes.get(timing.outcome, 0) + 1
+        stages = {}
+        for stage in STAGES:
+            values = [timing.stages[stage] for timing in self.timings if stage in timing.stages]
+            if values:
+                stages[stage] = {'p50': percentile(values, 0.5), 'p95': percentile(values, 0.95),
+                                 'max': max(values), 'count': len(values)}
+        slowest = sorted((t for t in self.timings if t.outcome != SKIPPED), key=lambda t: t.total, reverse=True)
+        return {
+            'type': 'cycle',
+            'started': self.started.isoformat(timespec='seconds'),
+            'wall_time': self.wall_time,
+            'cameras': len(self.timings),
+            'outcomes': outcomes,
+            'page_bytes': sum(t.page_bytes for t in self.timings),
+            'image_bytes': sum(t.image_bytes for t in self.timings),
+            'stages': stages,
+            'slowest': [{'location': t.location, 'total': t.total} for t in slowest[:SLOWEST_COUNT]],
+        }
+
+    def finish(self) -> dict:
+        """End the cycle: write the metrics and return the totals of the cycle."""
+        self.wall_time = perf_counter() - self._start
+        summary = self.summary()
+        page = summary['stages'].get('page', {})
+        logger.info(f"Capture cycle of {len(self.timings)} cameras took {self.wall_time:.1f} seconds "
+                    f"(page p50 {page.get('p50', 0):.2f}, p95 {page.get('p95', 0):.2f} seconds)")
+        if _reporter is not None:
+            _reporter(self)
+            return summary
+        try:
+            if self.metrics_file:
+                self.write_json_lines(summary)
+            if self.prometheus_file:
+                self.write_prometheus(summary)
+        except OSError as e:
+            logger.error(f"Unable to write the capture metrics: {e}")
+        return summary
+
+    def write_json_lines(self, summary: dict) -> None:
+        started = summary['started']
+        with open(self.metrics_file, 'a', encoding='utf-8') as f:
+            for timing in self.timings:
+                camera = {'type': 'camera', 'cycle': started, **asdict(timing), 'total': timing.total}
+                f.write(json.dumps(camera) + '\n')
+            f.write(json.dumps(summary) + '\n')
+
+    def write_prometheus(self, summary: dict) -> None:
+        lines = [
+            '# HELP camera_capture_cycle_seconds Wall time of the last capture cycle.',
+            '# TYPE camera_capture_cycle_seconds gauge',
+            f'camera_capture_cycle_seconds {summary["wall_time"]:.3f}',
+            '# HELP camera_capture_cameras Number of cameras in the last capture cycle by outcome.',
+            '# TYPE camera_capture_cameras gauge',
+        ]
+        lines += [f'camera_capture_cameras{{outcome="{outcome}"}} {count}'
+                  for outcome, count in sorted(summary['outcomes'].items())]
+        lines += ['# HELP camera_capture_stage_seconds Duration of the capture stages in the last cycle.',
+                  '# TYPE camera_capture_stage_seconds gauge']
+        for stage, values in summary['stages'].items():
+            for quantile in ('p50', 'p95'):
+                lines.append(f'camera_capture_stage_seconds{{stage="{stage}",quantile="0.{quantile[1:]}"}} '
+                             f'{values[quantile]:.3f}')
+        lines += ['# HELP camera_capture_camera_seconds Duration of the capture of each camera in the last cycle.',
+                  '# TYPE camera_capture_camera_seconds gauge']
+        for timing in self.timings:
+            location = timing.location.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'camera_capture_camera_seconds{{location="{location}"}} {timing.total:.3f}')
+        lines += ['# HELP camera_capture_bytes Bytes downloaded in the last capture cycle.',
+                  '# TYPE camera_capture_bytes gauge',
+                  f'camera_capture_bytes{{kind="page"}} {summary["page_bytes"]}',
+                  f'camera_capture_bytes{{kind="image"}} {summary["image_bytes"]}']
+        # write atomically, the collector must never read a half written file
+        folder = self.prometheus_file.parent
+        folder.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=folder, prefix='.', suffix='.prom.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp_name, self.prometheus_file)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
@@ -0,0 +1,75 @@
+'''
+page_encoding.py
+This module determines the character encoding of a downloaded camera page without running the
+(expensive) character set detection on every page. The encoding is taken from, in order:
+    1. the charset in the Content-Type header of the response
+    2. the <meta charset> or <meta http-equiv="Content-Type"> declaration at the start of the page
+    3. the encoding detected before for a page from the same host
+    4. character set detection on the page content (response.apparent_encoding); the result is
+       remembered for the host
+Functions:
+    resolve_encoding(response: requests.Response) -> str
+        Determine the encoding of the response using the layers above.
+'''
+
+import codecs
+import logging
+import re
+import threading
+from urllib.parse import urlsplit
+import requests
+
+logger = logging.getLogger(__name__)
+
+# only the start of the page is searched for a <meta> declaration, like browsers do
+META_SEARCH_LENGTH = 2048
+HEADER_CHARSET = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+_host_encodings: dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def valid_encoding(name: str | bytes | None) -> str | None:
+    """Return the normalized codec name, or None when Python does not know the encoding."""
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode('ascii', errors='ignore')
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def encoding_from_headers(headers) -> str | None:
+    match = HEADER_CHARSET.search(headers.get('Content-Type', ''))
+    return valid_encoding(match.group(1)) if match else None
+
+
+def encoding_from_meta(content: bytes) -> str | None:
+    match = META_CHARSET.search(content[:META_SEARCH_LENGTH])
+    return valid_encoding(match.group(1)) if match else None
+
+
+def resolve_encoding(response: requests.Response) -> str:
+    encoding = encoding_from_headers(response.headers) or encoding_from_meta(response.content)
+    if encoding:
+        return encoding
+
+    host = urlsplit(response.url or '').netloc.lower()
+    with _lock:
+        encoding = _host_encodings.get(host)
+    if encoding:
+        return encoding
+
+    encoding = response.apparent_encoding or 'utf-8'
+    logger.info(f"Detected encoding '{encoding}' for pages from '{host}'")
+    with _lock:
+        _host_encodings[host] = encoding
+    return encoding
+
+
+def clear_host_encodings() -> None:
+    with _lock:
+        _host_encodings.clear()
@@ -0,0 +1,314 @@
+'''
+retention.py
+This module thins out the frames of older days and optionally moves old days to a secondary folder,
+following the retention policy in the configuration:
+    - the frames of the last retention_full_days days are all kept;
+    - of the next retention_thin_days days, the first frame of every retention_thin_interval minutes is kept;
+    - of older days, only the frame nearest to retention_daily_time (noon by default) is kept;
+    - days older than retention_move_days are moved to secondary_path (station/year/month/day as well).
+The policy works on the station/year/month/day folder tree: the day of a frame follows from the names of
+its folders and the capture minute from its name, so only the folders of the days that are thinned are
+listed and only the files that are removed are inspected (for their size). The newest day that was thinned
+per tier is kept per station in the state folder; later runs skip the folders of the days before it, so a
+run only visits the days that moved to another tier since the last run (when days are moved, the image
+folder only holds the recent days and all of them are listed). A day that could not be thinned is tried
+again in the next run, together with the later days of its tier. When the policy changes, all days are
+visited again once. Days that are moved keep the frames of the tier they were in and are not thinned
+anymore, so for thinned days in the secondary folder retention_move_days should be at least
+retention_full_days + retention_thin_days.
+For a reference file of a nearly identical frame (see change_detection) that is kept, the frame it refers to
+is kept as well; a reference file only refers to a frame of its own day. The frames of an archived day (see
+archive) are thinned by extracting the kept frames and packing them again. Removed frames are removed from
+the catalog; the catalog paths of moved days are changed to the secondary folder.
+With dry_run nothing is changed; the report tells the frames that would be removed and the bytes this
+would free (a hard linked file only counts when all its names are removed).
+Classes:
+    RetentionPolicy
+        The retention settings of the configuration.
+    RetentionReport
+        The outcome of applying the policy to a station.
+Functions:
+    select_frames(frames, tier, policy) -> set[str]
+    apply_retention(images_root, station, policy, state, today, catalog, dry_run) -> RetentionReport
+    apply_all(config, station_names, today, catalog, dry_run) -> list[RetentionReport]
+'''
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+import logging
+import os
+from pathlib import Path
+import shutil
+from camera.archive import ARCHIVE_SUFFIX, archive_day, index_path, numbered_folders, read_frame, read_index
+from camera.catalog import Catalog, FRAME_NAME
+from camera.change_detection import REFERENCE_SUFFIX, read_reference
+from camera.config import CameraConfig
+from camera.image_writer import fsync_path
+from camera.state_store import JsonStateStore
+
+logger = logging.getLogger(__name__)
+
+RETENTION_FILE = 'retention.json'
+FULL = 'full'       # all frames are kept
+THIN = 'thin'       # the first frame of every thin interval is kept
+DAILY = 'daily'     # the frame nearest to the daily time is kept
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    full_days: int = 0          # 0: all frames are kept
+    thin_days: int = 0
+    thin_interval: int = 60     # in minutes
+    daily_time: time = time(hour=12)
+    move_days: int = 0          # 0: days are not moved
+    secondary_path: str = ''
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'RetentionPolicy':
+        return cls(config.retention_full_days, config.retention_thin_days, config.retention_thin_interval,
+                   config.retention_daily_time, config.retention_move_days, config.secondary_path)
+
+    @property
+    def thins(self) -> bool:
+        return self.full_days > 0
+
+    @property
+    def moves(self) -> bool:
+        return self.move_days > 0 and bool(self.secondary_path)
+
+    @property
+    def key(self) -> str:
+        """The settings that decide which frames are kept; the state is reset when they change."""
+        return f"{self.full_days}/{self.thin_days}/{self.thin_interval}/{self.daily_time:%H:%M}"
+
+    def tier(self, day: date, today: date) -> str:
+        age = (today - day).days
+        if not self.thins or age < self.full_days:
+            return FULL
+        return THIN if age < self.full_days + self.thin_days else DAILY
+
+
+@dataclass
+class RetentionReport:
+    station: str
+    days: int = 0               # days thinned
+    kept: int = 0               # frames kept of the thinned days
+    removed: int = 0            # frames removed
+    reclaimed: int = 0          # bytes freed by removing frames
+    moved: int = 0              # days moved to the secondary folder
+    moved_bytes: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+def _minute(moment: datetime | time) -> int:
+    return moment.hour * 60 + moment.minute
+
+
+def select_frames(frames: dict[str, datetime], tier: str, policy: RetentionPolicy) -> set[str]:
+    """The names of the frames of a day (name: capture minute) that are kept in the tier.
+       Frames are preferred over reference files of nearly identical frames.
+    """
+    if tier == FULL:
+        return set(frames)
+    ordered = sorted(frames, key=lambda name: (name.endswith(REFERENCE_SUFFIX), frames[name], name))
+    if tier == THIN:
+        kept = {}
+        for name in ordered:
+            kept.setdefault(_minute(frames[name]) // policy.thin_interval, name)
+        return set(kept.values())
+    target = _minute(policy.daily_time)
+    nearest = min(ordered, key=lambda name: (name.endswith(REFERENCE_SUFFIX), abs(_minute(frames[name]) - target)),
+                  default=None)
+    return {nearest} if nearest else set()
+
+
+def _reference_target(folder: Path, name: str, archive: Path | None) -> str | None:
+    """The name of the frame that the reference file refers to, when it is in the same folder."""
+    try:
+        if (folder / name).exists():
+            target = read_reference(folder / name)
+        else:
+            target = folder / read_frame(archive, name).decode('utf-8').strip()
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return target.name if target.parent == folder else None
+
+
+def _reclaimed(paths: list[Path]) -> int:
+    """The bytes freed by removing the files; a hard linked file counts when all its names are removed."""
+    names, sizes = {}, {}
+    for path in paths:
+        try:
+            stat = os.lstat(path)
+        except OSError:
+            continue
+        inode = (stat.st_dev, stat.st_ino)
+        names[inode] = names.get(inode, 0) + 1
+        sizes[inode] = (stat.st_size, stat.st_nlink)
+    return sum(size for inode, (size, links) in sizes.items() if names[inode] >= links)
+
+
+def _archived_reclaimed(index: dict[str, list], removed: set[str]) -> int:
+    """The bytes freed in the archive by removing the frames; a hard linked frame is stored once."""
+    kept = {tuple(entry[:2]) for name, entry in index.items() if name not in removed}
+    dropped = {tuple(entry[:2]) for name, entry in index.items() if name in removed}
+    return sum(size for _, size in dropped - kept)
+
+
+def thin_day(images_root: Path, station: str, day: date, tier: str, policy: RetentionPolicy,
+             report: RetentionReport, catalog: Catalog | None = None, dry_run: bool = False) -> None:
+    """Remove the frames of the station of the day that the tier does not keep."""
+    folder = images_root / station / str(day.year) / str(day.month) / str(day.day)
+    try:
+        names = os.listdir(folder)
+    except OSError as e:
+        report.errors.append(f"{folder}: {e}")
+        return
+    archives = [name for name in names if name.endswith(ARCHIVE_SUFFIX) and not name.startswith('.')]
+    archive = folder / archives[0] if archives else None
+    index = {}
+    if archive is not None:
+        try:
+            index = read_index(archive)
+        except (OSError, ValueError, KeyError) as e:
+            report.errors.append(f"Unable to read the index of archive {archive}: {e}")
+            return
+    frames = {}
+    for name in set(names) | set(index):
+        match = None if name.startswith('.') else FRAME_NAME.match(name)
+        if match:
+            frames[name] = datetime.strptime(match['stamp'], '%Y%m%d_%H%M')
+    kept = select_frames(frames, tier, policy)
+    for name in [name for name in kept if name.endswith(REFERENCE_SUFFIX)]:
+        target = _reference_target(folder, name, archive)
+        if target in frames:
+            kept.add(target)
+    removed = sorted(set(frames) - kept)
+    report.days += 1
+    report.kept += len(kept)
+    report.removed += len(removed)
+    loose = [folder / name for name in removed if name in names]
+    report.reclaimed += _reclaimed(loose) + _archived_reclaimed(index, set(removed))
+    if dry_run or not removed:
+        return
+
+    for path in loose:
+        os.remove(path)
+    if index and set(removed) & set(index):
+        _repack(images_root, station, day, archive, index, kept - set(names), report, catalog)
+    if catalog is not None:
+        relative_archive = catalog.relative_path(archive) if archive is not None else ''
+        catalog.remove([catalog.relative_path(folder / name) for name in removed] +
+                       [f"{relative_archive}#{name}" for name in removed if name in index])
+    logger.info(f"Removed {len(removed)} of {len(frames)} frames of {station} of {day} ({tier})")
+
+
+def _repack(images_root: Path, station: str, day: date, archive: Path, index: dict[str, list], extract: set[str],
+            report: RetentionReport, catalog: Catalog | None) -> None:
+    """Pack the archive of the day again with only the kept frames."""
+    folder = archive.parent
+    try:
+        for name in sorted(extract):
+            temporary = folder / f".{name}.part"
+            temporary.write_bytes(read_frame(archive, name))
+            fsync_path(temporary)
+            os.replace(temporary, folder / name)
+        os.remove(archive)
+        os.remove(index_path(archive))
+    except (OSError, KeyError) as e:
+        report.errors.append(f"Unable to extract the kept frames of archive {archive}: {e}")
+        return
+    result = archive_day(images_root, station, day, catalog)
+    if result.error:
+        report.errors.append(f"Unable to pack archive {archive} again: {result.error}")
+
+
+def move_day(images_root: Path, station: str, day: date, policy: RetentionPolicy, report: RetentionReport,
+             catalog: Catalog | None = None, dry_run: bool = False) -> None:
+    """Move the folder of the station of the day to the secondary folder."""
+    relative = Path(station) / str(day.year) / str(day.month) / str(day.day)
+    source = images_root / relative
+    destination = Path(policy.secondary_path) / relative
+    if destination.exists():
+        report.errors.append(f"{destination} already exists, {source} is not moved")
+        return
+    with os.scandir(source) as entries:
+        sizes = {}
+        for entry in entries:
+            stat = entry.stat(follow_symlinks=False)
+            sizes[(stat.st_dev, stat.st_ino)] = stat.st_size
+    report.moved += 1
+    report.moved_bytes += sum(sizes.values())
+    if dry_run:
+        return
+    try:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(source, destination)
+    except OSError as e:
+        report.errors.append(f"Unable to move {source} to {destination}: {e}")
+        return
+    for folder in (source.parent, source.parent.parent):    # the month and year folders, when empty
+        try:
+            folder.rmdir()
+        except OSError:
+            break
+    if catalog is not None:
+        catalog.move_folder(relative.as_posix(), catalog.relative_path(destination))
+    logger.info(f"Moved {source} to {destination}")
+
+
+def _days_after(images_root: Path, station: str, after: date | None) -> list[date]:
+    """The days with a folder of the station after the given day; earlier year and month folders are skipped."""
+    station_folder = images_root / station
+    days = []
+    for year in numbered_folders(station_folder):
+        if after is not None and year < after.year:
+            continue
+        for month in numbered_folders(station_folder / str(year)):
+            if after is not None and (year, month) < (after.year, after.month):
+                continue
+            days.extend(date(year, month, day) for day in numbered_folders(station_folder / str(year) / str(month))
+                        if after is None or date(year, month, day) > after)
+    return days
+
+
+def apply_retention(images_root: Path, station: str, policy: RetentionPolicy, state: JsonStateStore,
+                    today: date | None = None, catalog: Catalog | None = None,
+                    dry_run: bool = False) -> RetentionReport:
+    """Thin out and move the days of the station following the policy, skipping the days done before.
+       The mark of a tier only passes the days that were all thinned, so a failed day is tried again.
+    """
+    today = today or date.today()
+    report = RetentionReport(station)
+    done = state.get(station) or {}
+    if done.get('policy') != policy.key:
+        done = {'policy': policy.key}
+    marks = {tier: date.fromisoformat(done[tier]) for tier in (THIN, DAILY) if tier in done}
+    failed = set()      # the tiers with a day that could not be thinned
+    # the days that are moved are no longer in the image folder, so only then all days are listed
+    for day in _days_after(images_root, station, None if policy.moves else marks.get(DAILY)):
+        tier = policy.tier(day, today)
+        if tier != FULL and (tier not in marks or day > marks[tier]):
+            errors = len(report.errors)
+            thin_day(images_root, station, day, tier, policy, report, catalog, dry_run)
+            if len(report.errors) > errors:
+                failed.add(tier)
+            elif tier not in failed:
+                marks[tier] = day
+        if policy.moves and (today - day).days >= policy.move_days:
+            move_day(images_root, station, day, policy, report, catalog, dry_run)
+    if not dry_run:
+        done.update({tier: day.isoformat() for tier, day in marks.items()})
+        state.set(station, done)
+    return report
+
+
+def apply_all(config: CameraConfig, station_names: list[str], today: date | None = None,
+              catalog: Catalog | None = None, dry_run: bool = False) -> list[RetentionReport]:
+    """Apply the retention policy of the configuration to the stations."""
+    policy = RetentionPolicy.from_config(config)
+    state = JsonStateStore(config.state_folder / RETENTION_FILE)
+    reports = [apply_retention(config.image_save_path, station, policy, state, today, catalog, dry_run)
+               for station in station_names]
+    state.save()
+    return reports
@@ -0,0 +1,89 @@
+'''
+state_store.py
+This module provides a small persistent key/value store, used to keep state between capture runs.
+The state is kept in memory as a dictionary and written to a JSON file on save. Writing is atomic:
+the data is first written to a temporary file which then replaces the original file, so an interrupted
+save never leaves a corrupt state file behind.
+'''
+
+import json
+import logging
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStateStore:
+    """Thread safe dictionary that is persisted as a JSON file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._data: dict[str, Any] = self._read()
+        self._dirty = False
+
+    def _read(self) -> dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+            logger.warning(f"Ignoring state file '{self.path}': unexpected content.")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring state file '{self.path}': {e}")
+        return {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._dirty = True
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._dirty = True
+            return self._data.pop(key)
+
+    def items(self) -> list[tuple[str, Any]]:
+        with self._lock:
+            return list(self._data.items())
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([key for key, _ in self.items()])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def save(self) -> None:
+        """Write the state to disk, if anything changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, indent=1)
+                os.replace(tmp_name, self.path)
+            except OSError as e:
+                logger.error(f"Unable to save state file '{self.path}': {e}")
+                if os.path.exists(tmp_name):
+                    os.remove(tmp_name)
+                return
+            self._dirty = False
@@ -0,0 +1,267 @@
+'''
+supervisor.py
+This module captures thousands of cameras by spreading them over a number of worker processes, each
+capturing its share (shard) of the cameras in the camera locations file with capture_all_repeat.
+The cameras are assigned to the shards by rendezvous hashing of the page URL, for an even spread also when
+a few sites serve most cameras, or of the host name of the camera page, so all cameras of a site are in one
+process and per_host_limit holds for all processes together. A shard without cameras gets no process until
+the camera locations file changes and gives it cameras; a worker that finished is started again when its
+shard gets new cameras. With rendezvous hashing a camera keeps its shard when processes are added, unless it
+moves to one of the new shards, so most cameras keep their state.
+Every worker keeps its caches and other state in its own folder in the state folder (.capture/shard-<n>);
+the catalog is shared. Frames are saved under a name that no other process can take (see
+capture_functions.move_into_place) and a folder that another process created first is no error.
+The supervisor restarts a worker that crashed, after a delay that grows when it keeps crashing. The log
+records of all workers are written to the log of the supervisor, prefixed with their shard. The metrics of
+every capture cycle of a worker are written to the metrics file, with the shard, and the last cycles of all
+workers together to the Prometheus file.
+Classes:
+    Shard
+        The share of the cameras of a worker process.
+    CycleAggregator
+        The metrics of the capture cycles of all workers.
+    Worker
+        A worker process, restarted when it crashes.
+Functions:
+    shard_of(key, count) -> int
+    run_worker(shard, capture_mode, use_async, verbose, log_queue, cycles)
+    supervise(processes, shard_by, capture_mode, use_async, verbose)
+'''
+
+from dataclasses import dataclass
+from datetime import datetime
+import hashlib
+import logging
+import logging.handlers
+import multiprocessing
+from pathlib import Path
+import queue
+import threading
+from time import monotonic
+from typing import Sequence
+from urllib.parse import urlsplit
+from camera.camera_locations import CameraLocation, load_urls_from_file
+from camera.capture import CAPTURE_TODAY, capture_all_repeat
+from camera.config import CameraConfig, SHARD_BY_HOST, SHARD_BY_URL
+from camera.metrics import CaptureTiming, CycleMetrics
+from camera.watcher import SettingsWatcher
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0         # seconds between checks of the workers
+MAX_RESTART_DELAY = 300     # seconds
+STABLE_RUN = 600            # seconds a worker runs before its earlier crashes are forgotten
+STOP_TIMEOUT = 30           # seconds the workers get to stop after Ctrl+C
+
+
+def shard_of(key: str, count: int) -> int:
+    """The shard of the key by rendezvous hashing: the shard with the highest hash of the shard and the key."""
+    return max(range(count),
+               key=lambda index: hashlib.blake2b(f"{index}:{key}".encode('utf-8'), digest_size=8).digest())
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+    by: str = SHARD_BY_URL      # one of SHARD_MODES (see config)
+
+    @property
+    def name(self) -> str:
+        """Name of the state folder of the shard, and the prefix of its log records."""
+        return f"shard-{self.index}"
+
+    def key(self, camera: CameraLocation) -> str:
+        if self.by == SHARD_BY_HOST:
+            return (urlsplit(camera.url).hostname or camera.url).lower()
+        return camera.url
+
+    def select(self, cameras: Sequence[CameraLocation]) -> tuple[CameraLocation, ...]:
+        """The cameras of the shard."""
+        return tuple(camera for camera in cameras if shard_of(self.key(camera), self.count) == self.index)
+
+
+class CycleAggregator:
+    """The metrics of the capture cycles of all workers, written by the supervisor only."""
+
+    def __init__(self, metrics_file: Path | None = None, prometheus_file: Path | None = None):
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        self.latest: dict[int, CycleMetrics] = {}   # the last cycle of every shard
+
+    @classmethod
+    def from_config(cls, config: CameraConfig) -> 'CycleAggregator':
+        return cls(Path(config.metrics_file) if config.metrics_file else None,
+                   Path(config.prometheus_file) if config.prometheus_file else None)
+
+    def add(self, index: int, started: datetime, wall_time: float, timings: list[CaptureTiming]) -> None:
+        """Add a finished cycle of the worker of the shard and write the metrics."""
+        cycle = CycleMetrics(self.metrics_file)
+        cycle.started, cycle.wall_time, cycle.timings = started, wall_time, timings
+        self.latest[index] = cycle
+        try:
+            if self.metrics_file:
+                cycle.write_json_lines({**cycle.summary(), 'shard': index})
+            if self.prometheus_file:
+                combined = self.combined()
+                combined.write_prometheus(combined.summary())
+        except OSError as e:
+            logger.error(f"Unable to write the capture metrics: {e}")
+
+    def combined(self) -> CycleMetrics:
+        """The last cycles of all workers as one cycle."""
+        combined = CycleMetrics(prometheus_file=self.prometheus_file)
+        cycles = list(self.latest.values())
+        combined.started = min(cycle.started for cycle in cycles)
+        combined.wall_time = max(cycle.wall_time for cycle in cycles)
+        combined.timings = [timing for cycle in cycles for timing in cycle.timings]
+        return combined
+
+
+def _worker_logging(shard: Shard, log_queue) -> None:
+    """Send the log records of the worker process to the supervisor, prefixed with the shard."""
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter(f"[{shard.name}] %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+
+
+def run_worker(shard: Shard, capture_mode: int, use_async: bool, verbose: bool, log_queue, cycles) -> None:
+    """Capture the cameras of the shard; the entry point of a worker process."""
+    from camera import http_client, metrics
+
+    _worker_logging(shard, log_queue)
+    config = CameraConfig()
+    config.shard = shard.name
+    if verbose:
+        config.verbose = config.verbose_option = True
+    metrics.set_reporter(lambda cycle: cycles.put((shard.index, cycle.started, cycle.wall_time, cycle.timings)))
+    cameras = load_urls_from_file(config)
+    logger.info(f"Capturing {len(shard.select(cameras))} of {len(cameras)} cameras")
+    http_client.configure(config)
+    capture_all_repeat(cameras, config, capture_mode, use_async, shard)
+
+
+class Worker:
+    """A worker process of the supervisor, restarted when it crashes."""
+
+    def __init__(self, shard: Shard, start):
+        self.shard = shard
+        self._start = start         # starts the process of the shard and returns it
+        self.process = None
+        self.started = 0.0
+        self.crashes = 0
+        self.restart_at = 0.0
+        self.done = False           # the worker finished its capture
+
+    def check(self, now: float) -> None:
+        """Start the worker when it is due, and find out whether it stopped."""
+        if self.done:
+            return
+        if self.process is None:
+            if now >= self.restart_at:
+                self.process = self._start(self.shard)
+                self.started = now
+            return
+        if self.process.is_alive():
+            return
+        self.process.join()
+        exitcode, self.process = self.process.exitcode, None
+        if exitcode == 0:
+            self.done = True
+            logger.info(f"Worker {self.shard.name} finished")
+            return
+        if now - self.started >= STABLE_RUN:
+            self.crashes = 0
+        self.crashes += 1
+        delay = min(MAX_RESTART_DELAY, 2 ** self.crashes)
+        self.restart_at = now + delay
+        logger.error(f"Worker {self.shard.name} stopped with exit code {exitcode}, restarting in {delay} seconds")
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            logger.warning(f"Worker {self.shard.name} did not stop, terminating it")
+            self.process.terminate()
+            self.process.join()
+
+
+def _wake_workers(workers: Sequence[Worker], cameras: Sequence[CameraLocation],
+                  assigned: dict[int, set[str]]) -> None:
+    """Start the finished workers whose shard got cameras (by URL) that it did not have before,
+       and remember the cameras of every shard.
+    """
+    for worker in workers:
+        urls = {camera.url for camera in worker.shard.select(cameras)}
+        if worker.done and urls - assigned[worker.shard.index]:
+            logger.info(f"Worker {worker.shard.name} got {len(urls - assigned[worker.shard.index])} new cameras")
+            worker.done = False
+            worker.restart_at = 0.0
+        assigned[worker.shard.index] = urls
+
+
+def _forward_logs(log_queue) -> None:
+    """Handle the log records of the workers as if they were logged by the supervisor, until None."""
+    while (record := log_queue.get()) is not None:
+        logging.getLogger(record.name).handle(record)
+
+
+def supervise(processes: int, shard_by: str = SHARD_BY_URL, capture_mode: int = CAPTURE_TODAY,
+              use_async: bool = False, verbose: bool = False) -> None:
+    """Capture the cameras with a worker process per shard until all workers finished (see capture_all_repeat)."""
+    config = CameraConfig()
+    cameras = load_urls_from_file(config)
+    if not cameras:
+        logger.error("No camera URLs found. Please check the camera locations file.")
+        return
+    # spawn on every platform: a forked process would inherit the threads and log handlers of the supervisor
+    context = multiprocessing.get_context('spawn')
+    log_queue, cycles = context.Queue(), context.Queue()
+
+    def start(shard: Shard):
+        process = context.Process(target=run_worker, name=shard.name,
+                                  args=(shard, capture_mode, use_async, verbose, log_queue, cycles))
+        process.start()
+        logger.info(f"Started worker {shard.name} (process {process.pid})")
+        return process
+
+    aggregator = CycleAggregator.from_config(config)
+    workers = [Worker(Shard(index, processes, shard_by), start) for index in range(processes)]
+    assigned = {}   # the cameras (URLs) of every shard
+    for worker in workers:
+        assigned[worker.shard.index] = {camera.url for camera in worker.shard.select(cameras)}
+        worker.done = not assigned[worker.shard.index]
+    idle = sum(worker.done for worker in workers)
+    if idle:
+        # with --shard-by host, for instance, all cameras of a single site are in one shard
+        logger.warning(f"{idle} of {processes} shards have no cameras (shard by {shard_by}), "
+                       f"starting {processes - idle} worker processes")
+    watcher = SettingsWatcher(config, cameras)     # the workers apply the changes themselves
+    forwarder = threading.Thread(target=_forward_logs, args=(log_queue,), name='worker-logs', daemon=True)
+    forwarder.start()
+    try:
+        while not all(worker.done for worker in workers):
+            if watcher.poll():
+                _wake_workers(workers, watcher.cameras, assigned)
+            for worker in workers:
+                worker.check(monotonic())
+            try:
+                aggregator.add(*cycles.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                pass
+    except KeyboardInterrupt:
+        logger.info("Stopping the workers.")
+        for worker in workers:
+            worker.stop()
+    finally:
+        while True:     # the cycles that finished while stopping
+            try:
+                aggregator.add(*cycles.get_nowait())
+            except queue.Empty:
+                break
+        log_queue.put(None)
+        forwarder.join()
+    logger.info("Supervisor stopped.")
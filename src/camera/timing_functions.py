@@ -1,7 +1,14 @@
 from datetime import datetime, timedelta
-from time import time, sleep
+import logging
+from time import time, monotonic, sleep
+from typing import Callable
 from camera.config import CameraConfig
 
+logger = logging.getLogger(__name__)
+
+MAX_SLEEP = 60.0            # seconds; longer waits are split so clock jumps are noticed in time
+CLOCK_JUMP_TOLERANCE = 2.0  # seconds the wall clock may differ from the monotonic clock before rescheduling
+
 
 class EndCaptureException(Exception):
     """Exception to signal the user ended the capture process."""
@@ -12,34 +19,32 @@ def wait_until_first_capture_time(config: CameraConfig) -> None:
     '''This function is called at the start only to avoid initiating the capture process too early.'''
     now = datetime.now()
     if now.time() < config.start:
-        sleep_time, _ = determine_delay_to_next_capture_time(config, now)
-        wait_until_next_capture(sleep_time, 600)
+        CaptureScheduler(config).wait_until(next_capture_time(config, now), 600)
 
 
-def determine_delay_to_next_capture_time(config: CameraConfig, now: datetime) -> tuple[int, datetime]:
-    """ Determine the initial start time based on the current time and the configured start time.
+def next_capture_time(config: CameraConfig, now: datetime) -> datetime:
+    """ Determine the next capture time on the grid of the configured start time and interval.
         Capture time is calculated at regular intervals since the start time.
         Example: If the start time is 06:30, the interval is 30 minutes and the current time is 07:13,
         the next capture will be at 07:30 (6:30 + 2 * 30).
-        Return the seconds to wait before actually starting the capture.
+        The grid is in local (wall clock) time, so captures stay on the same clock times across DST changes.
     """
     dt_start = now.replace(hour=config.start.hour, minute=config.start.minute, second=0, microsecond=0)
     if now.time() <= config.start:
-        return (dt_start - now).seconds, dt_start
+        return dt_start
     if now.time() == config.end:
-        return 0, now
+        return now
     if now.time() > config.end:
-        target = dt_start + timedelta(days=1)
-        return (target - now).seconds, target
-    else:
-        # Otherwise, return the next interval after the current time
-        periods = (now - dt_start).seconds // (config.interval * 60)
-        remain = (now - dt_start).seconds % (config.interval * 60)
-        if (remain >= 0) and (remain < config.interval * 60):
-            # last period, may be less then the interval, so adjust
-            periods += 1
-        target = dt_start + timedelta(minutes=(periods) * config.interval)
-        return (target - now).seconds, target
+        return dt_start + timedelta(days=1)
+    # Otherwise, return the next interval after the current time
+    periods = int((now - dt_start).total_seconds() // (config.interval * 60)) + 1
+    return dt_start + timedelta(minutes=periods * config.interval)
+
+
+def determine_delay_to_next_capture_time(config: CameraConfig, now: datetime) -> tuple[float, datetime]:
+    """ Determine the next capture time (see next_capture_time) and the seconds to wait until then."""
+    target = next_capture_time(config, now)
+    return max((target - now).total_seconds(), 0), target
 
 
 def format_seconds_to_hours_minutes(seconds_to_wait: int) -> str:
@@ -59,36 +64,85 @@ def format_seconds_to_hours_minutes(seconds_to_wait: int) -> str:
     return ', '.join(parts)
 
 
-def wait_until_next_capture(seconds: int, period_length: int = 600, print_func=print) -> None:
+def _sleep_until(deadline: float, period_length: int = 600, print_func=print,
+                 wake: Callable[[], bool] | None = None) -> float | None:
+    """
+        Sleep until the deadline (a time.time() timestamp), allowing for keyboard interrupts.
+        The sleep runs against the monotonic clock, in chunks of at most MAX_SLEEP seconds, so it wakes
+        precisely at the deadline. When the wall clock jumps (for instance a clock correction) the
+        monotonic deadline is moved along. Return the lateness in seconds.
+        The optional wake function is called after every chunk; when it returns True the sleep
+        ends early and None is returned.
+    """
+    remaining = deadline - time()
+    mono_deadline = monotonic() + remaining
+    next_report = 0.0
+    try:
+        while True:
+            remaining = mono_deadline - monotonic()
+            wall_remaining = deadline - time()
+            if abs(wall_remaining - remaining) > CLOCK_JUMP_TOLERANCE:
+                logger.warning(f"Clock changed by {remaining - wall_remaining:.1f} seconds, rescheduling")
+                mono_deadline += wall_remaining - remaining
+                remaining = wall_remaining
+            if remaining <= 0:
+                break
+            if remaining >= next_report:
+                to_go = format_seconds_to_hours_minutes(int(remaining))
+                print_func(f'Sleep until {datetime.fromtimestamp(deadline):%H:%M:%S}, (still {to_go} to go)')
+                next_report = remaining - period_length
+            sleep(min(remaining, MAX_SLEEP))
+            if wake is not None and wake():
+                return None
+    except KeyboardInterrupt:
+        print_func(f"Sleep interrupted at {datetime.now()}.")
+        raise EndCaptureException("Capture interrupted by user.")
+    return -remaining
+
+
+def wait_until_next_capture(seconds: float, period_length: int = 600, print_func=print) -> float:
     """
         Wait until the next capture time, allowing for keyboard interrupts.
         Once per {period_length} report remaining time.
-        Note that to get accurate timing, the period length should be short (fe. 1 or 10 minutes).
-        The time.sleep() function can experience quite some drift.
 
         Parameters:
         - seconds: The total number of seconds to wait.
-        - period_length: The length of each reporting period in seconds (minimum 1 minute).
-        - print_func: Function to use for printing messages (default is print), use None to disable printing.
+        - period_length: The length of each reporting period in seconds.
+        - print_func: Function to use for printing messages (default is print).
+
+        Returns the number of seconds the wait ended late.
 
         Raises:
         - EndCaptureException: If the wait is interrupted by the user.
+    """
+    return _sleep_until(time() + seconds, period_length, print_func)
+
 
+class CaptureScheduler:
+    """Waits for the capture slots on the grid of the configured start time and interval,
+       and keeps track of how late each slot was started.
     """
-    # reduce the period_length by 10% to account for drift
-    period_length = max(60, int(period_length * 0.9))
-    current_time = time()
-    end_time = current_time + seconds
-    while end_time > current_time:
-        seconds_to_wait = min(seconds, period_length)
-        try:
-            to_go = format_seconds_to_hours_minutes(seconds)
-            print_func(f'Sleep another {seconds_to_wait:.1f} seconds, (still {to_go} to go)')
-            sleep(seconds_to_wait)
-        except KeyboardInterrupt:
-            print_func(f"Sleep interrupted at {datetime.now()}.")
-            raise EndCaptureException("Capture interrupted by user.")
-
-        # synchronize with actual time, make sure not to overshoot the end time
-        current_time = time()
-        seconds = max(end_time - current_time, 0)
+
+    def __init__(self, config: CameraConfig, print_func=print):
+        self.config = config
+        self.print_func = print_func
+        self.lateness: list[float] = []
+
+    def wait_until(self, capture_time: datetime, period_length: int = 600,
+                   wake: Callable[[], bool] | None = None) -> float | None:
+        """Sleep until the capture time (local time) and return how many seconds late the slot starts.
+           When the wake function (see _sleep_until) ends the sleep early, None is returned.
+        """
+        lateness = _sleep_until(capture_time.timestamp(), period_length, self.print_func, wake)
+        if lateness is None:
+            return None
+        self.lateness.append(lateness)
+        logger.info(f"Capture slot {capture_time:%H:%M} started {lateness:.3f} seconds late")
+        return lateness
+
+    def summary(self) -> str:
+        if not self.lateness:
+            return "Capture slots: 0"
+        average = sum(self.lateness) / len(self.lateness)
+        return (f"Capture slots: {len(self.lateness)}, lateness average {average:.3f} seconds, "
+                f"maximum {max(self.lateness):.3f} seconds")
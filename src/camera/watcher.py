@@ -0,0 +1,121 @@
+'''
+watcher.py
+This module watches the configuration file and the camera locations file while the app captures
+repeatedly, so cameras can be added or removed and the schedule can be changed without a restart.
+The files are only read again when their modification time or size changed. A changed file that
+is invalid, or lists a camera with a schedule that can not be used, is rejected with an error in the log;
+the current configuration and cameras stay in use.
+Classes:
+    WatchedFile
+        Detects changes of a file.
+    SettingsWatcher
+        The current configuration and cameras, reloaded when their files change.
+'''
+
+import copy
+from datetime import time
+import logging
+from pathlib import Path
+from camera import config as camera_config
+from camera.camera_locations import CameraLocation, load_camera_locations
+from camera.camera_schedule import camera_schedule
+from camera.config import CameraConfig, NUMERIC_KEYS
+
+logger = logging.getLogger(__name__)
+
+
+class WatchedFile:
+    """Detects changes of a file by its modification time and size."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._stamp = self._stat()
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        """Whether the file changed (or appeared or disappeared) since the previous check."""
+        stamp = self._stat()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+
+def validate_config(config: CameraConfig) -> None:
+    """Raise ValueError when the configuration can not be used for capturing."""
+    if not isinstance(config.interval, int) or config.interval < 1:
+        raise ValueError(f"invalid interval '{config.interval}'")
+    if not isinstance(config.start, time) or not isinstance(config.end, time) or config.start >= config.end:
+        raise ValueError("start time must be before end time")
+    for key, (_, low, high) in NUMERIC_KEYS.items():
+        value = getattr(config, key)
+        if not low <= value <= high:
+            raise ValueError(f"{key} must be in the range {low} to {high}")
+
+
+def validate_cameras(cameras: tuple[CameraLocation, ...], config: CameraConfig) -> None:
+    """Raise ValueError, naming the camera, when the schedule of a camera can not be used for capturing."""
+    for camera in cameras:
+        try:
+            schedule = camera_schedule(camera, config)
+            if schedule.start >= schedule.end:
+                raise ValueError("start time must be before end time")
+            if schedule.interval < 1:
+                raise ValueError(f"invalid interval '{schedule.interval}'")
+        except ValueError as e:
+            raise ValueError(f"camera {camera.location} ({camera.url}): {e}") from e
+
+
+class SettingsWatcher:
+    """The current configuration and cameras of a repeated capture, reloaded when their files change."""
+
+    def __init__(self, config: CameraConfig, cameras: tuple[CameraLocation, ...]):
+        self.config = config
+        self.cameras = tuple(cameras)
+        self._config_file = WatchedFile(camera_config.CONFIG_FILE)
+        self._locations_file = WatchedFile(config.location_file)
+
+    def _reload_config(self) -> bool:
+        config = copy.copy(self.config)
+        try:
+            config.load(strict=True)
+            validate_config(config)
+            validate_cameras(self.cameras, config)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Configuration change rejected, the current configuration stays in use: {e}")
+            return False
+        self.config = config    # the cameras of a new locations file are checked against the new configuration
+        if Path(config.location_file) != self._locations_file.path:
+            self._locations_file = WatchedFile(config.location_file)
+            self._reload_cameras()
+        logger.info("Configuration reloaded")
+        return True
+
+    def _reload_cameras(self) -> bool:
+        cameras = load_camera_locations(self._locations_file.path)
+        try:
+            if not cameras:
+                raise ValueError("no cameras")
+            validate_cameras(cameras, self.config)
+        except ValueError as e:
+            logger.error(f"Change of camera locations file '{self._locations_file.path}' rejected, "
+                         f"the current {len(self.cameras)} cameras stay in use: {e}")
+            return False
+        self.cameras = cameras
+        logger.info(f"Camera locations reloaded: {len(cameras)} cameras")
+        return True
+
+    def poll(self) -> bool:
+        """Reload the files that changed; return whether the configuration or the cameras changed."""
+        changed = False
+        if self._config_file.changed():
+            changed = self._reload_config()
+        if self._locations_file.changed():
+            changed = self._reload_cameras() or changed
+        return changed
@@ -0,0 +1,106 @@
+from datetime import date, datetime
+import os
+from argparse import Namespace
+from unittest import mock
+import pytest
+from camera import archive
+from camera.archive import (archive_all, archive_day, archive_path, make_timelapse, read_frame, read_index,
+                            station_days)
+from camera.catalog import Catalog
+from camera.gaps import frame_times
+
+DAY = date(2023, 6, 1)
+
+
+def write_frame(root, station, stamp, data=b"frame"):
+    folder = root / station / stamp[:4] / stamp[4:6].lstrip("0") / stamp[6:8].lstrip("0")
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{station}_{stamp}.jpg"
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def day_folder(tmp_path):
+    first = write_frame(tmp_path, "stationA", "20230601_1200", b"first frame")
+    write_frame(tmp_path, "stationA", "20230601_1230", b"second frame")
+    os.link(first, first.with_name("stationA_20230601_1300.jpg"))
+    (first.parent / ".stationA_20230601_1330.jpg.part").write_bytes(b"partial")
+    return first.parent
+
+
+def test_archive_day(tmp_path, day_folder):
+    result = archive_day(tmp_path, "stationA", DAY)
+    assert result.archive == archive_path(tmp_path, "stationA", DAY) == day_folder / "stationA_20230601.tar"
+    assert (result.frames, result.removed, result.error) == (3, 3, None)
+    assert sorted(path.name for path in day_folder.iterdir()) == [
+        ".stationA_20230601_1330.jpg.part", "stationA_20230601.json", "stationA_20230601.tar"]
+    index = read_index(result.archive)
+    assert list(index) == ["stationA_20230601_1200.jpg", "stationA_20230601_1230.jpg", "stationA_20230601_1300.jpg"]
+    assert index["stationA_20230601_1300.jpg"][:2] == index["stationA_20230601_1200.jpg"][:2]   # stored once
+    assert read_frame(result.archive, "stationA_20230601_1230.jpg") == b"second frame"
+    assert read_frame(result.archive, "stationA_20230601_1300.jpg") == b"first frame"
+
+
+def test_archive_day_is_incremental(tmp_path, day_folder):
+    archive_day(tmp_path, "stationA", DAY, keep=True)
+    assert (day_folder / "stationA_20230601_1200.jpg").exists()
+    (day_folder / "stationA_20230601_1400.jpg").write_bytes(b"not archived")
+    result = archive_day(tmp_path, "stationA", DAY)
+    assert (result.frames, result.removed) == (0, 3)
+    assert not (day_folder / "stationA_20230601_1200.jpg").exists()
+    assert (day_folder / "stationA_20230601_1400.jpg").exists()
+
+
+def test_archive_day_keeps_originals_when_verification_fails(tmp_path, day_folder, monkeypatch):
+    monkeypatch.setattr(archive, "file_digest", lambda path: "different")
+    result = archive_day(tmp_path, "stationA", DAY)
+    assert result.error and result.archive is None
+    assert not archive_path(tmp_path, "stationA", DAY).exists()
+    assert not (day_folder / ".stationA_20230601.tar.part").exists()
+    assert (day_folder / "stationA_20230601_1200.jpg").read_bytes() == b"first frame"
+
+
+def test_archive_moves_catalog_paths(tmp_path, day_folder):
+    catalog = Catalog(tmp_path / ".capture" / "catalog.sqlite", tmp_path)
+    catalog.import_tree()
+    archive_day(tmp_path, "stationA", DAY, catalog)
+    paths = [frame.path for frame in catalog.frames("stationA", datetime(2023, 6, 1), datetime(2023, 6, 2))]
+    assert paths[0] == "stationA/2023/6/1/stationA_20230601.tar#stationA_20230601_1200.jpg"
+    catalog.close()
+
+
+def test_archive_all_skips_recent_days(tmp_path, day_folder):
+    write_frame(tmp_path, "stationB", "20230601_1200")
+    write_frame(tmp_path, "stationB", "20230602_1200")
+    assert station_days(tmp_path, "stationB") == [date(2023, 6, 1), date(2023, 6, 2)]
+    results = archive_all(tmp_path, ["stationA", "stationB"], date(2023, 6, 2), workers=2)
+    assert sorted((result.station, result.day, result.frames) for result in results) == [
+        ("stationA", DAY, 3), ("stationB", DAY, 1)]
+    assert (tmp_path / "stationB" / "2023" / "6" / "2" / "stationB_20230602_1200.jpg").exists()
+
+
+def test_gaps_read_the_archive_index(tmp_path, day_folder):
+    before = frame_times(tmp_path, "stationA", DAY)
+    archive_day(tmp_path, "stationA", DAY)
+    assert frame_times(tmp_path, "stationA", DAY) == before
+    assert len(before) == 3
+
+
+def test_timelapse_needs_ffmpeg(tmp_path, day_folder):
+    with mock.patch("camera.archive.shutil.which", return_value=None):
+        assert not make_timelapse(day_folder, ["stationA_20230601_1200.jpg"], tmp_path / "day.mp4")
+
+
+def test_archive_extract_cli(tmp_path, day_folder, capsys):
+    from camera.cli_parser import archive_extract_cli
+    result = archive_day(tmp_path, "stationA", DAY)
+    archive_extract_cli(Namespace(archive=str(result.archive), name=None, output=None))
+    assert "stationA_20230601_1230.jpg  12" in capsys.readouterr().out
+    output = tmp_path / "frame.jpg"
+    archive_extract_cli(Namespace(archive=str(result.archive), name="stationA_20230601_1230.jpg", output=str(output)))
+    assert output.read_bytes() == b"second frame"
+
+
+def test_stations_of_missing_image_folder(tmp_path):
+    assert archive.stations(tmp_path / "missing") == []
@@ -0,0 +1,112 @@
+import threading
+import time
+import pytest
+from unittest import mock
+from camera.async_pipeline import MAX_FETCH_WORKERS, fetch_workers, run_pipeline
+from camera.capture_functions import write_temporary_image
+from camera.config import CameraConfig
+from camera.http_client import NotModified
+from camera.kenya_capture import CameraPage
+
+
+@pytest.fixture(autouse=True)
+def patch_logger():
+    with mock.patch("camera.async_pipeline.logger"):
+        yield
+
+
+CAMERAS = [(f"http://host-{i % 2}/cam{i}.html", f"cam{i}") for i in range(6)]
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = CameraConfig()
+    config.image_save_path = tmp_path
+    config.workers = 6
+    return config
+
+
+@pytest.fixture
+def fake_capture(monkeypatch):
+    def fetch_page(url, metadata_cache, validators):
+        time.sleep(0.1)
+        return CameraPage(url, img_url=url.replace(".html", ".jpg"))
+
+    def find_image(page, metadata_cache, validators, parser_backend):
+        return page.img_url
+
+    def download(img_url, folder, validators, max_size):
+        time.sleep(0.1)
+        return write_temporary_image([b"\xff\xd8" + img_url.encode() + b"\xff\xd9"], folder, max_size, validate=True)
+
+    monkeypatch.setattr("camera.async_pipeline.fetch_camera_page", fetch_page)
+    monkeypatch.setattr("camera.async_pipeline.find_camera_image", find_image)
+    monkeypatch.setattr("camera.async_pipeline.download_image", download)
+
+
+def test_pipeline_captures_and_saves_all_cameras(config, fake_capture, tmp_path):
+    results = run_pipeline(CAMERAS, config)
+    assert sorted(r.location for r in results) == [location for _, location in CAMERAS]
+    assert all(r.succeeded for r in results)
+    saved = sorted(p.name.split("_")[0] for p in tmp_path.rglob("*.jpg"))
+    assert saved == [location for _, location in CAMERAS]
+    assert all(p.name.endswith(".jpg") for p in tmp_path.rglob("*") if p.is_file())     # no temporary files left
+
+
+def test_pipeline_overlaps_the_cameras(config, fake_capture):
+    start = time.perf_counter()
+    run_pipeline(CAMERAS, config)
+    # sequentially this takes 6 * 0.2 seconds
+    assert time.perf_counter() - start < 0.6
+
+
+def test_pipeline_overlaps_the_cameras_with_default_workers(config, fake_capture):
+    config.workers, config.per_host_limit = 1, 3
+    assert fetch_workers(CAMERAS, config) == 6      # two hosts
+    start = time.perf_counter()
+    run_pipeline(CAMERAS, config)
+    assert time.perf_counter() - start < 0.6
+    config.per_host_limit = 32
+    assert fetch_workers([(f"http://host-{i}/cam.html", "cam") for i in range(10)], config) == MAX_FETCH_WORKERS
+    config.workers = 4
+    assert fetch_workers(CAMERAS, config) == 4
+
+
+def test_pipeline_records_unchanged_and_errors(config, fake_capture, monkeypatch):
+    def download(img_url, folder, validators, max_size):
+        if "cam1" in img_url:
+            raise NotModified(img_url)
+        if "cam2" in img_url:
+            raise ValueError("broken image")
+        return None if "cam3" in img_url else write_temporary_image([b"data"], folder)
+
+    monkeypatch.setattr("camera.async_pipeline.download_image", download)
+    results = {r.location: r for r in run_pipeline(CAMERAS[:4], config)}
+    assert results["cam0"].succeeded
+    assert results["cam1"].unchanged
+    assert results["cam2"].error == "broken image"
+    assert results["cam3"].error == "No valid image data"
+
+
+def test_pipeline_downloads_beyond_the_default_executor(config, monkeypatch):
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def fetch_page(url, metadata_cache, validators):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.2)
+        with lock:
+            running[0] -= 1
+        return None
+
+    monkeypatch.setattr("camera.async_pipeline.fetch_camera_page", fetch_page)
+    config.workers = 40
+    run_pipeline([(f"http://host-{i}/cam{i}.html", f"cam{i}") for i in range(40)], config)
+    assert peak[0] == 40    # the default executor of asyncio has at most 32 threads
+
+
+def test_pipeline_page_not_accessible(config, monkeypatch):
+    monkeypatch.setattr("camera.async_pipeline.fetch_camera_page", lambda url, cache, validators: None)
+    results = run_pipeline(CAMERAS[:2], config)
+    assert [r.error for r in results] == ["Page not accessible"] * 2
@@ -0,0 +1,82 @@
+from datetime import datetime, time
+
+from camera.camera_health import HealthRegistry, CLOSED, OPEN, HALF_OPEN, PROBE_MARGIN
+from camera.camera_schedule import CameraSchedule
+
+URL = "http://host-a/cam1.html"
+
+
+def registry(tmp_path, threshold=3):
+    return HealthRegistry(tmp_path / "health.json", failure_threshold=threshold, base_delay=600, max_delay=3600)
+
+
+def test_new_camera_is_allowed(tmp_path):
+    health = registry(tmp_path)
+    assert health.allow(URL)
+    assert health.get(URL).state == CLOSED
+
+
+def test_circuit_opens_after_threshold(tmp_path):
+    health = registry(tmp_path)
+    for _ in range(2):
+        health.record_failure(URL, "Page not accessible", now=1000)
+    assert health.allow(URL, now=1000)
+    health.record_failure(URL, "Page not accessible", now=1000)
+    status = health.get(URL)
+    assert status.state == OPEN
+    assert status.next_probe == 1600
+    assert not health.allow(URL, now=1599 - PROBE_MARGIN)
+
+
+def test_open_camera_is_probed_in_its_next_slot(tmp_path):
+    schedule = CameraSchedule(time(6, 0), time(18, 0), 10)
+    slot = datetime(2024, 5, 1, 12, 0, 2)     # the slot started two seconds late
+    health = registry(tmp_path, threshold=1)
+    health.record_failure(URL, "error", now=slot.timestamp())
+    next_slot = schedule.next_capture_time(slot)
+    assert not health.allow(URL, now=next_slot.timestamp() - 300)
+    assert health.allow(URL, now=next_slot.timestamp() + 0.5)     # started less late than the failed slot
+    assert health.get(URL).state == HALF_OPEN
+
+
+def test_half_open_probe_success_closes_circuit(tmp_path):
+    health = registry(tmp_path, threshold=1)
+    health.record_failure(URL, "error", now=1000)
+    assert health.allow(URL, now=1600)
+    assert health.get(URL).state == HALF_OPEN
+    health.record_success(URL, now=1600)
+    status = health.get(URL)
+    assert status.state == CLOSED
+    assert status.failures == 0
+
+
+def test_probe_interval_grows_exponentially_up_to_maximum(tmp_path):
+    health = registry(tmp_path, threshold=1)
+    now = 0
+    delays = []
+    for _ in range(5):
+        health.record_failure(URL, "error", now=now)
+        next_probe = health.get(URL).next_probe
+        delays.append(next_probe - now)
+        now = next_probe
+        assert health.allow(URL, now=now)
+    assert delays == [600, 1200, 2400, 3600, 3600]
+
+
+def test_health_is_persisted(tmp_path):
+    health = registry(tmp_path, threshold=1)
+    health.record_failure(URL, "No valid image data", now=1000)
+    health.save()
+    status = registry(tmp_path).get(URL)
+    assert status.state == OPEN
+    assert status.last_error == "No valid image data"
+
+
+def test_first_probe_waits_the_interval_of_the_camera(tmp_path):
+    health = registry(tmp_path)
+    for _ in range(3):
+        health.record_failure("http://cam1", "timeout", now=1000, base_delay=120)
+        health.record_failure("http://cam2", "timeout", now=1000)
+    assert health.get("http://cam1").next_probe == 1000 + 120
+    assert health.get("http://cam2").next_probe == 1000 + 600
+    assert health.delay(20, base_delay=7200) == 7200    # the maximum is never below the interval
@@ -0,0 +1,85 @@
+from datetime import datetime, time, timezone
+from zoneinfo import ZoneInfo
+import pytest
+from camera.camera_locations import CameraLocation
+from camera.camera_schedule import CameraSchedule, CaptureTimer, camera_schedule
+from camera.config import CameraConfig
+
+NAIROBI = ZoneInfo("Africa/Nairobi")
+
+
+@pytest.fixture
+def config():
+    config = CameraConfig()
+    config.start = time(6, 30)
+    config.end = time(18, 30)
+    config.interval = 30
+    return config
+
+
+def test_camera_schedule_falls_back_to_config(config):
+    schedule = camera_schedule(CameraLocation("http://cam1", "cam1"), config)
+    assert schedule == CameraSchedule(time(6, 30), time(18, 30), 30)
+
+
+def test_camera_schedule_from_camera(config):
+    camera = CameraLocation("http://cam1", "cam1", "07:30:00", "17:30:00", 60, "Africa/Nairobi")
+    schedule = camera_schedule(camera, config)
+    assert schedule == CameraSchedule(time(7, 30), time(17, 30), 60, NAIROBI)
+
+
+def test_camera_schedule_unknown_timezone(config):
+    assert camera_schedule(CameraLocation("http://cam1", "cam1", timezone="Nowhere/City"), config).timezone is None
+
+
+def test_next_capture_time_in_camera_timezone():
+    schedule = CameraSchedule(time(7, 30), time(17, 30), 60, NAIROBI)
+    now = datetime(2023, 10, 1, 6, 10, tzinfo=timezone.utc)     # 09:10 in Nairobi
+    assert schedule.next_capture_time(now) == datetime(2023, 10, 1, 9, 30, tzinfo=NAIROBI)
+    assert schedule.is_active(now)
+
+
+def test_timer_captures_each_camera_on_its_own_grid():
+    timer = CaptureTimer(single_day=True)
+    now = datetime(2023, 10, 1, 16, 0)
+    timer.add("fast", CameraSchedule(time(6, 0), time(17, 0), 30), now)
+    timer.add("slow", CameraSchedule(time(6, 0), time(17, 0), 60), now)
+    captured = []
+    while timer:
+        capture_time, due = timer.pop_due()
+        captured.append((capture_time.strftime("%H:%M"), sorted(due)))
+        timer.reschedule(due, capture_time)
+    assert captured == [("16:30", ["fast"]), ("17:00", ["fast", "slow"])]
+
+
+def test_timer_orders_cameras_across_timezones():
+    timer = CaptureTimer()
+    now = datetime(2023, 10, 1, 4, 0, tzinfo=timezone.utc)
+    timer.add("nairobi", CameraSchedule(time(7, 30), time(17, 30), 60, NAIROBI), now)      # 04:30 UTC
+    timer.add("utc", CameraSchedule(time(4, 0), time(17, 30), 15, timezone.utc), now)     # 04:15 UTC
+    assert timer.pop_due()[1] == ["utc"]
+    assert timer.pop_due()[1] == ["nairobi"]
+
+
+def test_single_day_timer_ends_after_last_capture():
+    timer = CaptureTimer(single_day=True)
+    timer.add("cam", CameraSchedule(time(6, 0), time(17, 0), 30), datetime(2023, 10, 1, 17, 30))
+    assert len(timer) == 0
+
+
+def test_timer_remove_and_reschedule_camera():
+    timer = CaptureTimer()
+    now = datetime(2023, 10, 1, 8, 0)
+    timer.add("cam1", CameraSchedule(time(6, 0), time(17, 0), 30), now)
+    timer.add("cam2", CameraSchedule(time(6, 0), time(17, 0), 30), now)
+    timer.add("cam3", CameraSchedule(time(6, 0), time(17, 0), 30), now)
+    timer.remove("cam2")
+    timer.add("cam3", CameraSchedule(time(6, 0), time(17, 0), 45), now)   # the interval changed
+    assert len(timer) == 2
+    assert timer.next_capture_time() == datetime(2023, 10, 1, 8, 15)
+    capture_time, due = timer.pop_due()
+    assert (capture_time, due) == (datetime(2023, 10, 1, 8, 15), ["cam3"])
+    timer.remove("cam3")
+    timer.reschedule(due, capture_time)     # removed while capturing
+    assert timer.pop_due() == (datetime(2023, 10, 1, 8, 30), ["cam1"])
+    assert len(timer) == 0
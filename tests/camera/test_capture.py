@@ -1,11 +1,19 @@
-from datetime import datetime, time as time_class
-import pandas as pd
+from datetime import datetime, time as time_class, timedelta
+import os
+from pathlib import Path
+import subprocess
+import sys
 import pytest
 from unittest.mock import patch
 
 from camera.timing_functions import determine_delay_to_next_capture_time
-from camera.capture import capture_all_repeat, NONSTOP_CAPTURE, CAPTURE_TODAY
+from camera.capture import (CaptureCaches, capture_all_repeat, cameras_by_url, update_timer, NONSTOP_CAPTURE,
+                            CAPTURE_TODAY)
+from camera.camera_locations import CameraLocation
+from camera.camera_schedule import CameraSchedule, CaptureTimer
 from camera.config import CameraConfig
+from camera.timing_functions import CaptureScheduler
+import camera
 
 
 @pytest.mark.parametrize("current_time, start_time, end_time, expected_wait", [
@@ -33,7 +41,7 @@ def test_start_time_before_capture(current_time, start_time, end_time, expected_
     config.interval = 30
     # Mock the current time to be before the configured start time
     mock_now = current_time
-    with patch("camera.capture.datetime") as mock_datetime:
+    with patch("camera.timing_functions.datetime") as mock_datetime:
         mock_datetime.now.return_value = mock_now
         to_wait, _ = determine_delay_to_next_capture_time(config, mock_now)
     assert to_wait == expected_wait, f"Expected wait time {expected_wait} seconds, got {to_wait} seconds"
@@ -46,21 +54,113 @@ def test_start_time_before_capture(current_time, start_time, end_time, expected_
     pytest.param(60, id='60 minute interval'),
     pytest.param(90, id='90 minute interval'),
 ])
-def test_capture_repeat_one_day(interval: int):
+def test_capture_repeat_one_day(interval: int, monkeypatch, tmp_path):
     """Simulate the capture_all_repeat function to ensure it captures at the correct intervals over one day.
-       This test uses a mock time to simulate the current time and the capture process, to allow it to run quickly.
+       The clock jumps to every capture time instead of sleeping, to allow the test to run quickly.
     """
     config = CameraConfig()
+    config.image_save_path = tmp_path
     config.start = time_class(6, 30)
     config.end = time_class(10, 30)
     config.interval = interval
     config.verbose = True
-    time_tuple = (2023, 10, 1, 7, 0, 10)
-    current_time = datetime(*time_tuple)
-    from testfixtures import Replace, mock_datetime, mock_time
-
-    with Replace("camera.timing_functions.datetime", mock_datetime(current_time, delta=interval, delta_type='minutes')):
-        with patch("camera.timing_functions.sleep") as mock_sleep:
-            with Replace("camera.timing_functions.time", mock_time(*time_tuple, delta=interval, delta_type='minutes')):
-                succeeded = capture_all_repeat(pd.DataFrame(), config, capture_mode=CAPTURE_TODAY)
-                assert succeeded, "Capture should succeed without errors"
+    started = datetime(2023, 10, 1, 7, 0, 10)
+    clock = [started]
+    captures = []
+
+    def wait_until(self, capture_time, period, wake=None):
+        clock[0] = capture_time
+        return 0.0
+
+    monkeypatch.setattr(CameraSchedule, "now", lambda self: clock[0])
+    monkeypatch.setattr(CaptureScheduler, "wait_until", wait_until)
+    monkeypatch.setattr("camera.capture.capture_all",
+                        lambda cameras, *args: captures.append((clock[0], [camera.location for camera in cameras])))
+    cameras = [CameraLocation("http://cam1", "cam1"), CameraLocation("http://cam2", "cam2")]
+    succeeded = capture_all_repeat(cameras, config, capture_mode=CAPTURE_TODAY)
+    assert succeeded, "Capture should succeed without errors"
+    slots = [datetime(2023, 10, 1, 6, 30) + timedelta(minutes=minutes) for minutes in range(0, 241, interval)]
+    expected = [started] + [slot for slot in slots if slot > started]     # the active cameras at once
+    assert [capture_time for capture_time, _ in captures] == expected
+    assert all(locations == ["cam1", "cam2"] for _, locations in captures)
+
+
+def test_import_is_lightweight(tmp_path):
+    """Importing the app must not load the scraping stack nor create the log file."""
+    code = "import sys, camera.capture; print(sorted({'requests', 'bs4', 'asyncio'} & set(sys.modules)))"
+    env = {**os.environ, 'PYTHONPATH': str(Path(camera.__file__).parent.parent)}
+    output = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+    assert not (tmp_path / 'camera_capture.log').exists()
+
+
+def test_update_timer_applies_camera_changes():
+    config = CameraConfig()
+    config.start = time_class(6, 0)
+    config.end = time_class(18, 0)
+    config.interval = 30
+    timer = CaptureTimer()
+    cameras = cameras_by_url([CameraLocation("http://cam1", "cam1"), CameraLocation("http://cam2", "cam2")])
+    schedules = update_timer(timer, cameras, config, {})
+    assert len(timer) == 2
+
+    cameras = cameras_by_url([CameraLocation("http://cam1", "cam1", interval=60),
+                              CameraLocation("http://cam3", "cam3"), CameraLocation("http://cam3", "again")])
+    schedules = update_timer(timer, cameras, config, schedules)
+    assert sorted(schedules) == ["http://cam1", "http://cam3"]
+    assert schedules["http://cam1"].interval == 60
+    assert len(timer) == 2
+    assert cameras["http://cam3"].location == "cam3"
+
+
+def test_caches_are_kept_between_cycles(tmp_path, monkeypatch):
+    config = CameraConfig()
+    config.image_save_path = tmp_path
+    config.start, config.end, config.interval = time_class(0, 0), time_class(23, 59), 1
+    created, used = [], []
+    monkeypatch.setattr(CaptureCaches, "from_config", classmethod(lambda cls, config: created.append(object())
+                                                                  or created[-1]))
+
+    def capture_all(cameras, config, use_async, writer, caches):
+        used.append(caches)
+        if len(used) == 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr("camera.capture.capture_all", capture_all)
+    monkeypatch.setattr(CaptureScheduler, "wait_until", lambda self, capture_time, period, wake=None: 0.0)
+    capture_all_repeat([CameraLocation("http://cam1", "cam1")], config, NONSTOP_CAPTURE)
+    assert len(created) == 1
+    assert used == created * 3
+
+
+def test_scheduler_follows_reloaded_config(monkeypatch):
+    config = CameraConfig()
+    config.start, config.end, config.interval = time_class(0, 0), time_class(23, 59), 1
+    config.verbose = False
+    reloaded = CameraConfig()
+    reloaded.verbose = True
+
+    class Watcher:
+        def __init__(self, config, cameras):
+            self.config, self.cameras = config, cameras
+
+        def poll(self):
+            return False
+
+    waits = []
+
+    def wait_until(self, capture_time, period, wake=None):
+        waits.append((self.config, self.print_func))
+        if len(waits) == 1:
+            watcher.config = reloaded
+            return None
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr("camera.capture.SettingsWatcher", lambda config, cameras: watcher)
+    monkeypatch.setattr("camera.capture.capture_all", lambda *args: None)
+    monkeypatch.setattr(CaptureScheduler, "wait_until", wait_until)
+    watcher = Watcher(config, [CameraLocation("http://cam1", "cam1")])
+    capture_all_repeat(watcher.cameras, config, NONSTOP_CAPTURE)
+    assert waits[0][0] is config and waits[0][1] is not print
+    assert waits[1] == (reloaded, print)
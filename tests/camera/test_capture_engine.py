@@ -0,0 +1,132 @@
+import threading
+import time
+import pytest
+from unittest import mock
+from camera.capture_engine import run_capture, capture_camera, HostLimiter
+from camera.capture_functions import DownloadedImage
+from camera.http_client import NotModified
+from camera import metrics
+
+
+@pytest.fixture(autouse=True)
+def patch_logger():
+    with mock.patch("camera.capture_engine.logger"):
+        yield
+
+
+CAMERAS = [
+    ("http://host-a/cam1.html", "cam1"),
+    ("http://host-a/cam2.html", "cam2"),
+    ("http://host-b/cam3.html", "cam3"),
+    ("http://host-b/cam4.html", "cam4"),
+]
+
+
+def fake_capture(page_url, **kwargs):
+    return page_url.encode(), page_url.replace(".html", ".jpg")
+
+
+def test_sequential_capture_keeps_order(monkeypatch):
+    monkeypatch.setattr("camera.capture_engine.capture", fake_capture)
+    results = list(run_capture(CAMERAS, workers=1))
+    assert [r.location for r in results] == ["cam1", "cam2", "cam3", "cam4"]
+    assert all(r.succeeded for r in results)
+    assert results[0].img_url == "http://host-a/cam1.jpg"
+
+
+def test_concurrent_capture_collects_all(monkeypatch):
+    monkeypatch.setattr("camera.capture_engine.capture", fake_capture)
+    results = list(run_capture(CAMERAS, workers=4))
+    assert sorted(r.location for r in results) == ["cam1", "cam2", "cam3", "cam4"]
+    assert all(r.img_data == r.page_url.encode() for r in results)
+
+
+def test_concurrent_capture_respects_per_host_limit(monkeypatch):
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def slow_capture(page_url, **kwargs):
+        host = page_url.split('/')[2]
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+        time.sleep(0.05)
+        with lock:
+            active[host] -= 1
+        return b"data", page_url
+
+    monkeypatch.setattr("camera.capture_engine.capture", slow_capture)
+    cameras = [(f"http://host-a/cam{i}.html", f"cam{i}") for i in range(6)]
+    results = list(run_capture(cameras, workers=6, per_host_limit=2))
+    assert len(results) == 6
+    assert peak["host-a"] <= 2
+
+
+def test_capture_camera_records_error(monkeypatch):
+    def failing_capture(page_url, **kwargs):
+        raise ConnectionError("host unreachable")
+
+    monkeypatch.setattr("camera.capture_engine.capture", failing_capture)
+    result = capture_camera("http://host-a/cam1.html", "cam1")
+    assert not result.succeeded
+    assert result.error == "host unreachable"
+
+
+def test_capture_camera_no_image(monkeypatch):
+    monkeypatch.setattr("camera.capture_engine.capture", lambda url, **kwargs: (None, None))
+    result = capture_camera("http://host-a/cam1.html", "cam1")
+    assert not result.succeeded
+    assert result.error
+
+
+def test_capture_camera_unchanged(monkeypatch):
+    def unchanged_capture(page_url, **kwargs):
+        raise NotModified("http://host-a/cam1.jpg")
+
+    monkeypatch.setattr("camera.capture_engine.capture", unchanged_capture)
+    result = capture_camera("http://host-a/cam1.html", "cam1")
+    assert result.unchanged
+    assert not result.succeeded
+    assert result.error is None
+
+
+def test_capture_options_are_passed_on(monkeypatch):
+    received = []
+
+    def recording_capture(page_url, **kwargs):
+        received.append(kwargs)
+        return b"data", page_url
+
+    monkeypatch.setattr("camera.capture_engine.capture", recording_capture)
+    list(run_capture(CAMERAS[:2], workers=2, metadata_cache="cache", validators="validators"))
+    assert received == [{"metadata_cache": "cache", "validators": "validators"}] * 2
+
+
+def test_capture_camera_downloads_into_station_folder(monkeypatch, tmp_path):
+    def downloading_capture(page_url, download_folder=None, **kwargs):
+        return DownloadedImage(download_folder / ".tmp.part", 4, "digest"), "http://host-a/cam1.jpg"
+
+    monkeypatch.setattr("camera.capture_engine.capture", downloading_capture)
+    monkeypatch.setattr("camera.capture_engine.update_folder_tree", lambda root, station: root / station)
+    result = capture_camera("http://host-a/cam1.html", "cam1", images_root=tmp_path)
+    assert result.succeeded
+    assert result.img_data is None
+    assert result.image.path == tmp_path / "cam1" / ".tmp.part"
+
+
+def test_host_limiter_shares_semaphore_per_host():
+    limiter = HostLimiter(2)
+    assert limiter.for_url("http://host-a/x") is limiter.for_url("http://HOST-A/y")
+    assert limiter.for_url("http://host-a/x") is not limiter.for_url("http://host-b/x")
+
+
+def test_capture_camera_records_timing(monkeypatch):
+    def timed_capture(page_url, **kwargs):
+        metrics.record("page", 0.5)
+        return b"data", page_url
+
+    monkeypatch.setattr("camera.capture_engine.capture", timed_capture)
+    result = capture_camera("http://host-a/cam1.html", "cam1")
+    assert result.timing.location == "cam1"
+    assert result.timing.stages == {"page": 0.5}
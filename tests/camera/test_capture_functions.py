@@ -1,11 +1,24 @@
+import os
 import pytest
+import requests
 from unittest import mock
 from pathlib import Path
 from datetime import date, datetime
-from camera.capture_functions import retrieve_image, update_folder_tree, save_camera_image
+from camera.capture_functions import (retrieve_image, update_folder_tree, save_camera_image, download_image,
+                                      write_temporary_image, store_image, ImageTooLarge, DownloadedImage)
+from camera.http_client import NotModified, ValidatorCache
+from camera.dedup import DedupIndex
 
 # src/camera/test_capture_functions.py
 
+JPEG_DATA = b"\xff\xd8\xff\xdbfakeimagedata\xff\xd9"
+PNG_DATA = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x02\x00\x00\x00\x01IEND\xaeB`\x82"
+
+
+def jpeg(data: bytes) -> bytes:
+    """The data between the start and end markers of a JPEG image, so it passes as a complete image."""
+    return b"\xff\xd8" + data + b"\xff\xd9"
+
 
 @pytest.fixture(autouse=True)
 def patch_logger():
@@ -21,13 +34,13 @@ def test_retrieve_image_success(monkeypatch):
     class MockResponse:
         status_code = 200
         headers = {"Content-Type": "image/png"}
-        content = b"fakeimagedata"
+        content = PNG_DATA
 
-    def mock_get(url, headers):
+    def mock_get(url, validators, **kwargs):
         return MockResponse()
-    monkeypatch.setattr("camera.capture_functions.requests.get", mock_get)
+    monkeypatch.setattr("camera.capture_functions.conditional_get", mock_get)
     result = retrieve_image("http://example.com/image.png")
-    assert result == b"fakeimagedata"
+    assert result == PNG_DATA
 
 
 def test_retrieve_image_non_image(monkeypatch):
@@ -36,9 +49,9 @@ def test_retrieve_image_non_image(monkeypatch):
         headers = {"Content-Type": "text/html"}
         content = b"notanimage"
 
-    def mock_get(url, headers):
+    def mock_get(url, validators, **kwargs):
         return MockResponse()
-    monkeypatch.setattr("camera.capture_functions.requests.get", mock_get)
+    monkeypatch.setattr("camera.capture_functions.conditional_get", mock_get)
     result = retrieve_image("http://example.com/notimage")
     assert result is None
 
@@ -49,13 +62,44 @@ def test_retrieve_image_http_error(monkeypatch):
         headers = {"Content-Type": "image/png"}
         content = b""
 
-    def mock_get(url, headers):
+    def mock_get(url, validators, **kwargs):
         return MockResponse()
-    monkeypatch.setattr("camera.capture_functions.requests.get", mock_get)
+    monkeypatch.setattr("camera.capture_functions.conditional_get", mock_get)
     result = retrieve_image("http://example.com/404")
     assert result is None
 
 
+def test_retrieve_image_connection_error(monkeypatch):
+    def mock_get(url, validators, **kwargs):
+        raise requests.ConnectionError("connection refused")
+    monkeypatch.setattr("camera.capture_functions.conditional_get", mock_get)
+    result = retrieve_image("http://example.com/image.png")
+    assert result is None
+
+
+def test_retrieve_image_not_modified(monkeypatch, tmp_path):
+    class MockResponse:
+        status_code = 304
+        headers = {}
+        content = b""
+
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: MockResponse())
+    with pytest.raises(NotModified):
+        retrieve_image("http://example.com/image.jpg", ValidatorCache(tmp_path / "validators.json"))
+
+
+def test_retrieve_image_stores_validators(monkeypatch, tmp_path):
+    class MockResponse:
+        status_code = 200
+        headers = {"Content-Type": "image/jpeg", "ETag": '"abc"'}
+        content = JPEG_DATA
+
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: MockResponse())
+    validators = ValidatorCache(tmp_path / "validators.json")
+    assert retrieve_image("http://example.com/image.jpg", validators) == JPEG_DATA
+    assert validators.request_headers("http://example.com/image.jpg") == {"If-None-Match": '"abc"'}
+
+
 def test_update_folder_tree_creates_path(tmp_path, monkeypatch):
     # Fix the date to a known value
     monkeypatch.setattr("camera.capture_functions.date", mock.Mock(today=lambda: date(2023, 6, 1)))
@@ -85,10 +129,163 @@ def test_save_camera_image_creates_file(tmp_path, monkeypatch):
         now=lambda: fixed_dt, strftime=datetime.strftime))
     station = "stationC"
     suffix = ".jpg"
-    img_data = b"abc123"
+    img_data = jpeg(b"abc123")
     save_camera_image(img_data, tmp_path, station, suffix)
     img_folder = tmp_path / station / "2023" / "6" / "1"
     expected_filename = img_folder / f"{station}_20230601_1234{suffix}"
     assert expected_filename.exists()
     with open(expected_filename, "rb") as f:
         assert f.read() == img_data
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    monkeypatch.setattr("camera.capture_functions.date", mock.Mock(today=lambda: date(2023, 6, 1)))
+    times = iter([datetime(2023, 6, 1, 12, 0), datetime(2023, 6, 1, 12, 30)])
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: next(times)))
+
+
+def test_save_camera_image_skips_duplicate(tmp_path, fixed_time):
+    dedup = DedupIndex(tmp_path / "hashes.json", "skip")
+    first = save_camera_image(jpeg(b"same"), tmp_path, "stationD", ".jpg", dedup=dedup)
+    second = save_camera_image(jpeg(b"same"), tmp_path, "stationD", ".jpg", dedup=dedup)
+    assert first.exists()
+    assert second is None
+    assert len(list(first.parent.iterdir())) == 1
+    assert dedup.duplicates == 1
+    assert dedup.bytes_saved == 8
+
+
+def test_save_camera_image_links_duplicate(tmp_path, fixed_time):
+    dedup = DedupIndex(tmp_path / "hashes.json", "hardlink")
+    first = save_camera_image(jpeg(b"same"), tmp_path, "stationE", ".jpg", dedup=dedup)
+    second = save_camera_image(jpeg(b"same"), tmp_path, "stationE", ".jpg", dedup=dedup)
+    assert second.name == "stationE_20230601_1230.jpg"
+    assert second.read_bytes() == jpeg(b"same")
+    assert os.path.samefile(first, second)
+
+
+def test_save_camera_image_changed_frame_is_saved(tmp_path, fixed_time):
+    dedup = DedupIndex(tmp_path / "hashes.json", "skip")
+    save_camera_image(jpeg(b"frame1"), tmp_path, "stationF", ".jpg", dedup=dedup)
+    second = save_camera_image(jpeg(b"frame2"), tmp_path, "stationF", ".jpg", dedup=dedup)
+    assert second.read_bytes() == jpeg(b"frame2")
+    assert dedup.duplicates == 0
+
+
+class StreamingResponse:
+    def __init__(self, chunks, status_code=200, headers=None):
+        self.chunks = chunks
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {"Content-Type": "image/jpeg"}
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(self.chunks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+def test_write_temporary_image(tmp_path):
+    image = write_temporary_image([b"abc", b"def"], tmp_path)
+    assert image.path.parent == tmp_path
+    assert image.path.name.endswith(".part")
+    assert image.path.read_bytes() == b"abcdef"
+    assert image.size == 6
+
+
+def test_write_temporary_image_too_large_removes_file(tmp_path):
+    with pytest.raises(ImageTooLarge):
+        write_temporary_image([b"abc", b"def"], tmp_path, max_size=4)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_image_streams_to_folder(monkeypatch, tmp_path):
+    response = StreamingResponse([JPEG_DATA[:8], JPEG_DATA[8:]])
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: response)
+    image = download_image("http://example.com/image.jpg", tmp_path)
+    assert isinstance(image, DownloadedImage)
+    assert image.path.read_bytes() == JPEG_DATA
+    assert image.info.format == "jpeg"
+    assert response.closed
+
+
+@pytest.mark.parametrize("content", [b"", b"<html><body>Camera offline</body></html>", JPEG_DATA[:-2]])
+def test_retrieve_image_rejects_invalid_image(monkeypatch, content):
+    class MockResponse:
+        status_code = 200
+        headers = {"Content-Type": "image/jpeg"}
+
+    MockResponse.content = content
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: MockResponse())
+    assert retrieve_image("http://example.com/image.jpg") is None
+
+
+def test_download_image_rejects_truncated_image(monkeypatch, tmp_path):
+    response = StreamingResponse([JPEG_DATA[:8], JPEG_DATA[8:-2]])
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: response)
+    assert download_image("http://example.com/image.jpg", tmp_path) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_image_aborts_when_too_large(monkeypatch, tmp_path):
+    response = StreamingResponse([b"fake", b"image"])
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: response)
+    assert download_image("http://example.com/image.jpg", tmp_path, max_size=5) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_image_declared_too_large(monkeypatch, tmp_path):
+    response = StreamingResponse([b"fake"], headers={"Content-Type": "image/jpeg", "Content-Length": "5000"})
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: response)
+    assert download_image("http://example.com/image.jpg", tmp_path, max_size=1000) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_image_not_modified(monkeypatch, tmp_path):
+    response = StreamingResponse([], status_code=304, headers={})
+    monkeypatch.setattr("camera.capture_functions.conditional_get", lambda url, validators, **kwargs: response)
+    with pytest.raises(NotModified):
+        download_image("http://example.com/image.jpg", tmp_path, ValidatorCache(tmp_path / "validators.json"))
+
+
+def test_store_image_renames_temporary_file(tmp_path, fixed_time):
+    image = write_temporary_image([b"frame"], tmp_path)
+    saved = store_image(image, "stationG", ".jpg")
+    assert saved == tmp_path / "stationG_20230601_1200.jpg"
+    assert saved.read_bytes() == b"frame"
+    assert not image.path.exists()
+
+
+def test_store_image_discards_skipped_duplicate(tmp_path, fixed_time):
+    dedup = DedupIndex(tmp_path / "hashes.json", "skip")
+    store_image(write_temporary_image([b"same"], tmp_path), "stationH", ".jpg", dedup)
+    assert store_image(write_temporary_image([b"same"], tmp_path), "stationH", ".jpg", dedup) is None
+    assert [p.name for p in tmp_path.iterdir() if p.suffix != ".json"] == ["stationH_20230601_1200.jpg"]
+
+
+def test_store_image_does_not_overwrite_frame_of_same_minute(tmp_path, monkeypatch):
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: datetime(2023, 6, 1, 12, 0)))
+    first = store_image(write_temporary_image([b"camera 1"], tmp_path), "stationI", ".jpg")
+    second = store_image(write_temporary_image([b"camera 2"], tmp_path), "stationI", ".jpg")
+    assert (first.name, second.name) == ("stationI_20230601_1200.jpg", "stationI_20230601_1200_2.jpg")
+    assert (first.read_bytes(), second.read_bytes()) == (b"camera 1", b"camera 2")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["stationI_20230601_1200.jpg",
+                                                                "stationI_20230601_1200_2.jpg"]
+
+
+def test_claim_of_stopped_process_leaves_no_empty_frame(tmp_path, monkeypatch):
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: datetime(2023, 6, 1, 12, 0)))
+    (tmp_path / ".stationJ_20230601_1200.jpg.claim").touch()     # left behind by a killed worker
+    saved = store_image(write_temporary_image([b"camera"], tmp_path), "stationJ", ".jpg")
+    assert saved.name == "stationJ_20230601_1200_2.jpg"
+    assert not (tmp_path / "stationJ_20230601_1200.jpg").exists()
+
+
+def test_save_camera_image_rejects_invalid_image(tmp_path, fixed_time):
+    assert save_camera_image(b"<html>Camera offline</html>", tmp_path, "stationK", ".jpg") is None
+    assert not (tmp_path / "stationK").exists()
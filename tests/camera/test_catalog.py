@@ -0,0 +1,154 @@
+from datetime import datetime, time, timedelta
+import os
+import sqlite3
+from unittest import mock
+from zoneinfo import ZoneInfo
+from argparse import Namespace
+import pytest
+from camera.camera_schedule import CameraSchedule
+from camera.capture_functions import save_camera_image
+from camera.catalog import Catalog, expected_slots, SAVED, DUPLICATE, FAILED
+from camera.dedup import DedupIndex, image_digest
+
+
+def jpeg(data: bytes) -> bytes:
+    """The data between the start and end markers of a JPEG image, so it passes as a complete image."""
+    return b"\xff\xd8" + data + b"\xff\xd9"
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(tmp_path / ".capture" / "catalog.sqlite", tmp_path)
+    yield catalog
+    catalog.close()
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    monkeypatch.setattr("camera.capture_functions.date", mock.Mock(today=lambda: datetime(2023, 6, 1).date()))
+    times = iter([datetime(2023, 6, 1, 12, 0, 5), datetime(2023, 6, 1, 12, 30, 5)])
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: next(times)))
+
+
+def write_frame(root, station, stamp, data=b"frame"):
+    path = root / station / stamp[:4] / stamp[4:6].lstrip("0") / stamp[6:8].lstrip("0") / f"{station}_{stamp}.jpg"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_saved_frames_are_added(tmp_path, catalog, fixed_time):
+    dedup = DedupIndex(tmp_path / "hashes.json", "hardlink")
+    save_camera_image(jpeg(b"same"), tmp_path, "stationA", ".jpg", dedup, catalog, "http://host/a.jpg")
+    save_camera_image(jpeg(b"same"), tmp_path, "stationA", ".jpg", dedup, catalog, "http://host/a.jpg")
+    catalog.add_failure("stationA", "http://host/a.html")
+    frames = catalog.frames("stationA", datetime(2023, 6, 1), datetime(2023, 6, 2))
+    assert [(f.slot, f.status) for f in frames][:2] == [("2023-06-01 12:00", SAVED), ("2023-06-01 12:30", DUPLICATE)]
+    assert frames[0].path == "stationA/2023/6/1/stationA_20230601_1200.jpg"
+    assert frames[0].captured == "2023-06-01 12:00:05"
+    assert (frames[0].size, frames[0].hash, frames[0].source_url) == (8, image_digest(jpeg(b"same")),
+                                                                      "http://host/a.jpg")
+    assert sum(f.status == FAILED for f in catalog.frames("stationA", datetime(2023, 6, 1))) == 1
+
+
+def test_import_tree(tmp_path, catalog):
+    first = write_frame(tmp_path, "station_B", "20230601_1200")
+    write_frame(tmp_path, "station_B", "20230601_1230", b"other")
+    os.link(first, first.with_name("station_B_20230601_1300.jpg"))
+    (first.parent / ".station_B_20230601_1330.jpg.part").write_bytes(b"partial")
+    (tmp_path / ".capture" / "station_B_20230601_1400.jpg").write_bytes(b"state")
+    (first.parent / "notes.txt").write_text("not a frame")
+
+    assert catalog.import_tree() == 3
+    frames = catalog.frames("station_B", datetime(2023, 6, 1), datetime(2023, 6, 2))
+    assert [(f.slot[-5:], f.status) for f in frames] == [("12:00", SAVED), ("12:30", SAVED), ("13:00", DUPLICATE)]
+    assert frames[2].hash == frames[0].hash == image_digest(b"frame")
+    assert frames[2].captured == "2023-06-01 13:00:00"
+    assert catalog.import_tree() == 0
+
+
+def test_latest_frame_per_station(tmp_path, catalog):
+    catalog.add("stationA", tmp_path / "a1.jpg", datetime(2023, 6, 1, 12, 0))
+    catalog.add("stationA", tmp_path / "a2.jpg", datetime(2023, 6, 1, 12, 30))
+    catalog.add_failure("stationA")
+    catalog.add("stationB", tmp_path / "b1.jpg", datetime(2023, 6, 1, 11, 0))
+    assert [(f.station, f.path) for f in catalog.latest()] == [("stationA", "a2.jpg"), ("stationB", "b1.jpg")]
+    assert [f.path for f in catalog.latest("stationB")] == ["b1.jpg"]
+
+
+def test_missed_slots(tmp_path, catalog):
+    schedule = CameraSchedule(time(8, 0), time(10, 0), 30)
+    for captured in (datetime(2023, 6, 1, 8, 0, 10), datetime(2023, 6, 1, 9, 3), datetime(2023, 6, 1, 10, 29)):
+        catalog.add("stationA", tmp_path / f"{captured:%H%M}.jpg", captured)
+    catalog.add("stationA", None, datetime(2023, 6, 1, 9, 30), status=FAILED)
+    missed = catalog.missed_slots("stationA", schedule, datetime(2023, 5, 25), datetime(2023, 6, 1, 23, 0))
+    assert missed == [datetime(2023, 6, 1, 8, 30), datetime(2023, 6, 1, 9, 30)]
+    assert catalog.missed_slots("unknown", schedule, datetime(2023, 5, 25)) == []
+
+
+def test_expected_slots_in_camera_timezone():
+    schedule = CameraSchedule(time(8, 0), time(9, 0), 30, ZoneInfo("Africa/Nairobi"))
+    since = datetime(2023, 6, 1, tzinfo=ZoneInfo("Africa/Nairobi")).astimezone().replace(tzinfo=None)
+    slots = expected_slots(schedule, since, since + timedelta(days=1) - timedelta(seconds=1))
+    assert [slot - since for slot in slots] == [timedelta(hours=8), timedelta(hours=8, minutes=30),
+                                                timedelta(hours=9)]
+
+
+def test_query_latest_cli(tmp_path, catalog, capsys):
+    catalog.add("stationA", tmp_path / "stationA" / "a1.jpg", datetime(2023, 6, 1, 12, 0))
+    catalog.save()
+    from camera.cli_parser import query_latest_cli
+    with mock.patch("camera.cli_parser.Catalog.from_config", return_value=catalog), \
+            mock.patch("camera.cli_parser.CameraConfig"):
+        query_latest_cli(Namespace(station=None))
+    assert capsys.readouterr().out == "stationA: 2023-06-01 12:00  stationA/a1.jpg\n"
+
+
+def test_image_information_is_added(tmp_path, catalog, fixed_time):
+    # start of image, frame header of a 1280x720 image, end of image
+    jpeg = b"\xff\xd8\xff\xc0\x00\x0b\x08\x02\xd0\x05\x00\x01\x01\x11\x00\xff\xd9"
+    save_camera_image(jpeg, tmp_path, "stationE", ".jpg", catalog=catalog)
+    assert save_camera_image(b"not an image", tmp_path, "stationE", ".jpg", catalog=catalog) is None
+    frames = catalog.frames("stationE", datetime(2023, 6, 1))
+    assert [(f.width, f.height, f.taken) for f in frames] == [(1280, 720, None)]
+
+
+def test_columns_are_added_to_existing_catalog(tmp_path):
+    path = tmp_path / "old.sqlite"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE frames (id INTEGER PRIMARY KEY, station TEXT NOT NULL, slot TEXT NOT NULL, "
+                       "captured TEXT NOT NULL, path TEXT UNIQUE, size INTEGER NOT NULL DEFAULT 0, hash TEXT, "
+                       "source_url TEXT, status TEXT NOT NULL)")
+    connection.execute("INSERT INTO frames (station, slot, captured, path, status) "
+                       "VALUES ('old', '2023-06-01 12:00', '2023-06-01 12:00:00', 'old.jpg', 'saved')")
+    connection.commit()
+    connection.close()
+    catalog = Catalog(path, tmp_path)
+    catalog.add("old", tmp_path / "new.jpg", datetime(2023, 6, 1, 12, 30))
+    frames = catalog.frames("old", datetime(2023, 6, 1))
+    assert [(f.path, f.width) for f in frames] == [("old.jpg", None), ("new.jpg", None)]
+    catalog.close()
+
+
+def test_import_tree_adds_reference_files_as_similar(tmp_path, catalog):
+    write_frame(tmp_path, "stationF", "20230601_1200")
+    reference = write_frame(tmp_path, "stationF", "20230601_1230").with_suffix(".ref")
+    reference.with_suffix(".jpg").rename(reference)
+    reference.write_text("stationF_20230601_1200.jpg")
+    assert catalog.import_tree() == 2
+    frames = catalog.frames("stationF", datetime(2023, 6, 1), datetime(2023, 6, 2))
+    assert [(f.status, f.hash) for f in frames][1] == ("similar", None)
+
+
+def test_frames_are_committed_when_added(tmp_path, catalog, monkeypatch, caplog):
+    catalog.add("stationG", tmp_path / "stationG_20230601_1200.jpg", datetime(2023, 6, 1, 12))
+    other = sqlite3.connect(catalog.path)
+    assert other.execute("SELECT COUNT(*) FROM frames").fetchone()[0] == 1     # no write transaction is open
+    monkeypatch.setattr("camera.catalog.LOCK_TIMEOUT", 0.1)
+    locked = Catalog(catalog.path, tmp_path)
+    other.execute("BEGIN IMMEDIATE")
+    locked.add("stationG", tmp_path / "stationG_20230601_1230.jpg", datetime(2023, 6, 1, 12, 30))
+    assert "Unable to add stationG_20230601_1230.jpg of stationG to the catalog" in caplog.text
+    other.rollback()
+    other.close()
+    locked.close()
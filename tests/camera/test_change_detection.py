@@ -0,0 +1,105 @@
+import io
+from datetime import datetime
+from unittest import mock
+import pytest
+from camera import change_detection
+from camera.capture_functions import save_camera_image
+from camera.catalog import Catalog, SAVED, SIMILAR
+from camera.change_detection import ChangeDetector, THUMBNAIL_SIZE, read_reference
+
+numpy = pytest.importorskip("numpy")
+
+JPEG_DATA = b"\xff\xd8\xff\xdbframe\xff\xd9"
+
+
+@pytest.fixture
+def available(monkeypatch):
+    monkeypatch.setattr(change_detection, "change_detection_available", lambda: True)
+
+
+@pytest.fixture
+def fixed_time(monkeypatch):
+    times = iter([datetime(2023, 6, 1, 12, 0), datetime(2023, 6, 1, 12, 30), datetime(2023, 6, 1, 13, 0)])
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: next(times)))
+
+
+def scene(brightness: int):
+    return numpy.full((THUMBNAIL_SIZE, THUMBNAIL_SIZE), brightness, dtype=numpy.uint8)
+
+
+def test_disabled_without_threshold(tmp_path, available):
+    assert not ChangeDetector(tmp_path / "thumbnails.json").enabled
+    assert ChangeDetector(tmp_path / "thumbnails.json", 2.0).enabled
+
+
+def test_disabled_without_libraries(tmp_path, monkeypatch):
+    monkeypatch.setattr(change_detection, "change_detection_available", lambda: False)
+    assert not ChangeDetector(tmp_path / "thumbnails.json", 2.0).enabled
+
+
+def test_find_nearly_identical_frame(tmp_path, available):
+    frame = tmp_path / "frame.jpg"
+    frame.write_bytes(JPEG_DATA)
+    changes = ChangeDetector(tmp_path / "thumbnails.json", 2.0)
+    assert changes.find("station", scene(10)) is None
+    changes.add("station", scene(10), frame)
+    assert changes.difference(scene(10), scene(12)) == pytest.approx(2 / 255 * 100)
+    assert changes.find("station", scene(12)) == frame      # 0.8% different
+    assert changes.find("station", scene(20)) is None       # 3.9% different
+    assert changes.find("other", scene(10)) is None
+    frame.unlink()
+    assert changes.find("station", scene(10)) is None
+
+
+def test_thumbnails_are_kept_between_runs(tmp_path, available):
+    frame = tmp_path / "frame.jpg"
+    frame.write_bytes(JPEG_DATA)
+    changes = ChangeDetector(tmp_path / "thumbnails.json", 2.0)
+    changes.add("station", scene(100), frame)
+    changes.save()
+    assert ChangeDetector(tmp_path / "thumbnails.json", 2.0).find("station", scene(101)) == frame
+
+
+def test_nearly_identical_frame_is_saved_as_reference(tmp_path, available, fixed_time, monkeypatch):
+    thumbnails = iter([scene(10), scene(11), scene(60)])
+    monkeypatch.setattr("camera.capture_functions.thumbnail", lambda path: next(thumbnails))
+    changes = ChangeDetector(tmp_path / "thumbnails.json", 2.0)
+    catalog = Catalog(tmp_path / "catalog.sqlite", tmp_path)
+    first = save_camera_image(JPEG_DATA, tmp_path, "station", ".jpg", catalog=catalog, changes=changes)
+    reference = save_camera_image(JPEG_DATA + b"\0", tmp_path, "station", ".jpg", catalog=catalog, changes=changes)
+    changed = save_camera_image(JPEG_DATA, tmp_path, "station", ".jpg", catalog=catalog, changes=changes)
+    assert reference == first.with_name("station_20230601_1230.ref")
+    assert read_reference(reference) == first
+    assert changed.name == "station_20230601_1300.jpg"
+    assert sorted(path.name for path in first.parent.iterdir()) == [first.name, reference.name, changed.name]
+    assert changes.similar == 1
+    frames = catalog.frames("station", datetime(2023, 6, 1), datetime(2023, 6, 2))
+    assert [frame.status for frame in frames] == [SAVED, SIMILAR, SAVED]
+    catalog.close()
+
+
+def test_thumbnail_of_jpeg(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    output = io.BytesIO()
+    Image.new("RGB", (640, 480), (200, 200, 200)).save(output, "JPEG")
+    path = tmp_path / "frame.jpg"
+    path.write_bytes(output.getvalue())
+    pixels = change_detection.thumbnail(path)
+    assert pixels.shape == (THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    assert abs(int(pixels.mean()) - 200) <= 2
+
+
+def test_reference_is_not_made_to_another_day(tmp_path, available, monkeypatch):
+    days = iter([datetime(2023, 6, 1).date(), datetime(2023, 6, 2).date()])
+    monkeypatch.setattr("camera.capture_functions.date", mock.Mock(today=lambda: next(days)))
+    times = iter([datetime(2023, 6, 1, 23, 30), datetime(2023, 6, 2, 0, 0)])
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: next(times)))
+    monkeypatch.setattr("camera.capture_functions.thumbnail", lambda path: scene(10))
+    changes = ChangeDetector(tmp_path / "thumbnails.json", 2.0)
+    first = save_camera_image(JPEG_DATA, tmp_path, "station", ".jpg", changes=changes)
+    second = save_camera_image(JPEG_DATA, tmp_path, "station", ".jpg", changes=changes)
+    assert (first.parent.name, second.parent.name) == ("1", "2")
+    assert second.name == "station_20230602_0000.jpg"       # the same scene, but the first frame of the day
+    assert changes.similar == 0
+    assert changes.find("station", scene(10), second.parent) == second
+    assert changes.find("station", scene(10), first.parent) is None
@@ -1,7 +1,8 @@
 from datetime import time
 from unittest import mock
 from argparse import Namespace
-from camera.cli_parser import cli_parser, list_cli, update_cli
+from camera.cli_parser import cli_parser, list_cli, update_cli, status_cli
+from camera.camera_health import HealthRegistry
 
 # src/camera/test_cli_parser.py
 
@@ -123,3 +124,51 @@ def test_update_cli_start_after_end(monkeypatch):
         update_cli(args)
         mock_logger.error.assert_called_with("Start time must be before end time.")
         config.save.assert_not_called()
+
+
+def test_update_cli_workers_valid(monkeypatch):
+    with mock.patch("camera.cli_parser.CameraConfig") as MockConfig, \
+            mock.patch("camera.cli_parser.logger") as mock_logger:
+        instance = MockConfig.return_value
+        args = Namespace(key='workers', value='8')
+        update_cli(args)
+        assert instance.workers == 8
+        instance.save.assert_called_once()
+        mock_logger.info.assert_called()
+
+
+def test_update_cli_workers_out_of_range(monkeypatch):
+    with mock.patch("camera.cli_parser.CameraConfig") as MockConfig, \
+            mock.patch("camera.cli_parser.logger") as mock_logger:
+        instance = MockConfig.return_value
+        args = Namespace(key='workers', value='0')
+        update_cli(args)
+        mock_logger.error.assert_called_with("Allowed workers range: 1 to 64.")
+        instance.save.assert_not_called()
+
+
+def test_update_cli_dedup_mode(monkeypatch):
+    with mock.patch("camera.cli_parser.CameraConfig") as MockConfig, \
+            mock.patch("camera.cli_parser.logger") as mock_logger:
+        instance = MockConfig.return_value
+        update_cli(Namespace(key='dedup_mode', value='skip'))
+        assert instance.dedup_mode == 'skip'
+        instance.save.assert_called_once()
+        instance.save.reset_mock()
+        update_cli(Namespace(key='dedup_mode', value='copy'))
+        mock_logger.error.assert_called_with("Invalid value for dedup_mode. Must be one of: off, skip, hardlink.")
+        instance.save.assert_not_called()
+
+
+def test_status_cli_shows_failing_camera(tmp_path):
+    assert cli_parser().parse_args(['status']).Command == 'status'
+    with mock.patch("camera.cli_parser.CameraConfig"), \
+            mock.patch("camera.cli_parser.HealthRegistry.from_config") as from_config, \
+            mock.patch("builtins.print") as mock_print:
+        health = HealthRegistry(tmp_path / "health.json", failure_threshold=1)
+        health.record_failure("http://host/cam1.html", "Page not accessible")
+        from_config.return_value = health
+        status_cli(Namespace())
+        output = " ".join(str(call) for call in mock_print.call_args_list)
+        assert "status: open" in output
+        assert "Page not accessible" in output
@@ -123,3 +123,35 @@ def test_fields_yields_all_fields_with_descriptions():
         assert field_name in fields
         # Description should match FIELD_DESCRIPTIONS or be empty string
         assert isinstance(fields[field_name][1], str)
+
+
+def test_load_config_capture_workers(patch_home_and_config):
+    config_file = patch_home_and_config
+    config_data = {
+        "image_save_path": "/tmp/images",
+        "locations_file": "camera_locations.txt",
+        "workers": 8,
+        "per_host_limit": 2
+    }
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump(config_data, f)
+    cfg = CameraConfig()
+    assert cfg.workers == 8
+    assert cfg.per_host_limit == 2
+
+
+@pytest.mark.parametrize("value, expected", [(False, False), ("false", False), ("No", False), ("on", True), (1, True)])
+def test_load_config_conditional_requests(patch_home_and_config, value, expected):
+    config_file = patch_home_and_config
+    config_file.write_text(json.dumps({"image_save_path": "/tmp/images", "locations_file": "camera_locations.txt",
+                                       "conditional_requests": value}))
+    assert CameraConfig().conditional_requests is expected
+
+
+def test_load_config_invalid_boolean(patch_home_and_config):
+    config_file = patch_home_and_config
+    config_file.write_text(json.dumps({"image_save_path": "/tmp/images", "locations_file": "camera_locations.txt",
+                                       "conditional_requests": "maybe"}))
+    cfg = CameraConfig()
+    with pytest.raises(ValueError, match="invalid boolean 'maybe'"):
+        cfg.load(strict=True)
@@ -0,0 +1,52 @@
+from camera.dedup import DedupIndex, image_digest, format_bytes
+
+
+def test_image_digest_is_stable():
+    assert image_digest(b"abc") == image_digest(b"abc")
+    assert image_digest(b"abc") != image_digest(b"abd")
+
+
+def test_find_returns_existing_file(tmp_path):
+    frame = tmp_path / "frame.jpg"
+    frame.write_bytes(b"abc")
+    index = DedupIndex(tmp_path / "hashes.json", "skip")
+    index.add("stationA", image_digest(b"abc"), frame)
+    assert index.find("stationA", image_digest(b"abc")) == frame
+    assert index.find("stationB", image_digest(b"abc")) is None
+
+
+def test_find_ignores_removed_file(tmp_path):
+    index = DedupIndex(tmp_path / "hashes.json", "skip")
+    index.add("stationA", image_digest(b"abc"), tmp_path / "removed.jpg")
+    assert index.find("stationA", image_digest(b"abc")) is None
+
+
+def test_history_is_limited(tmp_path):
+    index = DedupIndex(tmp_path / "hashes.json", "skip", history=2)
+    for i in range(3):
+        frame = tmp_path / f"frame{i}.jpg"
+        frame.write_bytes(bytes([i]))
+        index.add("stationA", image_digest(bytes([i])), frame)
+    assert index.find("stationA", image_digest(bytes([0]))) is None
+    assert index.find("stationA", image_digest(bytes([2]))) is not None
+
+
+def test_index_is_persisted(tmp_path):
+    frame = tmp_path / "frame.jpg"
+    frame.write_bytes(b"abc")
+    index = DedupIndex(tmp_path / "hashes.json", "hardlink")
+    index.add("stationA", image_digest(b"abc"), frame)
+    index.save()
+    assert DedupIndex(tmp_path / "hashes.json", "hardlink").find("stationA", image_digest(b"abc")) == frame
+
+
+def test_summary_reports_saved_bytes(tmp_path):
+    index = DedupIndex(tmp_path / "hashes.json", "skip")
+    index.record_duplicate(2048)
+    index.record_duplicate(1024)
+    assert index.summary() == "Duplicate frames: 2, disk space saved: 3.0 kB"
+
+
+def test_format_bytes():
+    assert format_bytes(100) == "100 bytes"
+    assert format_bytes(5 * 1024 * 1024) == "5.0 MB"
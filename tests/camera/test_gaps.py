@@ -0,0 +1,76 @@
+from datetime import date, datetime, time
+import pytest
+from camera.camera_locations import CameraLocation
+from camera.camera_schedule import CameraSchedule
+from camera.catalog import Catalog
+from camera.config import CameraConfig
+from camera.gaps import StationGaps, backfill, find_all_gaps, find_gaps, first_day, frame_times
+
+SCHEDULE = CameraSchedule(time(8, 0), time(10, 0), 30)
+CAMERA = CameraLocation("http://cam1", "stationA", "08:00", "10:00", 30)
+
+
+def write_frames(root, station, *stamps):
+    for stamp in stamps:
+        day = datetime.strptime(stamp, "%Y%m%d_%H%M")
+        folder = root / station / str(day.year) / str(day.month) / str(day.day)
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"{station}_{stamp}.jpg").write_bytes(b"frame")
+
+
+def test_frame_times_from_names(tmp_path):
+    write_frames(tmp_path, "stationA", "20230601_0800", "20230601_0833")
+    folder = tmp_path / "stationA" / "2023" / "6" / "1"
+    (folder / ".tmp123.part").write_bytes(b"")
+    (folder / "notes.txt").write_text("")
+    assert frame_times(tmp_path, "stationA", date(2023, 6, 1)) == [datetime(2023, 6, 1, 8, 0),
+                                                                   datetime(2023, 6, 1, 8, 33)]
+    assert frame_times(tmp_path, "stationA", date(2023, 6, 2)) == []
+
+
+def test_first_day(tmp_path):
+    write_frames(tmp_path, "stationA", "20230601_0800", "20221231_0800", "20230115_0800")
+    assert first_day(tmp_path, "stationA") == date(2022, 12, 31)
+    assert first_day(tmp_path, "unknown") is None
+
+
+def test_find_gaps(tmp_path):
+    # 1 June: 08:30 and 09:30 missed; 2 June: only 08:00 captured, 08:30 is the current slot
+    write_frames(tmp_path, "stationA", "20230601_0800", "20230601_0902", "20230601_1000",
+                 "20230602_0800")
+    gaps = find_gaps(tmp_path, CAMERA, SCHEDULE, datetime(2023, 5, 1), datetime(2023, 6, 2, 8, 40))
+    assert gaps.missed == [datetime(2023, 6, 1, 8, 30), datetime(2023, 6, 1, 9, 30)]
+    assert gaps.current == datetime(2023, 6, 2, 8, 30)
+
+
+def test_find_gaps_current_slot_captured(tmp_path):
+    write_frames(tmp_path, "stationA", "20230602_0800", "20230602_0831")
+    gaps = find_gaps(tmp_path, CAMERA, SCHEDULE, datetime(2023, 6, 2), datetime(2023, 6, 2, 8, 40))
+    assert gaps.missed == []
+    assert gaps.current is None
+
+
+@pytest.fixture
+def config(tmp_path):
+    config = CameraConfig()
+    config.image_save_path = tmp_path
+    return config
+
+
+def test_find_all_gaps_from_catalog(tmp_path, config):
+    catalog = Catalog(tmp_path / "catalog.sqlite", tmp_path)
+    catalog.add("stationA", tmp_path / "a.jpg", datetime(2023, 6, 2, 8, 0, 5))
+    all_gaps = find_all_gaps(config, [CAMERA], datetime(2023, 6, 1), datetime(2023, 6, 2, 9, 10), catalog)
+    catalog.close()
+    assert all_gaps[0].missed == [datetime(2023, 6, 2, 8, 30)]
+    assert all_gaps[0].current == datetime(2023, 6, 2, 9, 0)
+
+
+def test_backfill_captures_current_slot_only(config, monkeypatch):
+    captured = []
+    monkeypatch.setattr("camera.capture.capture_all", lambda cameras, config, use_async: captured.extend(cameras))
+    other = CameraLocation("http://cam2", "stationB")
+    all_gaps = [StationGaps(CAMERA, [datetime(2023, 6, 1, 8, 30)], datetime(2023, 6, 2, 8, 30)),
+                StationGaps(other, [datetime(2023, 6, 1, 8, 30)])]
+    assert backfill(all_gaps, config) == [CAMERA]
+    assert captured == [CAMERA]
@@ -0,0 +1,92 @@
+import pytest
+from unittest import mock
+from camera import http_client
+from camera.config import CameraConfig
+from camera.http_client import JitterRetry, create_session, USER_AGENT, ValidatorCache, conditional_get
+
+
+@pytest.fixture(autouse=True)
+def reset_session(monkeypatch):
+    monkeypatch.setattr("camera.http_client._session", None)
+    monkeypatch.setattr("camera.http_client._timeout", (http_client.DEFAULT_CONNECT_TIMEOUT,
+                                                        http_client.DEFAULT_READ_TIMEOUT))
+    yield
+
+
+def test_create_session_sets_user_agent_and_retries():
+    session = create_session(retries=2, backoff_factor=0.1, pool_size=5)
+    assert session.headers["User-Agent"] == USER_AGENT
+    adapter = session.get_adapter("https://webcams.aeroclubea.com/")
+    assert adapter.max_retries.total == 2
+    assert 503 in adapter.max_retries.status_forcelist
+    assert adapter._pool_maxsize == 5
+
+
+def test_get_session_is_shared():
+    assert http_client.get_session() is http_client.get_session()
+
+
+def test_configure_uses_config_settings():
+    config = CameraConfig()
+    config.connect_timeout = 2.0
+    config.read_timeout = 7.0
+    config.retries = 1
+    config.workers = 16
+    session = http_client.configure(config)
+    assert http_client.get_session() is session
+    assert session.get_adapter("http://example.com").max_retries.total == 1
+    with mock.patch.object(session, "get") as mock_get:
+        http_client.http_get("http://example.com/page.html")
+        mock_get.assert_called_once_with("http://example.com/page.html", timeout=(2.0, 7.0))
+
+
+def test_jitter_retry_backoff_is_bounded():
+    retry = JitterRetry(total=5, backoff_factor=1.0)
+    retry = retry.increment(method="GET", url="/")
+    retry = retry.increment(method="GET", url="/")
+    base = super(JitterRetry, retry).get_backoff_time()
+    for _ in range(20):
+        backoff = retry.get_backoff_time()
+        assert base <= backoff <= base * 1.5
+
+
+def test_jitter_retry_no_backoff_before_first_retry():
+    assert JitterRetry(total=3, backoff_factor=1.0).get_backoff_time() == 0
+
+
+class MockResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_validator_cache_request_headers(tmp_path):
+    validators = ValidatorCache(tmp_path / "validators.json")
+    assert validators.request_headers("http://cam/image.jpg") == {}
+    validators.update("http://cam/image.jpg",
+                      MockResponse({"ETag": '"123"', "Last-Modified": "Wed, 01 Oct 2025 06:30:00 GMT"}))
+    assert validators.request_headers("http://cam/image.jpg") == {
+        "If-None-Match": '"123"', "If-Modified-Since": "Wed, 01 Oct 2025 06:30:00 GMT"}
+
+
+def test_validator_cache_keeps_extra_information(tmp_path):
+    path = tmp_path / "validators.json"
+    validators = ValidatorCache(path)
+    validators.update("http://cam/page.html", MockResponse({"ETag": '"1"'}), img_url="http://cam/upload/a.jpg")
+    validators.save()
+    assert ValidatorCache(path).get("http://cam/page.html")["img_url"] == "http://cam/upload/a.jpg"
+
+
+def test_validator_cache_response_without_validators(tmp_path):
+    validators = ValidatorCache(tmp_path / "validators.json")
+    validators.update("http://cam/page.html", MockResponse({"ETag": '"1"'}))
+    validators.update("http://cam/page.html", MockResponse({}))
+    assert validators.get("http://cam/page.html") == {}
+
+
+def test_conditional_get_sends_validators(tmp_path):
+    validators = ValidatorCache(tmp_path / "validators.json")
+    validators.update("http://cam/image.jpg", MockResponse({"ETag": '"123"'}))
+    with mock.patch("camera.http_client.http_get") as mock_get:
+        conditional_get("http://cam/image.jpg", validators, headers={"Accept": "image/*"})
+        mock_get.assert_called_once_with("http://cam/image.jpg",
+                                         headers={"Accept": "image/*", "If-None-Match": '"123"'})
@@ -0,0 +1,86 @@
+import pytest
+import struct
+from datetime import datetime
+from camera.image_validation import InvalidImage, inspect_image, read_image_info
+
+
+def exif_segment(taken: str, order: str = '<') -> bytes:
+    """APP1 segment with IFD0 pointing to an EXIF IFD with DateTimeOriginal."""
+    text = taken.encode() + b'\0'
+    prefix = b'II' if order == '<' else b'MM'
+    # header (8) + IFD0 with one entry (2 + 12 + 4) + EXIF IFD with one entry (2 + 12 + 4) + text
+    exif_ifd = 8 + 18
+    text_offset = exif_ifd + 18
+    tiff = prefix + struct.pack(order + 'HI', 42, 8)
+    tiff += struct.pack(order + 'HHHII', 1, 0x8769, 4, 1, exif_ifd) + struct.pack(order + 'I', 0)
+    tiff += struct.pack(order + 'HHHII', 1, 0x9003, 2, len(text), text_offset) + struct.pack(order + 'I', 0)
+    tiff += text
+    data = b'Exif\0\0' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(data) + 2) + data
+
+
+def jpeg(width: int = 640, height: int = 480, app1: bytes = b'') -> bytes:
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0\x01\x01\0\0\x01\0\x01\0\0'
+    sof = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\x01\x11\x00'
+    sos = b'\xff\xda' + struct.pack('>H', 8) + b'\x01\x01\x00\x00\x3f\x00'
+    return b'\xff\xd8' + app0 + app1 + sof + sos + b'\x12\x34' * 100 + b'\xff\xd9'
+
+
+def test_jpeg_dimensions():
+    info = inspect_image(jpeg(1920, 1080))
+    assert (info.format, info.width, info.height, info.taken) == ('jpeg', 1920, 1080, None)
+
+
+@pytest.mark.parametrize('order', ['<', '>'])
+def test_jpeg_exif_time(order):
+    info = inspect_image(jpeg(app1=exif_segment('2024:05:06 07:08:09', order)))
+    assert info.taken == datetime(2024, 5, 6, 7, 8, 9)
+    assert info.width == 640
+
+
+def test_jpeg_invalid_exif_time_is_ignored():
+    info = inspect_image(jpeg(app1=exif_segment('0000:00:00 00:00:00')))
+    assert info.taken is None and info.height == 480
+
+
+def test_jpeg_with_padding_after_end_marker():
+    assert inspect_image(jpeg() + b'\0\0\0').format == 'jpeg'
+
+
+def test_head_and_tail_of_streamed_image():
+    data = jpeg()
+    info = inspect_image(data[:50], data[-10:], len(data))
+    assert info.width == 640
+
+
+def test_png_gif_and_webp():
+    png = (b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 800, 600) + b'\x08\x02\0\0\0'
+           + b'\0' * 4 + b'\0\0\0\0IEND\xaeB`\x82')
+    assert (inspect_image(png).width, inspect_image(png).height) == (800, 600)
+    gif = b'GIF89a' + struct.pack('<HH', 320, 240) + b'\0' * 20 + b';'
+    assert (inspect_image(gif).format, inspect_image(gif).width) == ('gif', 320)
+    body = b'WEBPVP8X' + struct.pack('<I', 10) + b'\0' * 4 + (99).to_bytes(3, 'little') + (49).to_bytes(3, 'little')
+    webp = b'RIFF' + struct.pack('<I', len(body)) + body
+    assert (inspect_image(webp).width, inspect_image(webp).height) == (100, 50)
+    with pytest.raises(InvalidImage):
+        inspect_image(webp[:-4])
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'', 'empty'),
+    (b'  <!DOCTYPE html><html>Not found</html>', 'HTML'),
+    (b'\xff\xd8\xff\xe0 cut off', 'truncated JPEG'),
+    (b'\x89PNG\r\n\x1a\n cut off', 'truncated PNG'),
+    (b'plain text', 'unknown'),
+])
+def test_invalid_images(data, message):
+    with pytest.raises(InvalidImage, match=message):
+        inspect_image(data)
+
+
+def test_read_image_info(tmp_path):
+    path = tmp_path / 'frame.jpg'
+    path.write_bytes(jpeg(320, 200))
+    assert read_image_info(path).width == 320
+    path.write_bytes(b'<html></html>')
+    assert read_image_info(path) is None
@@ -0,0 +1,104 @@
+import pytest
+from datetime import date, datetime
+from pathlib import Path
+from unittest import mock
+from camera import image_writer
+from camera.capture_functions import save_camera_image
+from camera.dedup import DedupIndex
+from camera.image_writer import ImageWriter
+
+
+def jpeg(data: bytes) -> bytes:
+    """The data between the start and end markers of a JPEG image, so it passes as a complete image."""
+    return b"\xff\xd8" + data + b"\xff\xd9"
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    paths = []
+    monkeypatch.setattr(image_writer, 'fsync_path', paths.append)
+    return paths
+
+
+def test_invalid_durability():
+    with pytest.raises(ValueError):
+        ImageWriter('always')
+
+
+def test_folder_is_created_once_per_day(tmp_path, synced):
+    writer = ImageWriter()
+    folder = writer.folder(tmp_path, 'Station')
+    today = date.today()
+    assert folder == tmp_path / 'Station' / str(today.year) / str(today.month) / str(today.day)
+    assert folder.is_dir()
+    with mock.patch.object(Path, 'exists') as exists:
+        assert writer.folder(tmp_path, 'Station') == folder
+    exists.assert_not_called()
+    assert synced == []
+
+
+def test_folder_cache_is_cleared_the_next_day(tmp_path, monkeypatch):
+    writer = ImageWriter()
+    writer.folder(tmp_path, 'Station')
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date(2030, 1, 2)
+    monkeypatch.setattr(image_writer, 'date', Tomorrow)
+    assert writer.folder(tmp_path, 'Station') == tmp_path / 'Station' / '2030' / '1' / '2'
+    assert (tmp_path / 'Station' / '2030' / '1' / '2').is_dir()
+
+
+def test_durability_none_does_not_sync(tmp_path, synced):
+    writer = ImageWriter('none')
+    saved = save_camera_image(jpeg(b'frame'), tmp_path, 'Station', '.jpg', writer=writer)
+    assert saved.read_bytes() == jpeg(b'frame')
+    assert synced == []
+    assert writer.flush() == 0
+
+
+def test_durability_file_syncs_every_image(tmp_path, synced):
+    writer = ImageWriter('file')
+    folder = writer.folder(tmp_path, 'Station')
+    # the new folders are synced in their parent folders
+    assert synced == [tmp_path, tmp_path / 'Station', folder.parent.parent, folder.parent]
+    synced.clear()
+    saved = save_camera_image(jpeg(b'frame'), tmp_path, 'Station', '.jpg', writer=writer)
+    temporary, parent = synced
+    assert temporary.parent == folder and temporary.name.endswith('.part')
+    assert parent == folder
+    assert saved.exists() and writer.pending == 0
+
+
+def test_durability_cycle_syncs_on_flush(tmp_path, synced):
+    writer = ImageWriter('cycle')
+    first = save_camera_image(jpeg(b'first'), tmp_path, 'First', '.jpg', writer=writer)
+    second = save_camera_image(jpeg(b'second'), tmp_path, 'Second', '.jpg', writer=writer)
+    assert synced == []
+    assert writer.pending == 2
+    assert writer.flush() == 2
+    assert synced[:2] == [first, second]
+    assert set(synced[2:]) >= {first.parent, second.parent, tmp_path}
+    assert writer.pending == 0
+    synced.clear()
+    assert writer.flush() == 0
+    assert synced == []
+
+
+def test_durability_cycle_records_hard_linked_duplicate(tmp_path, synced, monkeypatch):
+    times = iter([datetime(2023, 6, 1, 12, 0), datetime(2023, 6, 1, 12, 30)])
+    monkeypatch.setattr("camera.capture_functions.datetime", mock.Mock(now=lambda: next(times)))
+    writer = ImageWriter('cycle')
+    dedup = DedupIndex(tmp_path / "hashes.json", "hardlink")
+    save_camera_image(jpeg(b'frame'), tmp_path, 'Station', '.jpg', dedup, writer=writer)
+    linked = save_camera_image(jpeg(b'frame'), tmp_path, 'Station', '.jpg', dedup, writer=writer)
+    assert linked.name == 'Station_20230601_1230.jpg'
+    assert writer.pending == 2
+
+
+def test_flush_skips_removed_image(tmp_path):
+    writer = ImageWriter('cycle')
+    saved = save_camera_image(jpeg(b'frame'), tmp_path, 'Station', '.jpg', writer=writer)
+    saved.unlink()
+    assert writer.flush() == 1
@@ -0,0 +1,144 @@
+from datetime import timedelta
+import pytest
+from unittest import mock
+from camera import kenya_capture
+from camera.metadata_cache import MetadataCache, CameraMetadata
+from camera.http_client import ValidatorCache
+
+SAMPLE_PAGE = """<html><head><meta charset="utf-8"><title>Webcam</title></head>
+<body>
+<!-- InstanceBeginEditable name="webcamtitle" --><h3>Wilson Airport East, Nairobi</h3><!-- InstanceEndEditable -->
+<!-- InstanceBeginEditable name="locationinfo" --><h5>Wilson Airport East</h5><!-- InstanceEndEditable -->
+<img src="../images/Logos/logo.png" alt="">
+<img src="https://webcams.aeroclubea.com/upload/nbo_wilsonE.jpg" alt="latest image">
+<div class="mt-0 mb-1">View on <a href="https://earth.app.goo.gl/ncGPi9" target="_blank">
+<img src="../images/Logos/New-Google-Earth-logo.png" width="40" height="40" alt="">Google Earth </a></div>
+<!-- InstanceBeginEditable name="notes" --><p>Camera faces across RWY 07.</p><!-- InstanceEndEditable -->
+</body></html>
+"""
+
+
+class MockResponse:
+    def __init__(self, status_code=200, text=SAMPLE_PAGE, url='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.url = url
+        self.headers = {"Content-Type": "text/html; charset=utf-8", **(headers or {})}
+        self.apparent_encoding = "utf-8"
+        self.encoding = None
+        self.elapsed = timedelta(milliseconds=20)
+
+
+@pytest.fixture(autouse=True)
+def patch_logger():
+    with mock.patch("camera.kenya_capture.logger"):
+        yield
+
+
+@pytest.fixture
+def mock_web(monkeypatch):
+    head = mock.Mock(return_value=MockResponse(
+        url="https://earth.google.com/web/@-1.3176,36.8135,1661a,0d,35y"))
+    monkeypatch.setattr("camera.kenya_capture.conditional_get", lambda url, validators, **kwargs: MockResponse())
+    monkeypatch.setattr("camera.kenya_capture.http_head", head)
+    monkeypatch.setattr("camera.kenya_capture.retrieve_image", lambda url, validators=None: b"jpegdata")
+    return head
+
+
+def test_capture_returns_image(mock_web):
+    img_data, img_url = kenya_capture.capture("https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html")
+    assert img_data == b"jpegdata"
+    assert img_url == "https://webcams.aeroclubea.com/upload/nbo_wilsonE.jpg"
+
+
+def test_capture_page_not_accessible(monkeypatch):
+    monkeypatch.setattr("camera.kenya_capture.conditional_get",
+                        lambda url, validators, **kwargs: MockResponse(status_code=404))
+    assert kenya_capture.capture("http://example.com/missing.html") == (None, None)
+
+
+def test_fetch_camera_metadata(mock_web):
+    metadata = kenya_capture.fetch_camera_metadata("https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html")
+    assert metadata.title == "Wilson Airport East, Nairobi"
+    assert metadata.name == "Wilson Airport East"
+    assert metadata.description == "Camera faces across RWY 07."
+    assert metadata.coordinates == (-1.3176, 36.8135)
+
+
+def test_capture_uses_metadata_cache(mock_web, tmp_path):
+    page_url = "https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html"
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    kenya_capture.capture(page_url, metadata_cache=cache)
+    assert mock_web.call_count == 1
+    assert cache.get(page_url).title == "Wilson Airport East, Nairobi"
+    # second capture should not resolve the coordinates again
+    kenya_capture.capture(page_url, metadata_cache=cache)
+    assert mock_web.call_count == 1
+
+
+def test_capture_refreshes_stale_metadata(mock_web, tmp_path):
+    page_url = "https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html"
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    cache.put(page_url, CameraMetadata(title="old", updated=1.0))
+    kenya_capture.capture(page_url, metadata_cache=cache)
+    assert mock_web.call_count == 1
+    assert cache.get(page_url).title == "Wilson Airport East, Nairobi"
+
+
+def test_capture_unchanged_page_is_not_parsed(mock_web, monkeypatch, tmp_path):
+    page_url = "https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html"
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    validators = ValidatorCache(tmp_path / "validators.json")
+    sent_headers = []
+
+    def mock_get(url, validators, **kwargs):
+        headers = validators.request_headers(url) if validators else {}
+        sent_headers.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return MockResponse(status_code=304, text="")
+        return MockResponse(headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr("camera.kenya_capture.conditional_get", mock_get)
+    kenya_capture.capture(page_url, metadata_cache=cache, validators=validators)
+    with mock.patch("camera.kenya_capture.extract_page") as mock_parse:
+        img_data, img_url = kenya_capture.capture(page_url, metadata_cache=cache, validators=validators)
+        mock_parse.assert_not_called()
+    assert sent_headers == [{}, {"If-None-Match": '"v1"'}]
+    assert img_url == "https://webcams.aeroclubea.com/upload/nbo_wilsonE.jpg"
+    assert img_data == b"jpegdata"
+
+
+def test_capture_without_metadata_is_not_conditional(mock_web, monkeypatch, tmp_path):
+    page_url = "https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html"
+    validators = ValidatorCache(tmp_path / "validators.json")
+    validators.update(page_url, MockResponse(headers={"ETag": '"v1"'}), img_url="http://x/upload/a.jpg")
+    received = []
+    monkeypatch.setattr("camera.kenya_capture.conditional_get",
+                        lambda url, validators, **kwargs: received.append(validators) or MockResponse())
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    kenya_capture.capture(page_url, metadata_cache=cache, validators=validators)
+    assert received == [None]
+    assert cache.get(page_url) is not None
+
+
+def test_unchanged_page_without_known_image_is_retrieved_again(mock_web, monkeypatch, tmp_path):
+    page_url = "https://webcams.aeroclubea.com/Nairobi/nbo_wilsonE.html"
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    cache.put(page_url, CameraMetadata(title="Wilson Airport East, Nairobi"))
+    validators = ValidatorCache(tmp_path / "validators.json")
+    validators.update(page_url, MockResponse(headers={"ETag": '"v1"'}))     # stored without the image URL
+    sent_headers = []
+
+    def mock_get(url, validators, **kwargs):
+        headers = validators.request_headers(url) if validators else {}
+        sent_headers.append(headers)
+        if headers.get("If-None-Match") == '"v1"':
+            return MockResponse(status_code=304, text="")
+        return MockResponse(headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr("camera.kenya_capture.conditional_get", mock_get)
+    img_data, img_url = kenya_capture.capture(page_url, metadata_cache=cache, validators=validators)
+    assert sent_headers == [{"If-None-Match": '"v1"'}, {}]
+    assert img_url == "https://webcams.aeroclubea.com/upload/nbo_wilsonE.jpg"
+    assert validators.get(page_url)["img_url"] == img_url
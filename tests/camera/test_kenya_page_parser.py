@@ -0,0 +1,66 @@
+import pytest
+from unittest import mock
+from camera import kenya_capture  # noqa: F401, registers the bs4 backend
+from camera.kenya_page_parser import extract_page_info, CameraPageParser, PageInfo, lxml_available
+from test_kenya_capture import SAMPLE_PAGE
+
+BACKENDS = ['stream', 'bs4', pytest.param('lxml', marks=pytest.mark.skipif(
+    not lxml_available(), reason="lxml is not installed"))]
+
+NO_UPLOAD_PAGE = """<html><body>
+<img src="../images/first.png"><img src="../images/second.png">
+<!-- InstanceBeginEditable name="webcamtitle" --><p>no title here</p>
+</body></html>"""
+
+NESTED_TEXT_PAGE = """<html><body>
+<h3>Before marker</h3>
+<!-- InstanceBeginEditable name="webcamtitle" -->
+<h3> Wilson <b>Airport</b> <!-- remark --> East &amp; more </h3>
+<a href="http://other.link">Google</a>
+<a>Google Earth</a>
+<a href="https://earth.app.goo.gl/abc"> <span>Google Earth</span> </a>
+<img src="http://cam/stream/live.jpg">
+<!-- InstanceBeginEditable name="notes" --><p>Line one<br>line two</p>
+</body></html>"""
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("html", [
+    pytest.param(SAMPLE_PAGE, id='sample page'),
+    pytest.param(NO_UPLOAD_PAGE, id='no upload image'),
+    pytest.param(NESTED_TEXT_PAGE, id='nested text'),
+    pytest.param("<html><body><p>empty</p></body></html>", id='no information'),
+])
+def test_backends_match_beautifulsoup(backend, html):
+    with mock.patch("camera.kenya_capture.logger"):
+        reference = extract_page_info(html, 'bs4')
+    assert extract_page_info(html, backend) == reference
+
+
+def test_stream_parser_results():
+    info = extract_page_info(NESTED_TEXT_PAGE, 'stream')
+    assert info == PageInfo(title="WilsonAirportEast & more",
+                            name='',
+                            description="Line oneline two",
+                            google_earth_link="https://earth.app.goo.gl/abc",
+                            image_url="http://cam/stream/live.jpg")
+
+
+def test_stream_parser_without_metadata_only_finds_image():
+    info = extract_page_info(SAMPLE_PAGE, 'stream', metadata=False)
+    assert info == PageInfo(image_url="https://webcams.aeroclubea.com/upload/nbo_wilsonE.jpg")
+
+
+def test_stream_parser_stops_early():
+    parser = CameraPageParser(metadata=False)
+    with mock.patch.object(parser, "handle_comment") as handle_comment:
+        html = '<img src="http://cam/upload/a.jpg">' + '<!-- comment -->' * 10
+        try:
+            parser.feed(html)
+        except Exception:
+            pass
+        handle_comment.assert_not_called()
+
+
+def test_unknown_backend_falls_back_to_stream():
+    assert extract_page_info(SAMPLE_PAGE, 'unknown') == extract_page_info(SAMPLE_PAGE, 'stream')
@@ -1,7 +1,8 @@
+import json
 import pytest
-import pandas as pd
 from pathlib import Path
-from camera.camera_locations import load_urls_from_file, load_camera_locations
+from camera.camera_locations import (CameraLocation, load_urls_from_file, load_camera_locations,
+                                     load_camera_locations_json)
 from camera.config import CameraConfig
 
 
@@ -32,32 +33,24 @@ def malformed_csv(tmp_path):
 # Test: load_camera_locations function
 def test_load_camera_locations_valid(valid_csv):
     """ test loading a valid CSV file with camera locations"""
-    df = load_camera_locations(valid_csv)
-    assert not df.empty
-    assert set(df.columns) == {"url", "location"}
-    assert df.iloc[0]["url"] == "http://cam1"
-    assert df.iloc[1]["location"] == "Exit"
+    cameras = load_camera_locations(valid_csv)
+    assert cameras == (CameraLocation("http://cam1", "Entrance"), CameraLocation("http://cam2", "Exit"))
 
 
 def test_load_camera_locations_missing_columns(missing_columns_csv):
     """ test missing of required columns (url, location)"""
-    df = load_camera_locations(missing_columns_csv)
-    assert df.empty
+    assert load_camera_locations(missing_columns_csv) == ()
 
 
 def test_load_camera_locations_file_not_found(tmp_path):
-    """ test that a non-existent file returns an empty DataFrame"""
+    """ test that a non-existent file returns no cameras"""
     non_existent = tmp_path / "does_not_exist.csv"
-    df = load_camera_locations(str(non_existent))
-    assert isinstance(df, pd.DataFrame)
-    assert df.empty
+    assert load_camera_locations(str(non_existent)) == ()
 
 
 def test_load_camera_locations_malformed_csv(malformed_csv):
     """ test that incomplete records are removed"""
-    df = load_camera_locations(malformed_csv)
-    assert isinstance(df, pd.DataFrame)
-    assert df.empty
+    assert load_camera_locations(malformed_csv) == ()
 
 
 # test: load_urls_from_file function
@@ -65,20 +58,17 @@ def test_load_urls_from_file_valid(valid_csv):
     config = CameraConfig()
     config.location_file = Path(valid_csv)
 
-    df = load_urls_from_file(config)
-    assert not df.empty
-    assert list(df.columns) == ["url", "location"]
-    assert len(df) == 2
-    assert df.iloc[0]["url"] == "http://cam1"
-    assert df.iloc[0]["location"] == "Entrance"
+    cameras = load_urls_from_file(config)
+    assert len(cameras) == 2
+    assert cameras[0].url == "http://cam1"
+    assert cameras[0].location == "Entrance"
 
 
 def test_load_urls_from_file_missing_file(tmp_path):
     # File does not exist
     config = CameraConfig()
     config.location_file = tmp_path / "nonexistent.csv"
-    df = load_urls_from_file(config)
-    assert df.empty
+    assert load_urls_from_file(config) == ()
 
 
 def test_load_urls_from_file_empty_file(tmp_path):
@@ -86,8 +76,7 @@ def test_load_urls_from_file_empty_file(tmp_path):
     file_path.write_text("")
     config = CameraConfig()
     config.location_file = file_path
-    df = load_urls_from_file(config)
-    assert df.empty
+    assert load_urls_from_file(config) == ()
 
 
 def test_load_urls_from_file_invalid_columns(tmp_path):
@@ -96,5 +85,52 @@ def test_load_urls_from_file_invalid_columns(tmp_path):
     file_path.write_text(csv_content)
     config = CameraConfig()
     config.location_file = file_path
-    df = load_urls_from_file(config)
-    assert df.empty
+    assert load_urls_from_file(config) == ()
+
+
+def test_load_camera_locations_json(tmp_path):
+    """ test loading cameras with their schedules from a JSON file"""
+    file = tmp_path / "cameras.json"
+    file.write_text(json.dumps({"camera_locations": [
+        {"url": "http://cam1", "title": "Entrance", "start_time": "07:30:00", "end_time": "17:30:00",
+         "interval": 1, "interval_unit": "hours", "timezone_title": "Africa/Nairobi"},
+        {"url": "http://cam1", "title": "Entrance again"},
+        {"url": "http://cam2", "title": "Exit"},
+        {"url": "http://cam3"},
+    ]}))
+    cameras = load_camera_locations(str(file))
+    assert [camera.location for camera in cameras] == ["Entrance", "Exit"]
+    assert cameras[0].interval == 60
+    assert cameras[0].timezone == "Africa/Nairobi"
+    assert cameras[1].start is None
+
+
+def test_load_camera_locations_json_invalid(tmp_path):
+    file = tmp_path / "cameras.json"
+    file.write_text("{not json")
+    assert load_camera_locations_json(str(file)) == ()
+
+
+def test_load_camera_locations_csv_strips_and_schedules(tmp_path):
+    """ test that values are stripped and the optional schedule columns are read"""
+    file = tmp_path / "cameras.csv"
+    file.write_text("url, location, interval, timezone\n http://cam1 , Entrance , 60, Africa/Nairobi\n"
+                    "http://cam2,Exit,,\n")
+    assert load_camera_locations(str(file)) == (
+        CameraLocation("http://cam1", "Entrance", interval=60, timezone="Africa/Nairobi"),
+        CameraLocation("http://cam2", "Exit"))
+
+
+def test_cameras_with_invalid_schedule_are_skipped(tmp_path, caplog):
+    """ test that a camera with an invalid start time, end time or interval is skipped with a warning"""
+    file = tmp_path / "cameras.csv"
+    file.write_text("url,location,start,end,interval\nhttp://cam1,Entrance,7h30,,\nhttp://cam2,Exit,07:30,18:00,\n"
+                    "http://cam3,Gate,,,often\n")
+    assert load_camera_locations(str(file)) == (CameraLocation("http://cam2", "Exit", "07:30", "18:00"),)
+    assert "Camera http://cam1 skipped: invalid start time '7h30', expected HH:MM" in caplog.text
+    file = tmp_path / "cameras.json"
+    file.write_text(json.dumps({"camera_locations": [
+        {"url": "http://cam1", "title": "Entrance", "end_time": "late"},
+        {"url": "http://cam1", "title": "Entrance again", "end_time": "18:00"},
+    ]}))
+    assert [camera.location for camera in load_camera_locations(str(file))] == ["Entrance again"]
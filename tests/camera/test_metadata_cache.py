@@ -0,0 +1,42 @@
+from time import time
+from camera.metadata_cache import MetadataCache, CameraMetadata
+
+
+def test_put_and_get(tmp_path):
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    cache.put("http://cam1", CameraMetadata(title="Cam 1", coordinates=(-1.3, 36.8)))
+    metadata = cache.get("http://cam1")
+    assert metadata.title == "Cam 1"
+    assert metadata.coordinates == (-1.3, 36.8)
+    assert metadata.updated > 0
+
+
+def test_missing_entry(tmp_path):
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    assert cache.get("http://unknown") is None
+
+
+def test_stale_entry_is_not_returned(tmp_path):
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    cache.put("http://cam1", CameraMetadata(title="Cam 1", updated=time() - 2 * 3600))
+    assert cache.get("http://cam1") is None
+
+
+def test_cache_is_persisted(tmp_path):
+    path = tmp_path / "meta.json"
+    cache = MetadataCache(path, ttl_hours=1)
+    cache.put("http://cam1", CameraMetadata(title="Cam 1", name="Wilson", description="East"))
+    cache.save()
+    metadata = MetadataCache(path, ttl_hours=1).get("http://cam1")
+    assert (metadata.title, metadata.name, metadata.description) == ("Cam 1", "Wilson", "East")
+
+
+def test_invalidate(tmp_path):
+    cache = MetadataCache(tmp_path / "meta.json", ttl_hours=1)
+    cache.put("http://cam1", CameraMetadata(title="Cam 1"))
+    cache.put("http://cam2", CameraMetadata(title="Cam 2"))
+    cache.invalidate("http://cam1")
+    assert cache.get("http://cam1") is None
+    assert cache.get("http://cam2") is not None
+    cache.invalidate()
+    assert cache.items() == []
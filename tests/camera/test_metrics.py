@@ -0,0 +1,68 @@
+import json
+import time
+from camera import metrics
+from camera.metrics import CaptureTiming, CycleMetrics, measure_capture, timed, percentile
+
+
+def test_percentile():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile(values, 0.5) == 3.0
+    assert percentile(values, 0.95) == 5.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_timed_adds_to_current_capture():
+    with measure_capture("cam1", "http://host/cam1.html") as timing:
+        with timed("page"):
+            time.sleep(0.01)
+        metrics.record("page_wait", 0.005)
+        metrics.add_bytes(page=100, image=2000)
+    assert timing.stages["page"] >= 0.01
+    assert timing.stages["page_wait"] == 0.005
+    assert (timing.page_bytes, timing.image_bytes) == (100, 2000)
+    assert timing.elapsed >= timing.stages["page"]
+
+
+def test_timed_without_capture_is_ignored():
+    with timed("page") as timing:
+        metrics.add_bytes(page=100)
+    assert timing is None
+
+
+def test_run_with_timing():
+    timing = CaptureTiming("cam1", "http://host/cam1.html")
+    metrics.run_with_timing(timing, metrics.record, "parse", 0.25)
+    assert timing.stages == {"parse": 0.25}
+
+
+def make_timing(location, page, save=0.0):
+    timing = CaptureTiming(location, f"http://host/{location}.html", stages={"page": page, "save": save})
+    timing.elapsed = page
+    return timing
+
+
+def test_cycle_metrics_written_as_json_lines(tmp_path):
+    cycle = CycleMetrics(tmp_path / "metrics.jsonl")
+    cycle.add(make_timing("cam1", 1.0, save=0.5), metrics.SAVED)
+    cycle.add(make_timing("cam2", 3.0), metrics.FAILED, "Page not accessible")
+    cycle.add(make_timing("cam3", 2.0), metrics.UNCHANGED)
+    summary = cycle.finish()
+    assert summary["outcomes"] == {"saved": 1, "failed": 1, "unchanged": 1}
+    assert summary["stages"]["page"]["p50"] == 2.0
+    assert [camera["location"] for camera in summary["slowest"]] == ["cam2", "cam3", "cam1"]
+
+    lines = [json.loads(line) for line in (tmp_path / "metrics.jsonl").read_text().splitlines()]
+    assert [line["type"] for line in lines] == ["camera", "camera", "camera", "cycle"]
+    assert lines[0]["total"] == 1.5
+    assert lines[1]["error"] == "Page not accessible"
+
+
+def test_cycle_metrics_prometheus_textfile(tmp_path):
+    cycle = CycleMetrics(prometheus_file=tmp_path / "capture.prom")
+    cycle.add(make_timing('cam "1"', 1.0), metrics.SAVED)
+    cycle.finish()
+    text = (tmp_path / "capture.prom").read_text()
+    assert 'camera_capture_cameras{outcome="saved"} 1' in text
+    assert 'camera_capture_stage_seconds{stage="page",quantile="0.50"} 1.000' in text
+    assert 'camera_capture_camera_seconds{location="cam \\"1\\""} 1.000' in text
+    assert [p.name for p in tmp_path.iterdir()] == ["capture.prom"]
@@ -0,0 +1,58 @@
+import pytest
+from unittest import mock
+from camera.page_encoding import resolve_encoding, encoding_from_meta, clear_host_encodings
+
+
+class MockResponse:
+    def __init__(self, content=b"<html></html>", content_type="text/html", url="http://cams.example/page.html",
+                 apparent_encoding="windows-1252"):
+        self.content = content
+        self.headers = {"Content-Type": content_type}
+        self.url = url
+        self.detections = 0
+        self._apparent_encoding = apparent_encoding
+
+    @property
+    def apparent_encoding(self):
+        self.detections += 1
+        return self._apparent_encoding
+
+
+@pytest.fixture(autouse=True)
+def clean_host_cache():
+    clear_host_encodings()
+    with mock.patch("camera.page_encoding.logger"):
+        yield
+    clear_host_encodings()
+
+
+def test_encoding_from_header():
+    response = MockResponse(content_type="text/html; charset=ISO-8859-1")
+    assert resolve_encoding(response) == "iso8859-1"
+    assert response.detections == 0
+
+
+def test_encoding_from_meta_charset():
+    response = MockResponse(content=b'<html><head><meta charset="utf-8"></head></html>')
+    assert resolve_encoding(response) == "utf-8"
+    assert response.detections == 0
+
+
+def test_encoding_from_meta_http_equiv():
+    content = b'<meta http-equiv="Content-Type" content="text/html; charset=windows-1252">'
+    assert encoding_from_meta(content) == "cp1252"
+
+
+def test_unknown_encoding_is_ignored():
+    response = MockResponse(content_type="text/html; charset=made-up", content=b'<meta charset="utf-8">')
+    assert resolve_encoding(response) == "utf-8"
+
+
+def test_detected_encoding_is_cached_per_host():
+    first = MockResponse()
+    second = MockResponse(url="http://cams.example/other.html")
+    other_host = MockResponse(url="http://other.example/page.html")
+    assert resolve_encoding(first) == "windows-1252"
+    assert resolve_encoding(second) == "windows-1252"
+    resolve_encoding(other_host)
+    assert (first.detections, second.detections, other_host.detections) == (1, 0, 1)
@@ -0,0 +1,160 @@
+from datetime import date, datetime, time
+import os
+import pytest
+from camera.archive import archive_day, read_frame, read_index
+from camera.catalog import Catalog
+from camera.change_detection import write_reference
+from camera.retention import (DAILY, FULL, THIN, RetentionPolicy, apply_retention, select_frames)
+from camera.state_store import JsonStateStore
+
+TODAY = date(2023, 6, 30)
+POLICY = RetentionPolicy(full_days=10, thin_days=10, thin_interval=60, daily_time=time(12))
+
+
+def write_frame(root, station, stamp, data=b"frame"):
+    folder = root / station / stamp[:4] / stamp[4:6].lstrip("0") / stamp[6:8].lstrip("0")
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{station}_{stamp}.jpg"
+    path.write_bytes(data)
+    return path
+
+
+def write_day(root, day, station="stationA"):
+    """Frames every 30 minutes from 11:00 to 13:30."""
+    return [write_frame(root, station, f"{day:%Y%m%d}_{hour:02}{minute:02}", b"x" * 100)
+            for hour in (11, 12, 13) for minute in (0, 30)]
+
+
+@pytest.fixture
+def state(tmp_path):
+    return JsonStateStore(tmp_path / ".capture" / "retention.json")
+
+
+def names(folder):
+    return sorted(path.name for path in folder.iterdir())
+
+
+def test_tiers():
+    assert POLICY.tier(date(2023, 6, 25), TODAY) == FULL
+    assert POLICY.tier(date(2023, 6, 15), TODAY) == THIN
+    assert POLICY.tier(date(2023, 6, 10), TODAY) == DAILY
+    assert RetentionPolicy().tier(date(2000, 1, 1), TODAY) == FULL
+
+
+def test_select_frames():
+    frames = {f"s_20230601_{stamp}.jpg": datetime.strptime(f"20230601_{stamp}", "%Y%m%d_%H%M")
+              for stamp in ("1100", "1130", "1155", "1210", "1300")}
+    assert select_frames(frames, THIN, POLICY) == {"s_20230601_1100.jpg", "s_20230601_1210.jpg",
+                                                   "s_20230601_1300.jpg"}
+    assert select_frames(frames, DAILY, POLICY) == {"s_20230601_1155.jpg"}
+    assert select_frames(frames, FULL, POLICY) == set(frames)
+
+
+def test_reference_files_are_not_preferred():
+    frames = {"s_20230601_1200.ref": datetime(2023, 6, 1, 12), "s_20230601_1210.jpg": datetime(2023, 6, 1, 12, 10)}
+    assert select_frames(frames, DAILY, POLICY) == {"s_20230601_1210.jpg"}
+
+
+def test_apply_retention(tmp_path, state):
+    thin = write_day(tmp_path, date(2023, 6, 15))
+    daily = write_day(tmp_path, date(2023, 6, 5))
+    full = write_day(tmp_path, date(2023, 6, 25))
+    report = apply_retention(tmp_path, "stationA", POLICY, state, TODAY)
+    assert (report.days, report.kept, report.removed, report.reclaimed) == (2, 4, 8, 800)
+    assert names(thin[0].parent) == ["stationA_20230615_1100.jpg", "stationA_20230615_1200.jpg",
+                                     "stationA_20230615_1300.jpg"]
+    assert names(daily[0].parent) == ["stationA_20230605_1200.jpg"]
+    assert len(names(full[0].parent)) == 6
+    assert state.get("stationA")["thin"] == "2023-06-15"
+
+
+def test_dry_run_changes_nothing(tmp_path, state):
+    folder = write_day(tmp_path, date(2023, 6, 5))[0].parent
+    os.link(folder / "stationA_20230605_1100.jpg", tmp_path / "elsewhere.jpg")
+    report = apply_retention(tmp_path, "stationA", POLICY, state, TODAY, dry_run=True)
+    assert (report.removed, report.reclaimed) == (5, 400)      # the hard linked file frees nothing
+    assert len(names(folder)) == 6
+    assert "stationA" not in state
+
+
+def test_processed_days_are_skipped(tmp_path, state, monkeypatch):
+    write_day(tmp_path, date(2023, 6, 5))
+    apply_retention(tmp_path, "stationA", POLICY, state, TODAY)
+    listed = []
+    real_listdir = os.listdir
+    monkeypatch.setattr("camera.retention.os.listdir", lambda path: listed.append(path) or real_listdir(path))
+    report = apply_retention(tmp_path, "stationA", POLICY, state, date(2023, 7, 1))
+    assert report.days == 0
+    assert tmp_path / "stationA" / "2023" / "6" / "5" not in listed     # only the year and month folders
+    changed = RetentionPolicy(full_days=10, thin_days=10, thin_interval=60, daily_time=time(13))
+    assert apply_retention(tmp_path, "stationA", changed, state, date(2023, 7, 1)).days == 1
+
+
+def test_failed_day_is_tried_again(tmp_path, state, monkeypatch):
+    for day in (1, 2, 3):
+        write_day(tmp_path, date(2023, 6, day))
+    failing = tmp_path / "stationA" / "2023" / "6" / "2"
+    real_listdir = os.listdir
+
+    def listdir(path):
+        if path == failing:
+            raise PermissionError("denied")
+        return real_listdir(path)
+
+    monkeypatch.setattr("camera.retention.os.listdir", listdir)
+    report = apply_retention(tmp_path, "stationA", POLICY, state, TODAY)
+    assert (report.days, len(report.errors)) == (2, 1)
+    assert state.get("stationA")["daily"] == "2023-06-01"     # not past the failed day
+    monkeypatch.setattr("camera.retention.os.listdir", real_listdir)
+    report = apply_retention(tmp_path, "stationA", POLICY, state, TODAY)
+    assert (report.days, report.removed, report.errors) == (2, 5, [])
+    assert names(failing) == ["stationA_20230602_1200.jpg"]
+    assert state.get("stationA")["daily"] == "2023-06-03"
+
+
+def test_referenced_frame_is_kept(tmp_path, state):
+    frames = write_day(tmp_path, date(2023, 6, 5))
+    noon = frames[2].with_suffix(".ref")
+    frames[2].unlink()
+    write_reference(noon, frames[1])
+    apply_retention(tmp_path, "stationA", RetentionPolicy(full_days=1, daily_time=time(12)), state, TODAY)
+    assert names(noon.parent) == ["stationA_20230605_1130.jpg"]     # the .jpg frame is preferred
+    frames = write_day(tmp_path, date(2023, 6, 6))
+    for frame in frames[2:]:
+        frame.unlink()
+        write_reference(frame.with_suffix(".ref"), frames[1])
+    apply_retention(tmp_path, "stationA", RetentionPolicy(full_days=1, thin_days=100), JsonStateStore(tmp_path / "s"),
+                    TODAY)
+    assert names(frames[0].parent) == ["stationA_20230606_1100.jpg", "stationA_20230606_1130.jpg",
+                                       "stationA_20230606_1200.ref", "stationA_20230606_1300.ref"]
+
+
+def test_archived_day_is_packed_again(tmp_path, state):
+    frames = write_day(tmp_path, date(2023, 6, 5))
+    catalog = Catalog(tmp_path / ".capture" / "catalog.sqlite", tmp_path)
+    catalog.import_tree()
+    result = archive_day(tmp_path, "stationA", date(2023, 6, 5), catalog)
+    report = apply_retention(tmp_path, "stationA", POLICY, state, TODAY, catalog)
+    assert (report.removed, report.reclaimed, report.errors) == (5, 500, [])
+    assert list(read_index(result.archive)) == ["stationA_20230605_1200.jpg"]
+    assert read_frame(result.archive, "stationA_20230605_1200.jpg") == b"x" * 100
+    assert names(frames[0].parent) == ["stationA_20230605.json", "stationA_20230605.tar"]
+    paths = [frame.path for frame in catalog.frames("stationA", datetime(2023, 6, 5), datetime(2023, 6, 6))]
+    assert paths == ["stationA/2023/6/5/stationA_20230605.tar#stationA_20230605_1200.jpg"]
+    catalog.close()
+
+
+def test_old_days_are_moved(tmp_path, state):
+    root, secondary = tmp_path / "images", tmp_path / "secondary"
+    write_day(root, date(2023, 5, 5))
+    write_day(root, date(2023, 6, 25))
+    catalog = Catalog(tmp_path / "catalog.sqlite", root)
+    catalog.import_tree(compute_hash=False)
+    policy = RetentionPolicy(move_days=30, secondary_path=str(secondary))
+    report = apply_retention(root, "stationA", policy, state, TODAY, catalog)
+    assert (report.moved, report.moved_bytes, report.days) == (1, 600, 0)
+    assert len(names(secondary / "stationA" / "2023" / "5" / "5")) == 6
+    assert not (root / "stationA" / "2023" / "5").exists()
+    frame = catalog.frames("stationA", datetime(2023, 5, 5), datetime(2023, 5, 6))[0]
+    assert frame.path == str(secondary / "stationA" / "2023" / "5" / "5" / "stationA_20230505_1100.jpg")
+    catalog.close()
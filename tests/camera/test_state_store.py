@@ -0,0 +1,50 @@
+import json
+from camera.state_store import JsonStateStore
+
+
+def test_new_store_is_empty(tmp_path):
+    store = JsonStateStore(tmp_path / "state.json")
+    assert len(store) == 0
+    assert store.get("missing", 42) == 42
+
+
+def test_save_and_reload(tmp_path):
+    path = tmp_path / "sub" / "state.json"
+    store = JsonStateStore(path)
+    store.set("a", {"value": 1})
+    store.save()
+    assert path.exists()
+    reloaded = JsonStateStore(path)
+    assert reloaded.get("a") == {"value": 1}
+    assert "a" in reloaded
+
+
+def test_save_leaves_no_temporary_files(tmp_path):
+    store = JsonStateStore(tmp_path / "state.json")
+    store.set("a", 1)
+    store.save()
+    assert [p.name for p in tmp_path.iterdir()] == ["state.json"]
+
+
+def test_save_without_changes_does_not_write(tmp_path):
+    path = tmp_path / "state.json"
+    store = JsonStateStore(path)
+    store.save()
+    assert not path.exists()
+
+
+def test_corrupt_file_is_ignored(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{not json")
+    store = JsonStateStore(path)
+    assert len(store) == 0
+
+
+def test_pop_removes_key(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"a": 1, "b": 2}))
+    store = JsonStateStore(path)
+    assert store.pop("a") == 1
+    assert store.pop("a") is None
+    store.save()
+    assert json.loads(path.read_text()) == {"b": 2}
@@ -0,0 +1,153 @@
+from datetime import datetime
+import json
+from unittest import mock
+import pytest
+from camera import supervisor
+from camera.camera_locations import CameraLocation
+from camera.catalog import FRAME_NAME
+from camera.config import CameraConfig, SHARD_BY_HOST, SHARD_BY_URL
+from camera.metrics import CaptureTiming
+from camera.supervisor import CycleAggregator, Shard, Worker, shard_of
+
+CAMERAS = [CameraLocation(f"https://site{number % 5}.example.com/camera/{number}", f"station{number}")
+           for number in range(200)]
+
+
+def test_every_camera_is_in_one_shard():
+    shards = [Shard(index, 4, SHARD_BY_URL).select(CAMERAS) for index in range(4)]
+    assert sorted(camera.location for shard in shards for camera in shard) == sorted(c.location for c in CAMERAS)
+    assert all(30 <= len(shard) <= 70 for shard in shards)
+
+
+def test_cameras_of_a_host_are_in_one_shard():
+    shards_of_host = {}
+    for index in range(3):
+        for camera in Shard(index, 3, SHARD_BY_HOST).select(CAMERAS):
+            shards_of_host.setdefault(camera.url.split("/")[2], set()).add(index)
+    assert len(shards_of_host) == 5
+    assert all(len(shards) == 1 for shards in shards_of_host.values())
+
+
+def test_adding_a_shard_only_moves_cameras_to_it():
+    for camera in CAMERAS:
+        before, after = shard_of(camera.url, 4), shard_of(camera.url, 5)
+        assert after in (before, 4)
+
+
+def test_worker_state_folder(monkeypatch, tmp_path):
+    monkeypatch.setattr(CameraConfig, "load", lambda self, strict=False: None)
+    config = CameraConfig(image_save_path=tmp_path)
+    assert config.state_folder == config.shared_state_folder == tmp_path / ".capture"
+    config.shard = Shard(2, 4).name
+    assert config.state_folder == tmp_path / ".capture" / "shard-2"
+    assert config.shared_state_folder == tmp_path / ".capture"
+
+
+def test_numbered_frame_name():
+    match = FRAME_NAME.match("station_1_20230601_1200_2.jpg")
+    assert (match["station"], match["stamp"]) == ("station_1", "20230601_1200")
+
+
+class FakeProcess:
+    def __init__(self, exitcode=None):
+        self.exitcode = exitcode
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def join(self, timeout=None):
+        pass
+
+
+def test_crashed_worker_is_restarted(monkeypatch):
+    monkeypatch.setattr(supervisor, "logger", mock.Mock())
+    processes = [FakeProcess(), FakeProcess(), FakeProcess()]
+    worker = Worker(Shard(0, 1), lambda shard: processes.pop(0))
+    worker.check(0)
+    running = worker.process
+    running.exitcode = 1
+    worker.check(10)
+    assert (worker.process, worker.crashes, worker.restart_at) == (None, 1, 12)
+    worker.check(11)
+    assert worker.process is None
+    worker.check(12)
+    assert worker.process is not running and worker.process is not None
+    worker.process.exitcode = 0
+    worker.check(20)
+    assert worker.done and len(processes) == 1
+
+
+def test_shards_without_cameras_get_no_process(monkeypatch, tmp_path):
+    import queue
+
+    monkeypatch.setattr(CameraConfig, "load", lambda self, strict=False: None)
+    monkeypatch.setattr(supervisor, "CameraConfig", lambda: CameraConfig(image_save_path=tmp_path))
+    monkeypatch.setattr(supervisor, "load_urls_from_file", lambda config: CAMERAS[:5])
+    monkeypatch.setattr(supervisor, "SettingsWatcher", lambda config, cameras: mock.Mock(poll=lambda: False))
+    monkeypatch.setattr(supervisor, "POLL_INTERVAL", 0.01)
+    started = []
+
+    def process(target, name, args):
+        started.append(name)
+        return mock.Mock(pid=1, exitcode=0, is_alive=lambda: False)
+
+    context = mock.Mock(Queue=queue.Queue, Process=process)
+    monkeypatch.setattr(supervisor.multiprocessing, "get_context", lambda method: context)
+    warnings = []
+    monkeypatch.setattr(supervisor.logger, "warning", warnings.append)
+    supervisor.supervise(3, SHARD_BY_HOST)     # the five cameras are on five hosts
+    shards = [index for index in range(3) if Shard(index, 3, SHARD_BY_HOST).select(CAMERAS[:5])]
+    assert started == [f"shard-{index}" for index in shards]
+    single_site = [CameraLocation(f"https://site.example.com/camera/{number}", f"station{number}")
+                   for number in range(5)]
+    monkeypatch.setattr(supervisor, "load_urls_from_file", lambda config: single_site)
+    started.clear()
+    supervisor.supervise(3, SHARD_BY_HOST)
+    assert len(started) == 1
+    assert warnings[-1] == "2 of 3 shards have no cameras (shard by host), starting 1 worker processes"
+
+
+def test_idle_shard_is_started_when_it_gets_cameras(monkeypatch):
+    monkeypatch.setattr(supervisor, "logger", mock.Mock())
+    shards = [Shard(index, 3, SHARD_BY_HOST) for index in range(3)]
+    single_site = [camera for camera in CAMERAS if camera.url.startswith("https://site0.")]
+    workers = [Worker(shard, lambda shard: FakeProcess()) for shard in shards]
+    assigned = {shard.index: {camera.url for camera in shard.select(single_site)} for shard in shards}
+    for worker in workers:
+        worker.done = not assigned[worker.shard.index]
+    busy = next(worker for worker in workers if not worker.done)
+    busy.done = True    # finished with the cameras it has
+    supervisor._wake_workers(workers, single_site, assigned)
+    assert all(worker.done for worker in workers)
+    supervisor._wake_workers(workers, CAMERAS, assigned)     # the locations file now lists five sites
+    woken = [worker for worker in workers if not worker.done]
+    assert woken == [worker for worker in workers
+                     if set(worker.shard.select(CAMERAS)) - set(worker.shard.select(single_site))]
+    assert woken and all(worker.restart_at == 0.0 for worker in woken)
+    assert assigned == {shard.index: {camera.url for camera in shard.select(CAMERAS)} for shard in shards}
+
+
+def test_cycles_of_all_workers_are_aggregated(tmp_path):
+    aggregator = CycleAggregator(tmp_path / "metrics.jsonl", tmp_path / "capture.prom")
+    first = CaptureTiming("cam1", "https://a", {"page": 1.0}, elapsed=1.0, outcome="saved")
+    second = CaptureTiming("cam2", "https://b", {"page": 2.0}, elapsed=2.0, outcome="failed")
+    aggregator.add(0, datetime(2023, 6, 1, 12, 0), 1.5, [first])
+    aggregator.add(1, datetime(2023, 6, 1, 12, 1), 2.5, [second])
+    lines = [json.loads(line) for line in (tmp_path / "metrics.jsonl").read_text().splitlines()]
+    assert [(line["type"], line.get("shard")) for line in lines] == [
+        ("camera", None), ("cycle", 0), ("camera", None), ("cycle", 1)]
+    text = (tmp_path / "capture.prom").read_text()
+    assert "camera_capture_cycle_seconds 2.500" in text
+    assert 'camera_capture_cameras{outcome="failed"} 1' in text
+    assert 'camera_capture_cameras{outcome="saved"} 1' in text
+
+
+def test_supervise_parser():
+    from camera.cli_parser import cli_parser
+
+    args = cli_parser().parse_args(["supervise", "--processes", "4", "--shard-by", "url", "--no-limit"])
+    assert (args.Command, args.processes, args.shard_by, args.no_limit, args.use_async) == (
+        "supervise", 4, "url", True, False)
+    assert cli_parser().parse_args(["supervise"]).shard_by == SHARD_BY_URL
+    with pytest.raises(SystemExit):
+        cli_parser().parse_args(["supervise", "--shard-by", "station"])
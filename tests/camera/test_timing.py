@@ -1,6 +1,9 @@
+from datetime import datetime, time as time_class
 from time import time, gmtime
 import pytest
+from camera.config import CameraConfig
 from camera.timing_functions import format_seconds_to_hours_minutes, wait_until_next_capture
+from camera.timing_functions import determine_delay_to_next_capture_time, CaptureScheduler
 
 
 @pytest.mark.skip(reason="Manual timing test; run manually only.")
@@ -35,3 +38,90 @@ def test_timing():
 ])
 def test_format_seconds_to_hours_minutes(seconds, expected):
     assert format_seconds_to_hours_minutes(seconds) == expected
+
+
+class FakeClock:
+    """Wall and monotonic clock where sleeping advances both, optionally with a late wake up."""
+
+    def __init__(self, start: float, oversleep: float = 0.0):
+        self.wall = start
+        self.mono = 1000.0
+        self.oversleep = oversleep
+        self.sleeps = []
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.wall += seconds + self.oversleep
+        self.mono += seconds + self.oversleep
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock(datetime(2023, 10, 1, 7, 0, 0, 500000).timestamp())
+    monkeypatch.setattr("camera.timing_functions.time", fake.time)
+    monkeypatch.setattr("camera.timing_functions.monotonic", fake.monotonic)
+    monkeypatch.setattr("camera.timing_functions.sleep", fake.sleep)
+    return fake
+
+
+@pytest.fixture
+def config():
+    config = CameraConfig()
+    config.start = time_class(6, 30)
+    config.end = time_class(18, 30)
+    config.interval = 30
+    return config
+
+
+def test_delay_keeps_sub_second_precision(config):
+    to_wait, target = determine_delay_to_next_capture_time(config, datetime(2023, 10, 1, 7, 29, 59, 250000))
+    assert target == datetime(2023, 10, 1, 7, 30)
+    assert to_wait == 0.75
+
+
+def test_scheduler_wakes_at_capture_time(clock, config):
+    scheduler = CaptureScheduler(config, print_func=lambda *a: None)
+    lateness = scheduler.wait_until(datetime(2023, 10, 1, 7, 30))
+    assert clock.wall == datetime(2023, 10, 1, 7, 30).timestamp()
+    assert lateness == 0
+    assert max(clock.sleeps) <= 60
+    assert scheduler.lateness == [0]
+
+
+def test_scheduler_reports_lateness(clock, config):
+    clock.oversleep = 0.25
+    scheduler = CaptureScheduler(config, print_func=lambda *a: None)
+    lateness = scheduler.wait_until(datetime(2023, 10, 1, 7, 1))
+    assert 0 < lateness <= 0.25
+    assert "Capture slots: 1" in scheduler.summary()
+
+
+def test_scheduler_follows_wall_clock_jump(clock, config, monkeypatch):
+    def jumping_sleep(seconds):
+        clock.sleep(seconds)
+        if len(clock.sleeps) == 1:
+            clock.wall += 600   # the wall clock is corrected 10 minutes forward
+    monkeypatch.setattr("camera.timing_functions.sleep", jumping_sleep)
+    scheduler = CaptureScheduler(config, print_func=lambda *a: None)
+    scheduler.wait_until(datetime(2023, 10, 1, 7, 30))
+    assert clock.wall == pytest.approx(datetime(2023, 10, 1, 7, 30).timestamp())
+    assert clock.mono - 1000.0 == pytest.approx(1799.5 - 600)
+
+
+def test_scheduler_wakes_early(clock, config):
+    checks = []
+
+    def wake():
+        checks.append(clock.wall)
+        return len(checks) == 3
+
+    scheduler = CaptureScheduler(config, print_func=lambda *a: None)
+    assert scheduler.wait_until(datetime(2023, 10, 1, 7, 30), wake=wake) is None
+    assert clock.sleeps == [60, 60, 60]
+    assert scheduler.lateness == []
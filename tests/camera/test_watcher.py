@@ -0,0 +1,118 @@
+import json
+import os
+import pytest
+from camera import config as camera_config
+from camera.camera_locations import CameraLocation, load_camera_locations
+from camera.config import CameraConfig
+from camera.watcher import SettingsWatcher, WatchedFile
+
+
+def touch(path, content):
+    """Write the file with a modification time that differs from the previous one."""
+    mtime = path.stat().st_mtime_ns + 10**9 if path.exists() else None
+    path.write_text(content)
+    if mtime:
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(camera_config, "CONFIG_FILE", tmp_path / "camera.config")
+    config = CameraConfig()
+    locations = tmp_path / "cameras.csv"
+    locations.write_text("url,location\nhttp://cam1,Entrance\n")
+    config.location_file = str(locations)
+    return config, locations
+
+
+def test_watched_file_detects_changes(tmp_path):
+    path = tmp_path / "file.txt"
+    watched = WatchedFile(path)
+    assert not watched.changed()
+    touch(path, "one")
+    assert watched.changed()
+    assert not watched.changed()
+    touch(path, "two")
+    assert watched.changed()
+
+
+def test_watcher_reloads_changed_cameras(settings, monkeypatch):
+    config, locations = settings
+    watcher = SettingsWatcher(config, (CameraLocation("http://cam1", "Entrance"),))
+    assert not watcher.poll()
+
+    touch(locations, "url,location\nhttp://cam1,Entrance\nhttp://cam2,Exit\n")
+    assert watcher.poll()
+    assert [camera.url for camera in watcher.cameras] == ["http://cam1", "http://cam2"]
+
+    monkeypatch.setattr("camera.watcher.load_camera_locations", lambda path: pytest.fail("file is unchanged"))
+    assert not watcher.poll()
+
+
+def test_watcher_rejects_invalid_cameras(settings):
+    config, locations = settings
+    cameras = (CameraLocation("http://cam1", "Entrance"),)
+    watcher = SettingsWatcher(config, cameras)
+    touch(locations, "url,name\nhttp://cam1,Entrance\n")
+    assert not watcher.poll()
+    assert watcher.cameras == cameras
+
+
+def test_watcher_rejects_cameras_with_invalid_schedule(settings, monkeypatch, caplog):
+    config, locations = settings
+    cameras = (CameraLocation("http://cam1", "Entrance"),)
+    watcher = SettingsWatcher(config, cameras)
+    invalid = (CameraLocation("http://cam1", "Entrance"), CameraLocation("http://cam2", "Exit", start="7h30"))
+    monkeypatch.setattr("camera.watcher.load_camera_locations", lambda path: invalid)
+    touch(locations, "changed")
+    assert not watcher.poll()
+    assert watcher.cameras == cameras
+    assert "camera Exit (http://cam2)" in caplog.text
+    touch(locations, "url,location,start,end\nhttp://cam1,Entrance,12:00,08:00\n")
+    monkeypatch.setattr("camera.watcher.load_camera_locations", load_camera_locations)
+    assert not watcher.poll()
+    assert watcher.cameras == cameras
+
+
+def test_watcher_reloads_config(settings):
+    config, locations = settings
+    watcher = SettingsWatcher(config, ())
+    config_file = camera_config.CONFIG_FILE
+    data = json.loads(config_file.read_text())
+    data.update(interval=60, locations_file=str(locations))
+    touch(config_file, json.dumps(data))
+    assert watcher.poll()
+    assert watcher.config.interval == 60
+    assert config.interval == 30    # the configuration in use is not changed
+
+
+def test_watcher_checks_new_cameras_against_new_config(settings, monkeypatch, tmp_path):
+    config, locations = settings
+    monkeypatch.chdir(tmp_path)
+    config.verbose = config.verbose_option = True     # capture --verbose
+    watcher = SettingsWatcher(config, ())
+    (tmp_path / "late.csv").write_text("url,location,start\nhttp://cam3,Late,19:00\n")
+    config_file = camera_config.CONFIG_FILE
+    data = json.loads(config_file.read_text())
+    data.update(end="20:00", locations_file="late.csv", verbose=False)
+    touch(config_file, json.dumps(data))
+    assert watcher.poll()
+    assert [camera.url for camera in watcher.cameras] == ["http://cam3"]    # starts before the new end time
+    assert watcher.config.verbose
+
+
+@pytest.mark.parametrize("change", [
+    pytest.param({"interval": 0}, id="interval"),
+    pytest.param({"start": "19:00"}, id="start after end"),
+    pytest.param({"workers": 1000}, id="out of range"),
+    pytest.param({"dedup_mode": "sometimes"}, id="invalid choice"),
+])
+def test_watcher_rejects_invalid_config(settings, change):
+    config, locations = settings
+    watcher = SettingsWatcher(config, ())
+    config_file = camera_config.CONFIG_FILE
+    data = json.loads(config_file.read_text())
+    data.update(locations_file=str(locations), **change)
+    touch(config_file, json.dumps(data))
+    assert not watcher.poll()
+    assert watcher.config is config